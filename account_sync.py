@@ -0,0 +1,371 @@
+"""
+Bulk account-sync pipeline for large HR feeds.
+
+The full user and/or department set is diffed against the last synced
+snapshot (record id -> content hash, kept in ACCOUNT_SYNC_DB_PATH). Only new
+or changed records are sent, through sync_users/sync_departments, in chunks
+of at most ACCOUNT_SYNC_CHUNK_SIZE records and ACCOUNT_SYNC_CHUNK_BYTES of
+JSON, with ACCOUNT_SYNC_CONCURRENCY chunks in flight. Records missing from
+the feed are removed with delete_sync_user/delete_sync_department, but only
+when they were keyed by a real Dooray ID (DELETE_ID_FIELDS); records keyed by
+an external ID, email or code are never deleted.
+
+Every run is planned up front into numbered steps stored with the run; a step's
+records are committed to the snapshot when that step succeeds. A failed or
+interrupted run (e.g. a restart) can be resumed and only retries the steps
+that did not finish. Order: department upserts, user upserts, user deletes,
+department deletes. Runs of one token are executed one at a time.
+"""
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from bulk import map_bounded, limiter_for
+from config import ACCOUNT_SYNC_DB_PATH, ACCOUNT_SYNC_CHUNK_SIZE, ACCOUNT_SYNC_CHUNK_BYTES, ACCOUNT_SYNC_CONCURRENCY
+from store import open_store
+
+router = APIRouter()
+
+ID_FIELDS = {
+    "user": ("id", "userId", "user_id", "externalId", "emailAddress", "email"),
+    "department": ("id", "departmentId", "department_id", "externalId", "code"),
+}
+# the fields the delete APIs accept; other keys only identify a record in the snapshot
+DELETE_ID_FIELDS = {
+    "user": ("id", "userId", "user_id"),
+    "department": ("id", "departmentId", "department_id"),
+}
+# phase order; steps of one phase run concurrently, phases one after another
+PHASES = (("upsert", "department"), ("upsert", "user"), ("delete", "user"), ("delete", "department"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS synced_records (
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    deletable INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, kind, record_id)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    status TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_steps (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    phase INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, seq)
+);
+"""
+
+
+def record_id(kind, record):
+    for field in ID_FIELDS[kind]:
+        if record.get(field) not in (None, ""):
+            return str(record[field])
+    return None
+
+
+def deletable(kind, record):
+    """Whether the record is keyed by an ID the delete API accepts (not an external ID, email or code)."""
+    for field in ID_FIELDS[kind]:
+        if record.get(field) not in (None, ""):
+            return field in DELETE_ID_FIELDS[kind]
+    return False
+
+
+def record_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def chunk_records(records, max_records=ACCOUNT_SYNC_CHUNK_SIZE, max_bytes=ACCOUNT_SYNC_CHUNK_BYTES):
+    """Splits records into chunks bounded by count and serialized size (a single oversized record gets its own chunk)."""
+    chunks, current, size = [], [], 2
+    for record in records:
+        record_size = len(json.dumps(record, ensure_ascii=False, default=str).encode()) + 1
+        if current and (len(current) >= max_records or size + record_size > max_bytes):
+            chunks.append(current)
+            current, size = [], 2
+        current.append(record)
+        size += record_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AccountSyncStore:
+    """SQLite snapshot and run checkpoints."""
+
+    def __init__(self, path=ACCOUNT_SYNC_DB_PATH):
+        self.conn, self.lock = open_store(path, SCHEMA)
+        with self.lock, self.conn:
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(synced_records)")}
+            if "deletable" not in columns:  # snapshots created before deletes were limited to real IDs
+                self.conn.execute("ALTER TABLE synced_records ADD COLUMN deletable INTEGER NOT NULL DEFAULT 0")
+
+    def hashes(self, scope, kind):
+        """{record id: (content hash, deletable)} of the snapshot."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT record_id, content_hash, deletable FROM synced_records WHERE scope = ? AND kind = ?", (scope, kind),
+            ).fetchall()
+        return {rid: (content_hash, bool(flag)) for rid, content_hash, flag in rows}
+
+    def create_run(self, scope, summary, steps):
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, scope, status, summary, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, scope, "pending", json.dumps(summary), now, now),
+            )
+            self.conn.executemany(
+                "INSERT INTO run_steps (run_id, seq, phase, action, kind, payload, status) VALUES (?, ?, ?, ?, ?, ?, 'pending')",
+                [(run_id, seq, phase, action, kind, json.dumps(payload, ensure_ascii=False)) for seq, (phase, action, kind, payload) in enumerate(steps)],
+            )
+        return run_id
+
+    def run(self, run_id, scope):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, summary, created_at, updated_at FROM runs WHERE run_id = ? AND scope = ?", (run_id, scope),
+            ).fetchone()
+            if row is None:
+                return None
+            counts = self.conn.execute(
+                "SELECT status, count(*) FROM run_steps WHERE run_id = ? GROUP BY status", (run_id,),
+            ).fetchall()
+            errors = self.conn.execute(
+                "SELECT seq, action, kind, error FROM run_steps WHERE run_id = ? AND status = 'failed' ORDER BY seq LIMIT 20", (run_id,),
+            ).fetchall()
+        steps = dict(counts)
+        total = sum(steps.values())
+        return {
+            "run_id": run_id, "status": row[0], "summary": json.loads(row[1]), "created_at": row[2], "updated_at": row[3],
+            "steps": {"total": total, "done": steps.get("done", 0), "failed": steps.get("failed", 0), "pending": steps.get("pending", 0)},
+            "progress": round(steps.get("done", 0) / total, 4) if total else 1.0,
+            "errors": [{"step": seq, "action": action, "kind": kind, "error": error} for seq, action, kind, error in errors],
+        }
+
+    def unfinished_steps(self, run_id):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, phase, action, kind, payload FROM run_steps WHERE run_id = ? AND status != 'done' ORDER BY seq", (run_id,),
+            ).fetchall()
+        return [(seq, phase, action, kind, json.loads(payload)) for seq, phase, action, kind, payload in rows]
+
+    def set_status(self, run_id, status):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id))
+
+    def finish_step(self, run_id, seq, scope, action, kind, payload, error=None):
+        """Marks a step done (committing its records to the snapshot) or failed, in one transaction."""
+        now = time.time()
+        with self.lock, self.conn:
+            if error is not None:
+                self.conn.execute("UPDATE run_steps SET status = 'failed', error = ? WHERE run_id = ? AND seq = ?", (error, run_id, seq))
+                return
+            if action == "upsert":
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO synced_records (scope, kind, record_id, content_hash, synced_at, deletable) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(scope, kind, record_id(kind, record), record_hash(record), now, deletable(kind, record)) for record in payload],
+                )
+            else:
+                self.conn.executemany(
+                    "DELETE FROM synced_records WHERE scope = ? AND kind = ? AND record_id = ?", [(scope, kind, rid) for rid in payload],
+                )
+            self.conn.execute("UPDATE run_steps SET status = 'done', error = NULL WHERE run_id = ? AND seq = ?", (run_id, seq))
+            self.conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+
+class AccountSyncPipeline:
+    def __init__(self, concurrency=ACCOUNT_SYNC_CONCURRENCY):
+        self.concurrency = concurrency
+        self.store = None
+        self.running = {}  # run_id -> task
+        self.scope_locks = {}  # scope -> [asyncio.Lock, runs holding or waiting for it]
+
+    def _store(self):
+        if self.store is None:
+            self.store = AccountSyncStore()
+        return self.store
+
+    def _diff(self, scope, kind, records, delete_missing):
+        known = self._store().hashes(scope, kind)
+        changed, seen = [], set()
+        for record in records:
+            rid = record_id(kind, record)
+            if rid is None:
+                raise ValueError(f"{kind} record without one of {', '.join(ID_FIELDS[kind])}")
+            seen.add(rid)
+            if known.get(rid, (None,))[0] != record_hash(record):
+                changed.append(record)
+        missing = set(known) - seen if delete_missing else set()
+        removed = sorted(rid for rid in missing if known[rid][1])
+        return changed, removed, len(records) - len(changed), len(missing) - len(removed)
+
+    def plan(self, token, users=None, departments=None, delete_missing=True, dry_run=False):
+        """Diffs the feed against the snapshot and stores a run; blocking. Returns (run_id or None, summary)."""
+        scope = token_scope(token)
+        feeds = {"user": users, "department": departments}
+        diffs, summary = {}, {}
+        for kind, records in feeds.items():
+            if records is None:
+                continue
+            changed, removed, unchanged, kept = self._diff(scope, kind, records, delete_missing)
+            diffs[kind] = (changed, removed)
+            summary[kind] = {
+                "received": len(records), "changed": len(changed), "unchanged": unchanged, "removed": len(removed),
+                "not_removable": kept,  # missing from the feed but not keyed by an ID the delete API accepts
+            }
+
+        steps = []
+        for phase, (action, kind) in enumerate(PHASES):
+            if kind not in diffs:
+                continue
+            changed, removed = diffs[kind]
+            if action == "upsert":
+                steps.extend((phase, action, kind, chunk) for chunk in chunk_records(changed))
+            else:
+                steps.extend((phase, action, kind, [rid]) for rid in removed)
+        if not steps or dry_run:
+            return None, summary
+        return self._store().create_run(scope, summary, steps), summary
+
+    async def _execute_step(self, token, step):
+        seq, phase, action, kind, payload = step
+        if action == "upsert":
+            func = dooray_client.sync_users if kind == "user" else dooray_client.sync_departments
+            result = await run_in_threadpool(func, token, payload)
+        else:
+            func = dooray_client.delete_sync_user if kind == "user" else dooray_client.delete_sync_department
+            result = await run_in_threadpool(func, token, payload[0])
+        return dooray_client.unwrap(result)
+
+    async def _run(self, token, run_id):
+        scope = token_scope(token)
+        entry = self.scope_locks.setdefault(scope, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:  # two runs of one scope would diff and delete against the same snapshot
+                await self._run_steps(token, scope, run_id)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.scope_locks[scope]
+            self.running.pop(run_id, None)
+
+    async def _run_steps(self, token, scope, run_id):
+        store = self._store()
+        try:
+            await run_in_threadpool(store.set_status, run_id, "running")
+            steps = await run_in_threadpool(store.unfinished_steps, run_id)
+            failed = 0
+            for phase in sorted({step[1] for step in steps}):
+                batch = [step for step in steps if step[1] == phase]
+                async for index, outcome in map_bounded(
+                    lambda step: self._execute_step(token, step), batch, self.concurrency, limiter_for(token),
+                ):
+                    seq, _, action, kind, payload = batch[index]
+                    error = str(outcome) if isinstance(outcome, Exception) else None
+                    failed += error is not None
+                    await run_in_threadpool(store.finish_step, run_id, seq, scope, action, kind, payload, error)
+                if failed:
+                    break  # later phases depend on this one (users need their departments)
+            await run_in_threadpool(store.set_status, run_id, "failed" if failed else "completed")
+        except Exception as e:
+            print(f"Error in account sync run {run_id}: {e}")
+            await run_in_threadpool(store.set_status, run_id, "failed")
+
+    def start(self, token, run_id):
+        if run_id not in self.running:
+            self.running[run_id] = asyncio.create_task(self._run(token, run_id))
+        return self.running[run_id]
+
+    async def status(self, token, run_id):
+        run = await run_in_threadpool(self._store().run, run_id, token_scope(token))
+        if run and run["status"] in ("pending", "running") and run_id not in self.running:
+            run["status"] = "interrupted"  # the process that ran it stopped; resume to continue
+        return run
+
+
+PIPELINE = AccountSyncPipeline()
+
+
+def _flag(body, name, default=False):
+    return str(body.get(name, default)).lower() in ("1", "true", "yes")
+
+
+async def _respond(api_key, run_id, wait):
+    if wait:
+        await asyncio.shield(PIPELINE.running[run_id])
+    return {"dooray_response": await PIPELINE.status(api_key, run_id)}
+
+
+# --- Bulk Account Synchronization API ---
+@router.post("/mcp/account_sync/bulk")
+async def api_account_sync_bulk(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    users, departments = body.get("users"), body.get("departments")
+    if users is None and departments is None:
+        raise HTTPException(status_code=400, detail="users or departments (list) is required")
+    for name, records in (("users", users), ("departments", departments)):
+        if records is not None and (not isinstance(records, list) or not all(isinstance(r, dict) for r in records)):
+            raise HTTPException(status_code=400, detail=f"{name} must be a list of objects")
+    delete_missing = _flag(body, "delete_missing", True)
+    if delete_missing and (users == [] or departments == []):
+        raise HTTPException(status_code=400, detail="an empty feed with delete_missing would remove every synced record")
+    dry_run = _flag(body, "dry_run")
+    try:
+        run_id, summary = await run_in_threadpool(PIPELINE.plan, api_key, users, departments, delete_missing, dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dry_run:
+        return {"dooray_response": {"dry_run": True, "summary": summary}}
+    if run_id is None:
+        return {"dooray_response": {"run_id": None, "status": "completed", "summary": summary}}
+    PIPELINE.start(api_key, run_id)
+    return await _respond(api_key, run_id, _flag(body, "wait"))
+
+
+@router.post("/mcp/account_sync/bulk/status")
+async def api_account_sync_bulk_status(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    run = await PIPELINE.status(api_key, body.get("run_id"))
+    if run is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    return {"dooray_response": run}
+
+
+@router.post("/mcp/account_sync/bulk/resume")
+async def api_account_sync_bulk_resume(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    run_id = body.get("run_id")
+    run = await PIPELINE.status(api_key, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    if run["status"] == "completed":
+        return {"dooray_response": run}
+    PIPELINE.start(api_key, run_id)
+    return await _respond(api_key, run_id, _flag(body, "wait"))
@@ -0,0 +1,73 @@
+"""
+Bulk admin member operations for onboarding/offboarding waves.
+
+One request carries many rows, each a create, update or leave of an admin
+member, as a JSON array, NDJSON or CSV upload. Rows run with bounded
+concurrency under the token's rate limit (bulk.py) and every row gets its own
+result. A row with a client-supplied `key` that already succeeded is not sent
+again, so a retried upload only performs the rows that had not completed.
+"""
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from bulk import read_rows, run_rows, respond_rows
+from config import BULK_CONCURRENCY
+from routes import notify_success
+
+router = APIRouter()
+
+OPERATIONS = {
+    "create": "create_admin_member",
+    "update": "update_admin_member",
+    "leave": "leave_admin_member",
+}
+# columns that describe the row rather than the member (CSV rows put everything else in member_data)
+ROW_FIELDS = ("op", "key", "member_id", "member_data")
+
+
+def member_arguments(row, default_op=None):
+    """(dooray_client function name, kwargs) for one row; ValueError when the row is incomplete."""
+    op = row.get("op") or default_op
+    if op not in OPERATIONS:
+        raise ValueError("op must be create, update or leave")
+    member_data = row.get("member_data")
+    if member_data is None:
+        member_data = {k: v for k, v in row.items() if k not in ROW_FIELDS} or None
+    kwargs = {}
+    if op in ("update", "leave"):
+        if not row.get("member_id"):
+            raise ValueError(f"member_id is required for {op}")
+        kwargs["member_id"] = str(row["member_id"])
+    if op in ("create", "update"):
+        if not isinstance(member_data, dict) or not member_data:
+            raise ValueError(f"member_data (dict) is required for {op}")
+        kwargs["member_data"] = member_data
+    return OPERATIONS[op], kwargs
+
+
+# --- Admin Bulk API ---
+@router.post("/mcp/admin/members/bulk")
+async def api_admin_members_bulk(request: Request):
+    """
+    Body: {"operations": [{"op": "create|update|leave", "key": "...", "member_id": "...", "member_data": {...}}]},
+    or the same rows as NDJSON / CSV. ?op= sets the operation for rows without one.
+    """
+    api_key = _get_api_key(request)
+    default_op = request.query_params.get("op")
+    if default_op is not None and default_op not in OPERATIONS:
+        raise HTTPException(status_code=400, detail="op must be create, update or leave")
+    try:
+        concurrency = min(BULK_CONCURRENCY, max(1, int(request.query_params.get("concurrency", BULK_CONCURRENCY))))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="concurrency must be an integer")
+    rows = await read_rows(request, "operations")
+
+    async def execute(row):
+        client_name, kwargs = member_arguments(row, default_op)
+        result = dooray_client.unwrap(await run_in_threadpool(getattr(dooray_client, client_name), api_key, **kwargs))
+        notify_success(client_name, api_key, kwargs, result)
+        return result
+
+    return await respond_rows(request, run_rows(api_key, rows, execute, "admin_members", concurrency))
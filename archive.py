@@ -0,0 +1,219 @@
+"""
+Multi-file drive downloads as one ZIP or tar archive.
+
+Files are given by ID, or as every file below a folder (from the drive tree
+index, drive_tree.py). They are fetched ARCHIVE_CONCURRENCY at a time under
+the token's rate limit through the file cache (file_cache.py), and each file
+is appended to the archive stream as soon as it is complete, read in chunks
+from a handle opened on its cached blob, so memory use does not depend on
+file sizes and a blob evicted meanwhile (a folder or a file larger than
+FILE_CACHE_MAX_BYTES) is still archived whole. Fetching pauses while
+ARCHIVE_CONCURRENCY fetched files wait to be written, so a slow client does
+not keep more than about twice that many evicted files open on disk. With
+checksums, a SHA256SUMS entry (the blob names are their SHA-256) closes the
+archive; files that could not be fetched are listed in ERRORS.txt.
+"""
+import os
+import posixpath
+import tarfile
+import zipfile
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from auth import _get_api_key
+from bulk import map_bounded, limiter_for
+from config import ARCHIVE_CONCURRENCY, ARCHIVE_MAX_FILES
+from drive_tree import DRIVE_TREE
+from file_cache import FILE_CACHE
+
+router = APIRouter()
+
+FORMATS = {"zip": "application/zip", "tar": "application/x-tar"}
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """Write-only file object collecting what the archive writer produces until it is drained into the response."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class _TarEntry:
+    def __init__(self, sink, size):
+        self.sink = sink
+        self.size = size
+
+    def write(self, data):
+        self.sink.write(data)
+
+    def close(self):
+        if self.size % tarfile.BLOCKSIZE:
+            self.sink.write(tarfile.NUL * (tarfile.BLOCKSIZE - self.size % tarfile.BLOCKSIZE))
+
+
+class TarWriter:
+    """Streaming tar: header, data and padding per entry; entry sizes must be known up front."""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def open(self, name, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, mtime.timestamp(), 0o644
+        self.sink.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        return _TarEntry(self.sink, size)
+
+    def close(self):
+        self.sink.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+
+
+class ZipWriter:
+    """zipfile on an unseekable stream: sizes and CRCs go into data descriptors after each entry."""
+
+    def __init__(self, sink, compress=False):
+        self.compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self.zip = zipfile.ZipFile(sink, "w", self.compression)
+
+    def open(self, name, size, mtime):
+        info = zipfile.ZipInfo(name, max(mtime, datetime(1980, 1, 1, tzinfo=mtime.tzinfo)).timetuple()[:6])
+        info.compress_type = self.compression
+        info.file_size = size
+        return self.zip.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT)
+
+    def close(self):
+        self.zip.close()
+
+
+def _mtime(value):
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return datetime.now(timezone.utc)
+
+
+def _unique(name, used):
+    """Archive member name not used yet: "a.txt", then "a (2).txt", ..."""
+    name = name.lstrip("/") or "file"
+    candidate, number = name, 1
+    while candidate in used:
+        number += 1
+        root, ext = posixpath.splitext(name)
+        candidate = f"{root} ({number}){ext}"
+    used.add(candidate)
+    return candidate
+
+
+async def archive_stream(token, drive_id, files, archive_format="zip", checksums=False, compress=False, concurrency=ARCHIVE_CONCURRENCY):
+    """
+    Archive bytes for `files` ({"file_id", "name" or None, "updated_at"}), in the order
+    the files finish downloading.
+    """
+    sink = _Sink()
+    writer = ZipWriter(sink, compress) if archive_format == "zip" else TarWriter(sink)
+    used, sums, errors = set(), [], []
+
+    async def fetch(item):
+        return await FILE_CACHE.fetch(token, "drive", {"drive_id": drive_id, "file_id": item["file_id"]})
+
+    def add_text(name, text):
+        data = text.encode()
+        entry = writer.open(_unique(name, used), len(data), datetime.now(timezone.utc))
+        entry.write(data)
+        entry.close()
+
+    results = map_bounded(fetch, files, concurrency, limiter_for(token), buffered=concurrency)
+    try:
+        async for index, outcome in results:
+            item = files[index]
+            if isinstance(outcome, Exception):
+                errors.append(f"{item.get('name') or item['file_id']}: {outcome}")
+                continue
+            meta, handle = outcome
+            with handle:
+                name = _unique(item.get("name") or meta.get("name") or item["file_id"], used)
+                entry = writer.open(name, os.fstat(handle.fileno()).st_size, _mtime(meta.get("updatedAt") or item.get("updated_at")))
+
+                def copy_chunk():
+                    chunk = handle.read(CHUNK_SIZE)
+                    if chunk:
+                        entry.write(chunk)
+                    return len(chunk)
+
+                while await run_in_threadpool(copy_chunk):
+                    yield sink.drain()
+                entry.close()
+            if checksums:
+                sums.append(f"{os.path.basename(handle.name)}  {name}\n")
+            yield sink.drain()
+        if sums:
+            add_text("SHA256SUMS", "".join(sums))
+        if errors:
+            add_text("ERRORS.txt", "\n".join(errors) + "\n")
+        writer.close()
+        yield sink.drain()
+    finally:
+        await results.aclose()
+
+
+# --- Drive Archive API ---
+@router.post("/mcp/drive/files/archive")
+async def api_drive_files_archive(request: Request):
+    """
+    Body: {"drive_id": "...", "file_ids": [...]} or {"drive_id": "...", "folder_id" | "path": "..."},
+    optional "format" (zip | tar), "checksums" and "compress" (zip only).
+    """
+    api_key = _get_api_key(request)
+    body = await request.json()
+    drive_id = body.get("drive_id")
+    file_ids = body.get("file_ids")
+    folder_id, path = body.get("folder_id"), body.get("path")
+    archive_format = body.get("format", "zip")
+    if not drive_id or not (file_ids or folder_id or path is not None):
+        raise HTTPException(status_code=400, detail="drive_id and file_ids, folder_id or path are required")
+    if archive_format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be zip or tar")
+    if file_ids is not None and not isinstance(file_ids, list):
+        raise HTTPException(status_code=400, detail="file_ids must be a list")
+
+    if file_ids:
+        files = [{"file_id": str(file_id), "name": None} for file_id in dict.fromkeys(file_ids)]
+        archive_name = f"drive-{drive_id}"
+    else:
+        try:
+            entries, folder_path = await DRIVE_TREE.files_under(api_key, drive_id, folder_id, path)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        files = [
+            {"file_id": entry["file_id"], "name": entry["path"][len(folder_path) + 1:], "updated_at": entry["updated_at"]}
+            for entry in entries
+        ]
+        archive_name = posixpath.basename(folder_path) or f"drive-{drive_id}"
+    if len(files) > ARCHIVE_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"at most {ARCHIVE_MAX_FILES} files per archive")
+
+    stream = archive_stream(
+        api_key, str(drive_id), files, archive_format, bool(body.get("checksums")), bool(body.get("compress")),
+    )
+    filename = f"{archive_name}.{archive_format}"
+    return StreamingResponse(
+        stream, media_type=FORMATS[archive_format],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename, safe='')}"},
+    )
@@ -0,0 +1,45 @@
+import hashlib
+
+from fastapi import Request, HTTPException
+
+# 세션 기반 토큰 저장을 위한 딕셔너리
+SESSION_TOKENS = {}
+
+
+def token_scope(token):
+    """Key under which per-token state is kept (caches, stores), so raw tokens are not stored."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _get_conversation_id(request: Request):
+    return request.headers.get("claude-conversation-id") or request.headers.get("X-Conversation-ID")
+
+
+def _get_api_key(request: Request):
+    """
+    하이브리드 인증 방식:
+    1. 세션 ID를 사용하여 세션별 토큰을 우선적으로 확인합니다.
+    2. 세션 토큰이 없으면 헤더의 고정 API 키를 사용합니다.
+    """
+    # 1. 세션 기반 인증 시도
+    conversation_id = _get_conversation_id(request)
+    if conversation_id:
+        token = SESSION_TOKENS.get(conversation_id)
+        if not token:
+            raise HTTPException(
+                status_code=401,
+                detail="이 세션에 대한 API 토큰이 설정되지 않았습니다. '/mcp/auth/set_token'을 사용하여 먼저 토큰을 설정해주세요."
+            )
+        return token
+
+    # 2. 고정 API 키 인증으로 대체
+    api_key = request.headers.get("X-API-Key")
+    if not api_key:
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            api_key = auth_header.split(" ")[1]
+
+    if not api_key:
+        raise HTTPException(status_code=401, detail="API Key가 필요합니다. 'X-API-Key' 헤더를 사용하거나 세션 토큰을 설정해주세요.")
+
+    return api_key
@@ -0,0 +1,344 @@
+"""
+Reservation availability search across resources.
+
+Keeps, per token, the resources grouped by category and a sorted interval
+list of reservations per resource, so "which rooms in category X are free
+between A and B" is a bisect per resource instead of a client-side scan of
+every reservation. The index is built on first use, reloaded in the
+background when older than AVAILABILITY_REFRESH_SECONDS (only resources
+whose reservations changed are re-sorted), and updated in place by
+reservation create/update/delete calls made through this server.
+
+`book_first_available` tries the free candidates in order through
+create_resource_reservation, one attempt per resource at a time, and moves
+on to the next candidate when Dooray reports a conflict.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from config import AVAILABILITY_REFRESH_SECONDS, SYNC_TOKEN_TTL
+from freebusy import parse_time, format_time
+from resolver import resolve_request
+from routes import on_success
+from token_cache import TokenCache
+
+router = APIRouter()
+
+CONFLICT_STATUS = (409, 422)
+
+
+def _result_list(response):
+    result = dooray_client.payload(response)
+    return [item for item in result if isinstance(item, dict)] if isinstance(result, list) else []
+
+
+def _nested_id(item, key):
+    value = item.get(key) if isinstance(item.get(key), dict) else None
+    return str(value["id"]) if value and value.get("id") else None
+
+
+def _resource_id(reservation):
+    value = reservation.get("resourceId") or _nested_id(reservation, "resource")
+    return str(value) if value else None
+
+
+def _category_id(resource):
+    value = resource.get("resourceCategoryId") or resource.get("categoryId") or _nested_id(resource, "resourceCategory")
+    return str(value) if value else None
+
+
+class ResourceIntervals:
+    """Reservations of one resource sorted by start, with a running max of ends for overlap queries."""
+
+    def __init__(self, reservations=()):
+        self.entries = sorted(reservations, key=lambda r: (r[0], r[1]))
+        self.starts = [entry[0] for entry in self.entries]
+        self.max_ends = []
+        for entry in self.entries:
+            self.max_ends.append(max(entry[1], self.max_ends[-1]) if self.max_ends else entry[1])
+
+    def overlapping(self, start, end):
+        """(start, end, reservation) entries with entry.start < end and entry.end > start."""
+        found = []
+        position = bisect.bisect_left(self.starts, end) - 1
+        while position >= 0 and self.max_ends[position] > start:
+            if self.entries[position][1] > start:
+                found.append(self.entries[position])
+            position -= 1
+        return found[::-1]
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self.resources = {}      # id -> resource payload
+        self.categories = {}     # id -> category payload
+        self.by_category = {}    # category id -> [resource ids]
+        self.reservations = {}   # reservation id -> (resource id, start, end, payload)
+        self.hashes = {}         # resource id -> hash of its reservation set
+        self.intervals = {}      # resource id -> ResourceIntervals
+        self.built_at = 0.0
+        self.stats = {}
+
+    @staticmethod
+    def _entry(reservation):
+        resource_id = _resource_id(reservation)
+        if not resource_id or not reservation.get("startedAt") or not reservation.get("endedAt"):
+            return None
+        return resource_id, parse_time(reservation["startedAt"]), parse_time(reservation["endedAt"]), reservation
+
+    def rebuild(self, resources, categories, reservations, previous=None):
+        """Fills this index; interval lists are only re-sorted for resources whose reservations changed since `previous`."""
+        started = time.perf_counter()
+        self.resources = {str(r["id"]): r for r in _result_list(resources) if r.get("id")}
+        self.categories = {str(c["id"]): c for c in _result_list(categories) if c.get("id")}
+        by_category = {}
+        for resource_id, resource in self.resources.items():
+            by_category.setdefault(_category_id(resource), []).append(resource_id)
+        self.by_category = by_category
+
+        entries, grouped = {}, {}
+        for reservation in _result_list(reservations):
+            try:
+                entry = self._entry(reservation)
+            except ValueError:
+                continue
+            if entry and reservation.get("id"):
+                entries[str(reservation["id"])] = entry
+                grouped.setdefault(entry[0], []).append((entry[1], entry[2], reservation))
+        changed = 0
+        hashes, intervals = {}, {}
+        for resource_id, items in grouped.items():
+            digest = hashlib.sha1(json.dumps(sorted(
+                (format_time(s), format_time(e), r.get("id"), r.get("subject")) for s, e, r in items
+            ), default=str).encode()).hexdigest()
+            if previous is not None and previous.hashes.get(resource_id) == digest:
+                intervals[resource_id] = previous.intervals[resource_id]
+            else:
+                intervals[resource_id] = ResourceIntervals(items)
+                changed += 1
+            hashes[resource_id] = digest
+        self.reservations, self.hashes, self.intervals = entries, hashes, intervals
+        self.built_at = time.time()
+        self.stats = {
+            "resources": len(self.resources), "reservations": len(entries), "changed_resources": changed,
+            "build_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return self.stats
+
+    def _reindex(self, resource_id):
+        items = [(s, e, r) for rid, s, e, r in self.reservations.values() if rid == resource_id]
+        self.intervals[resource_id] = ResourceIntervals(items)
+        self.hashes.pop(resource_id, None)  # recomputed by the next rebuild
+
+    def apply(self, reservation_id, reservation=None):
+        """Inserts/replaces (or with reservation=None removes) one reservation in place."""
+        reservation_id = str(reservation_id)
+        touched = set()
+        old = self.reservations.pop(reservation_id, None)
+        if old:
+            touched.add(old[0])
+        if reservation is not None:
+            entry = self._entry(dict(reservation, id=reservation_id))
+            if entry:
+                self.reservations[reservation_id] = entry
+                touched.add(entry[0])
+        for resource_id in touched:
+            self._reindex(resource_id)
+
+    def candidates(self, category=None, resource_ids=None):
+        if resource_ids:
+            return [str(r) for r in resource_ids if str(r) in self.resources]
+        if category is None:
+            return sorted(self.resources)
+        category = str(category)
+        if category in self.by_category:
+            return list(self.by_category[category])
+        wanted = category.casefold()
+        matched = [cid for cid, c in self.categories.items() if str(c.get("name", "")).casefold().startswith(wanted)]
+        return [rid for cid in matched for rid in self.by_category.get(cid, ())]
+
+    def search(self, start, end, category=None, resource_ids=None):
+        available, busy = [], []
+        for resource_id in self.candidates(category, resource_ids):
+            resource = self.resources[resource_id]
+            summary = {"id": resource_id, "name": resource.get("name"), "categoryId": _category_id(resource)}
+            intervals = self.intervals.get(resource_id)
+            conflicts = intervals.overlapping(start, end) if intervals else []
+            if conflicts:
+                summary["conflicts"] = [
+                    {"id": r.get("id"), "subject": r.get("subject"), "start": format_time(s), "end": format_time(e)}
+                    for s, e, r in conflicts
+                ]
+                busy.append(summary)
+            else:
+                available.append(summary)
+        return available, busy
+
+
+class AvailabilityService:
+    """Per-token availability indexes with single-flight background refresh and per-resource booking locks."""
+
+    def __init__(self, refresh_seconds=AVAILABILITY_REFRESH_SECONDS, token_ttl=SYNC_TOKEN_TTL):
+        self.cache = TokenCache(self._build, refresh_seconds, idle_ttl=token_ttl, name="availability index")
+        self.booking_locks = {}  # (scope, resource id) -> [asyncio.Lock, bookings holding or waiting for it]
+
+    @staticmethod
+    async def _build(token, previous=None):
+        resources, categories, reservations = await asyncio.gather(
+            run_in_threadpool(dooray_client.get_resources, token),
+            run_in_threadpool(dooray_client.get_resource_categories, token),
+            run_in_threadpool(dooray_client.get_resource_reservations, token),
+        )
+        index = AvailabilityIndex()
+        await run_in_threadpool(index.rebuild, resources, categories, reservations, previous)
+        return index
+
+    async def get(self, token, force_refresh=False):
+        return await self.cache.get(token, force_refresh=force_refresh)
+
+    def peek(self, token):
+        """The token's current index, or None; never builds one."""
+        return self.cache.peek(token)
+
+    def apply(self, token, reservation_id, reservation=None):
+        index = self.peek(token)
+        if index is not None and reservation_id:
+            index.apply(reservation_id, reservation)
+
+    @asynccontextmanager
+    async def booking_lock(self, token, resource_id):
+        """Holds the resource's booking lock; the lock is dropped once no booking holds or waits for it."""
+        key = (token_scope(token), resource_id)
+        entry = self.booking_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.booking_locks[key]
+
+
+AVAILABILITY = AvailabilityService()
+
+
+def _reservation_from_call(kwargs, previous=None):
+    reservation = dict(previous or {})
+    for arg, key in (("resource_id", "resourceId"), ("subject", "subject"), ("started_at", "startedAt"), ("ended_at", "endedAt")):
+        if kwargs.get(arg):
+            reservation[key] = kwargs[arg]
+    return reservation
+
+
+@on_success("create_resource_reservation")
+def _on_reservation_created(api_key, kwargs, result):
+    created = result.get("result") if isinstance(result, dict) else None
+    if isinstance(created, dict) and created.get("id"):
+        AVAILABILITY.apply(api_key, created["id"], _reservation_from_call(kwargs))
+
+
+@on_success("update_resource_reservation")
+def _on_reservation_updated(api_key, kwargs, result):
+    index = AVAILABILITY.peek(api_key)
+    reservation_id = str(kwargs.get("resource_reservation_id"))
+    if index is not None:
+        old = index.reservations.get(reservation_id)
+        AVAILABILITY.apply(api_key, reservation_id, _reservation_from_call(kwargs, old[3] if old else None))
+
+
+@on_success("delete_resource_reservation")
+def _on_reservation_deleted(api_key, kwargs, result):
+    AVAILABILITY.apply(api_key, kwargs.get("resource_reservation_id"))
+
+
+async def find_available(token, started_at, ended_at, category=None, resource_ids=None, refresh=False):
+    start, end = parse_time(started_at), parse_time(ended_at)
+    if end <= start:
+        raise ValueError("ended_at must be after started_at")
+    index = await AVAILABILITY.get(token, force_refresh=refresh)
+    available, busy = index.search(start, end, category, resource_ids)
+    return {
+        "window": {"start": format_time(start), "end": format_time(end)},
+        "available": available, "busy": busy,
+        "index": dict(index.stats, built_at=index.built_at),
+    }
+
+
+def _is_conflict(result):
+    return result.get("status_code") in CONFLICT_STATUS
+
+
+async def book_first_available(token, started_at, ended_at, subject, users=None, category=None, resource_ids=None):
+    """Reserves the first candidate that is free locally and accepted by Dooray; returns the outcome and every attempt."""
+    found = await find_available(token, started_at, ended_at, category, resource_ids)
+    start, end = parse_time(started_at), parse_time(ended_at)
+    attempts = []
+    for candidate in found["available"]:
+        resource_id = candidate["id"]
+        async with AVAILABILITY.booking_lock(token, resource_id):
+            index = AVAILABILITY.peek(token)  # the index may have been rebuilt or dropped while we waited
+            intervals = index.intervals.get(resource_id) if index is not None else None
+            if intervals and intervals.overlapping(start, end):  # taken while we waited for the lock
+                attempts.append({"resourceId": resource_id, "outcome": "taken"})
+                continue
+            kwargs = {"resource_id": resource_id, "subject": subject, "started_at": started_at, "ended_at": ended_at, "users": users}
+            result = await run_in_threadpool(dooray_client.create_resource_reservation, token, **kwargs)
+            if isinstance(result, dict) and "error" in result:
+                if _is_conflict(result):
+                    attempts.append({"resourceId": resource_id, "outcome": "conflict"})
+                    continue
+                raise dooray_client.DoorayError(result)
+            _on_reservation_created(token, kwargs, result)
+            attempts.append({"resourceId": resource_id, "outcome": "reserved"})
+            return {"reserved": True, "resource": candidate, "reservation": result, "attempts": attempts}
+    return {"reserved": False, "attempts": attempts, "busy": found["busy"]}
+
+
+def _window_arguments(body):
+    if not body.get("started_at") or not body.get("ended_at"):
+        raise HTTPException(status_code=400, detail="started_at and ended_at are required")
+    resource_ids = body.get("resource_ids")
+    if resource_ids is not None and not isinstance(resource_ids, list):
+        raise HTTPException(status_code=400, detail="resource_ids must be a list")
+    return body["started_at"], body["ended_at"], body.get("category"), resource_ids
+
+
+# --- Reservation Availability API ---
+@router.post("/mcp/reservation/availability")
+async def api_reservation_availability(request: Request):
+    api_key = _get_api_key(request)
+    body = await resolve_request(api_key, await request.json())
+    started_at, ended_at, category, resource_ids = _window_arguments(body)
+    try:
+        result = await find_available(api_key, started_at, ended_at, category, resource_ids, bool(body.get("refresh")))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": result}
+
+
+@router.post("/mcp/reservation/book")
+async def api_reservation_book(request: Request):
+    api_key = _get_api_key(request)
+    body = await resolve_request(api_key, await request.json(), exact=True)
+    started_at, ended_at, category, resource_ids = _window_arguments(body)
+    if not body.get("subject"):
+        raise HTTPException(status_code=400, detail="subject is required")
+    try:
+        result = await book_first_available(api_key, started_at, ended_at, body["subject"], body.get("users"), category, resource_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": result}
@@ -0,0 +1,134 @@
+"""
+Local stand-in for DOORAY_BASE_URL used by the benchmark and replay tools.
+
+Answers every endpoint with a Dooray-shaped envelope after a configurable
+latency, fails a configurable share of requests with HTTP 500 and lets the
+list/raw payload sizes be tuned. Only the standard library is used so the
+fake adds no dependencies.
+
+    python bench/fake_dooray.py --port 9000 --latency-ms 80 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeDoorayConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, payload_items=20, item_bytes=256, raw_bytes=64 * 1024, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.payload_items = payload_items
+        self.item_bytes = item_bytes
+        self.raw_bytes = raw_bytes
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _envelope(result, total_count=None, success=True, message=""):
+    body = {
+        "header": {"resultCode": 0 if success else -1, "resultMessage": message, "isSuccessful": success},
+        "result": result,
+    }
+    if total_count is not None:
+        body["totalCount"] = total_count
+    return body
+
+
+def _item(path, index, item_bytes):
+    return {
+        "id": f"{abs(hash(path)) % 10 ** 8}{index:04d}",
+        "name": f"item-{index}",
+        "subject": f"item-{index}",
+        "updatedAt": "2026-01-01T00:00:00+09:00",
+        "description": "x" * item_bytes,
+    }
+
+
+class FakeDoorayHandler(BaseHTTPRequestHandler):
+    config: FakeDoorayConfig = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            delay = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            failed = config.random.random() < config.error_rate
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(delay)
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if failed:
+            status, content_type = 500, "application/json"
+            payload = json.dumps(_envelope(None, success=False, message="fake upstream error")).encode()
+        elif params.get("media") == ["raw"]:
+            status, content_type = 200, "application/octet-stream"
+            payload = b"\0" * config.raw_bytes
+        else:
+            status, content_type = 200, "application/json"
+            if self.command == "GET" and not url.path.rstrip("/").split("/")[-1].isdigit():
+                items = [_item(url.path, i, config.item_bytes) for i in range(config.payload_items)]
+                payload = json.dumps(_envelope(items, total_count=len(items))).encode()
+            else:
+                payload = json.dumps(_envelope(_item(url.path, 0, config.item_bytes))).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+
+def start_fake_dooray(host="127.0.0.1", port=0, **options):
+    """Starts the fake in a daemon thread. Returns (server, base_url); call server.shutdown() to stop."""
+    handler = type("ConfiguredFakeDoorayHandler", (FakeDoorayHandler,), {"config": FakeDoorayConfig(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_fake_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mean upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="uniform +/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls answered with HTTP 500")
+    parser.add_argument("--payload-items", type=int, default=20, help="items per list response")
+    parser.add_argument("--item-bytes", type=int, default=256, help="padding per list item")
+    parser.add_argument("--raw-bytes", type=int, default=64 * 1024, help="size of media=raw downloads")
+    parser.add_argument("--seed", type=int, help="random seed for latency/error sampling")
+
+
+def fake_options(args):
+    return {
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+        "payload_items": args.payload_items, "item_bytes": args.item_bytes, "raw_bytes": args.raw_bytes, "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Dooray API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start_fake_dooray(args.host, args.port, **fake_options(args))
+    print(f"Fake Dooray listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,168 @@
+"""
+Shared pieces of the benchmark and replay tools: starting the app against a
+fake upstream, driving requests at a fixed concurrency and summarising
+latencies.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "bench-token"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, errors, duration_s):
+    values = sorted(latencies_ms)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / duration_s, 2) if duration_s else None,
+        "p50_ms": _round(percentile(values, 50)),
+        "p95_ms": _round(percentile(values, 95)),
+        "p99_ms": _round(percentile(values, 99)),
+        "max_ms": _round(values[-1] if values else None),
+        "mean_ms": _round(sum(values) / count if count else None),
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def process_memory_kb(pid):
+    """Current and peak RSS of `pid` in KiB (Linux /proc only, otherwise Nones)."""
+    memory = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """Runs `uvicorn main:app` in a subprocess pointed at `upstream_url`."""
+
+    def __init__(self, upstream_url, port=None, env=None, cwd=ROOT_DIR):
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(os.environ, DOORAY_BASE_URL=upstream_url, DOORAY_API_TOKEN=BENCH_TOKEN, **(env or {}))
+        self.cwd = cwd
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.cwd, env=self.env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"app exited with code {self.process.returncode}")
+            try:
+                requests.get(f"{self.url}/health", timeout=1)
+                return self
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError("app did not become healthy within 30s")
+
+    def memory(self):
+        return process_memory_kb(self.process.pid)
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def run_load(base_url, requests_to_send, concurrency, headers=None, on_sent=None, offsets=None):
+    """
+    Sends (label, method, path, json_body[, headers]) tuples from `requests_to_send`
+    with `concurrency` workers. With `offsets` (seconds from start, one per request)
+    each request is submitted at its offset instead of as fast as possible.
+    Returns ({label: [latency_ms]}, {label: errors}, duration_s).
+    """
+    local = threading.local()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    headers = dict({"X-API-Key": BENCH_TOKEN}, **(headers or {}))
+
+    def send(item):
+        label, method, path, body = item[:4]
+        item_headers = dict(headers, **(item[4] if len(item) > 4 and item[4] else {}))
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = local.session.request(method, base_url + path, json=body, headers=item_headers, timeout=60)
+            ok = response.status_code < 400 and not _is_jsonrpc_error(response)
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies[label].append(elapsed_ms)
+            if not ok:
+                errors[label] += 1
+        if on_sent:
+            on_sent(label, elapsed_ms, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if offsets is None:
+            list(pool.map(send, requests_to_send))
+        else:
+            futures = []
+            for item, offset in zip(requests_to_send, offsets):
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(send, item))
+            for future in futures:
+                future.result()
+    return latencies, errors, time.perf_counter() - started
+
+
+def _is_jsonrpc_error(response):
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get("jsonrpc") == "2.0" and "error" in body
+
+
+def write_results(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,217 @@
+"""
+Replays recorded JSONL request logs against the app and compares builds.
+
+Each log line is a JSON object describing one inbound call:
+
+    {"ts": "2026-10-01T09:00:00.120+09:00", "method": "POST", "path": "/mcp/project/posts/list",
+     "headers": {...}, "body": {"project_id": "1000"}}
+
+`route` is accepted in place of `path` and `timestamp` in place of `ts`
+(ISO 8601 or epoch seconds). A recorded `query` (string or object) is appended
+to the path. Lines with `"kind": "upstream"` (written by capture.py) and lines
+without a path are skipped. Recorded credentials and MCP sessions are never
+replayed; every call uses the bench token against the fake upstream (MCP
+calls without a session fall back to the app's DOORAY_API_TOKEN, the bench
+token).
+
+    python bench/replay.py run traffic.jsonl --timing recorded --speed 2 --output build_a.json
+    python bench/replay.py run traffic.jsonl --app-dir ../other-checkout --output build_b.json
+    python bench/replay.py diff build_a.json build_b.json
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_dooray import start_fake_dooray, add_fake_arguments, fake_options
+from harness import ROOT_DIR, AppServer, run_load, summarize, write_results
+
+# Recorded auth/session headers are replaced by the bench token. A recorded MCP
+# session does not exist in the replayed app (it would answer 404 "Session not found").
+DROPPED_HEADERS = {
+    "authorization", "x-api-key", "claude-conversation-id", "x-conversation-id", "cookie", "host", "content-length",
+    "mcp-session-id", "last-event-id",
+}
+REDACTED = "[REDACTED]"  # capture.py's placeholder; such query parameters are dropped, not replayed
+
+
+def _parse_ts(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def route_label(path, body):
+    if path.rstrip("/") == "/mcp" and isinstance(body, dict):
+        method = body.get("method")
+        if method == "tools/call":
+            return f"mcp:{(body.get('params') or {}).get('name')}"
+        return f"mcp:{method}"
+    return path
+
+
+def with_query(path, query):
+    """`path` with the recorded query (a string or an object) appended, redacted parameters left out."""
+    if not query:
+        return path
+    pairs = parse_qsl(query, keep_blank_values=True) if isinstance(query, str) else [
+        (k, json.dumps(v) if isinstance(v, (dict, list, bool)) else v) for k, v in query.items()
+    ]
+    query = urlencode([(k, v) for k, v in pairs if v != REDACTED])
+    return f"{path}{'&' if '?' in path else '?'}{query}" if query else path
+
+
+def load_log(paths):
+    """Returns (records, skipped) where records are (ts, label, method, path, body, headers) sorted by ts."""
+    records, skipped = [], 0
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                request_path = entry.get("path") or entry.get("route") if isinstance(entry, dict) else None
+                if not request_path or entry.get("kind") == "upstream" or not str(request_path).startswith("/"):
+                    skipped += 1
+                    continue
+                body = entry.get("body")
+                headers = {k: v for k, v in (entry.get("headers") or {}).items() if k.lower() not in DROPPED_HEADERS}
+                records.append((
+                    _parse_ts(entry.get("ts", entry.get("timestamp"))),
+                    route_label(request_path, body),
+                    (entry.get("method") or "POST").upper(),
+                    with_query(request_path, entry.get("query")),
+                    body,
+                    headers,
+                ))
+    if all(record[0] is not None for record in records):
+        records.sort(key=lambda record: record[0])
+    return records, skipped
+
+
+def run(args):
+    records, skipped = load_log(args.logs)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        sys.exit("no replayable requests found")
+
+    offsets = None
+    if args.timing == "recorded":
+        if any(record[0] is None for record in records):
+            sys.exit("--timing recorded needs a timestamp on every request")
+        first = records[0][0]
+        offsets = [(record[0] - first) / args.speed for record in records]
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "logs": args.logs,
+        "config": {"timing": args.timing, "speed": args.speed, "concurrency": args.concurrency,
+                   "upstream": None if args.target else fake_options(args)},
+        "skipped": skipped,
+    }
+
+    fake = app = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            fake, upstream_url = start_fake_dooray(**fake_options(args))
+            app = AppServer(upstream_url, cwd=os.path.abspath(args.app_dir)).__enter__()
+            base_url = app.url
+
+        latencies, errors, duration = run_load(
+            base_url, [record[1:] for record in records], args.concurrency, offsets=offsets,
+        )
+        if app:
+            results["memory_end"] = app.memory()
+    finally:
+        if app:
+            app.__exit__()
+        if fake:
+            fake.shutdown()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    results["overall"] = summarize(all_latencies, sum(errors.values()), duration)
+    results["routes"] = {label: summarize(values, errors[label], duration) for label, values in sorted(latencies.items())}
+    write_results(args.output, results)
+
+    overall = results["overall"]
+    print(f"replayed {overall['requests']} requests ({skipped} skipped) in {duration:.1f}s: "
+          f"p50={overall['p50_ms']}ms p95={overall['p95_ms']}ms p99={overall['p99_ms']}ms errors={overall['errors']}")
+    print(f"results written to {args.output}")
+
+
+def _delta(before, after):
+    if before is None or after is None:
+        return "      n/a"
+    if not before:
+        return f"{after - before:+8.1f}ms"
+    return f"{(after - before) / before:+9.1%}"
+
+
+def _load_routes(path):
+    """Per-route summaries from a replay result or a run_bench.py result."""
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)
+    if "scenarios" in results:
+        routes = {}
+        for name, scenario in results["scenarios"].items():
+            routes.update(scenario.get("routes", {}))
+            routes[f"__{name}__"] = scenario.get("overall")
+        return routes
+    return dict(results.get("routes", {}), __overall__=results.get("overall"))
+
+
+def diff(args):
+    routes = _load_routes(args.baseline)
+    other = _load_routes(args.candidate)
+    print(f"{'route':<44}{'p50':>20}{'p95':>20}{'p99':>20}{'errors':>10}")
+    for label in sorted(set(routes) | set(other), key=lambda name: (name.startswith("__"), name)):
+        a, b = routes.get(label) or {}, other.get(label) or {}
+        columns = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            columns.append(f"{b.get(key, 'n/a')!s:>9} {_delta(a.get(key), b.get(key))}")
+        print(f"{label:<44}{columns[0]:>20}{columns[1]:>20}{columns[2]:>20}{b.get('errors', 0) - a.get('errors', 0):>+10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded request logs against the Dooray MCP server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay logs and write per-route latency results")
+    run_parser.add_argument("logs", nargs="+", help="JSONL request logs (.jsonl or .jsonl.gz)")
+    run_parser.add_argument("--timing", choices=["recorded", "fast"], default="fast")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="time compression for --timing recorded")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    run_parser.add_argument("--target", help="replay against an already running server")
+    run_parser.add_argument("--app-dir", default=ROOT_DIR, help="checkout to start the app from (to compare builds)")
+    run_parser.add_argument("--output", default="bench_results_replay.json")
+    add_fake_arguments(run_parser)
+    run_parser.set_defaults(handler=run)
+
+    diff_parser = commands.add_parser("diff", help="compare two replay/benchmark route results")
+    diff_parser.add_argument("baseline")
+    diff_parser.add_argument("candidate")
+    diff_parser.set_defaults(handler=diff)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
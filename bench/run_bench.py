@@ -0,0 +1,121 @@
+"""
+Throughput benchmark for the REST routes and the /mcp JSON-RPC endpoint.
+
+Starts the fake Dooray upstream and the app (unless --target is given),
+sends --requests calls per scenario at --concurrency and writes p50/p95/p99
+latency, RPS and server memory to a JSON file for comparing runs.
+
+    python bench/run_bench.py --concurrency 32 --requests 2000 --latency-ms 80 --output bench_results.json
+"""
+import argparse
+import itertools
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_dooray import start_fake_dooray, add_fake_arguments, fake_options
+from harness import ROOT_DIR, AppServer, run_load, summarize, write_results
+
+
+def _tool_call(name, arguments):
+    return {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+
+
+SCENARIOS = {
+    "rest": [
+        ("rest:project/list", "POST", "/mcp/project/list", None),
+        ("rest:project/posts/list", "POST", "/mcp/project/posts/list", {"project_id": "1000"}),
+        ("rest:project/posts/get", "POST", "/mcp/project/posts/get", {"project_id": "1000", "post_id": "2000"}),
+        ("rest:drive/files/list", "POST", "/mcp/drive/files/list", {"drive_id": "3000"}),
+        ("rest:calendar/events/list", "POST", "/mcp/calendar/events/list", {"calendar_id": "*"}),
+    ],
+    "mcp": [
+        ("mcp:tools/list", "POST", "/mcp", {"jsonrpc": "2.0", "id": 1, "method": "tools/list"}),
+        ("mcp:dooray_getProjects", "POST", "/mcp", _tool_call("dooray_getProjects", {"limit": 20})),
+        ("mcp:dooray_getMembers", "POST", "/mcp", _tool_call("dooray_getMembers", {"projectId": "1000"})),
+        ("mcp:dooray_getDriveFiles", "POST", "/mcp", _tool_call("dooray_getDriveFiles", {"driveId": "3000"})),
+    ],
+    "download": [
+        ("rest:drive/files/download", "POST", "/mcp/drive/files/download", {"drive_id": "3000", "file_id": "4000"}),
+    ],
+}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(base_url, name, total, concurrency):
+    mix = SCENARIOS[name]
+    latencies, errors, duration = run_load(base_url, itertools.islice(itertools.cycle(mix), total), concurrency)
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "overall": summarize(all_latencies, sum(errors.values()), duration),
+        "routes": {label: summarize(values, errors[label], duration) for label, values in sorted(latencies.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dooray MCP server against a fake upstream")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (repeatable, default: rest and mcp)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--target", help="benchmark an already running server (its upstream is then up to you)")
+    parser.add_argument("--output", default="bench_results.json")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    scenarios = args.scenario or ["rest", "mcp"]
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "scenarios": scenarios, "concurrency": args.concurrency, "requests": args.requests,
+            "upstream": None if args.target else fake_options(args),
+        },
+        "scenarios": {},
+    }
+
+    fake = app = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            fake, upstream_url = start_fake_dooray(**fake_options(args))
+            app = AppServer(upstream_url).__enter__()
+            base_url = app.url
+            results["memory_start"] = app.memory()
+
+        for name in scenarios:
+            if args.warmup:
+                run_scenario(base_url, name, args.warmup, args.concurrency)
+            results["scenarios"][name] = run_scenario(base_url, name, args.requests, args.concurrency)
+            overall = results["scenarios"][name]["overall"]
+            print(f"{name:<10} rps={overall['rps']:<8} p50={overall['p50_ms']}ms p95={overall['p95_ms']}ms "
+                  f"p99={overall['p99_ms']}ms errors={overall['errors']}")
+
+        if app:
+            results["memory_end"] = app.memory()
+            results["upstream_requests"] = fake.RequestHandlerClass.config.requests
+    finally:
+        if app:
+            app.__exit__()
+        if fake:
+            fake.shutdown()
+
+    write_results(args.output, results)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
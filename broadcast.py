@@ -0,0 +1,369 @@
+"""
+Messenger broadcast: one message to many members without the caller waiting.
+
+A broadcast names its recipients by member ID (or email) and/or by
+department (ID or name, sub-departments included), expanded through the
+directory index (directory.py). Deliveries wait in one queue per token and a
+background worker pool takes them from the tokens in turn, only from a token
+whose rate limit (bulk.py) allows a message right now, so one large broadcast
+does not hold up the others. Throttled (429), server (5xx) and network
+failures are retried with exponential backoff. The endpoint answers with a
+job ID at once; delivery progress is read from the status endpoint.
+
+Jobs and the outcome of every recipient are kept in SQLite
+(BROADCAST_DB_PATH), so their status survives a restart. A job left
+unfinished by a previous process resumes its pending recipients as soon as
+its token is seen again (tokens themselves are not stored).
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from bulk import limiter_for
+from config import BROADCAST_WORKERS, BROADCAST_MAX_ATTEMPTS, BROADCAST_RETRY_DELAY, BROADCAST_JOB_TTL, BROADCAST_DB_PATH
+from directory import DIRECTORY
+from store import open_store
+
+router = APIRouter()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    job_id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    message TEXT NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS broadcasts_unfinished ON broadcasts (scope, finished_at);
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    job_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status_code INTEGER,
+    error TEXT,
+    PRIMARY KEY (job_id, recipient)
+);
+"""
+
+
+def _retryable(response):
+    """Throttling, server errors and network errors (no status code) are worth another attempt."""
+    status = response.get("status_code")
+    return status is None or status == 429 or status >= 500
+
+
+class BroadcastStore:
+    """SQLite copy of every broadcast and the state (pending, sent, failed) of each recipient."""
+
+    def __init__(self, path=BROADCAST_DB_PATH, ttl=BROADCAST_JOB_TTL):
+        self.conn, self.lock = open_store(path, SCHEMA)
+        with self.lock, self.conn:
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT job_id FROM broadcasts WHERE finished_at < ?", (time.time() - ttl,),
+            )]
+            for job_id in expired:
+                self.conn.execute("DELETE FROM broadcast_recipients WHERE job_id = ?", (job_id,))
+                self.conn.execute("DELETE FROM broadcasts WHERE job_id = ?", (job_id,))
+
+    def create(self, job):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO broadcasts (job_id, scope, message, retries, created_at, finished_at) VALUES (?, ?, ?, 0, ?, ?)",
+                (job.id, job.scope, job.message, job.created_at, job.finished_at),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO broadcast_recipients (job_id, recipient, state) VALUES (?, ?, 'pending')",
+                [(job.id, recipient) for recipient in job.recipients],
+            )
+
+    def record(self, job, recipient, state, attempts, status_code=None, error=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE broadcast_recipients SET state = ?, attempts = ?, status_code = ?, error = ? WHERE job_id = ? AND recipient = ?",
+                (state, attempts, status_code, error, job.id, recipient),
+            )
+            self.conn.execute(
+                "UPDATE broadcasts SET retries = ?, finished_at = ? WHERE job_id = ?", (job.retries, job.finished_at, job.id),
+            )
+
+    def load(self, scope, job_id=None):
+        """(job_id, message, retries, created_at, finished_at, recipient rows) of one job, or of every unfinished job."""
+        with self.lock:
+            if job_id is None:
+                jobs = self.conn.execute(
+                    "SELECT job_id, message, retries, created_at, finished_at FROM broadcasts"
+                    " WHERE scope = ? AND finished_at IS NULL ORDER BY created_at", (scope,),
+                ).fetchall()
+            else:
+                jobs = self.conn.execute(
+                    "SELECT job_id, message, retries, created_at, finished_at FROM broadcasts WHERE scope = ? AND job_id = ?",
+                    (scope, job_id),
+                ).fetchall()
+            return [job + (self.conn.execute(
+                "SELECT recipient, state, attempts, status_code, error FROM broadcast_recipients WHERE job_id = ? ORDER BY rowid",
+                (job[0],),
+            ).fetchall(),) for job in jobs]
+
+
+class BroadcastJob:
+    def __init__(self, token, message, recipients, job_id=None, created_at=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.token = token
+        self.scope = token_scope(token)
+        self.message = message
+        self.recipients = recipients
+        self.sent = 0
+        self.failures = []
+        self.retries = 0
+        self.created_at = created_at or time.time()
+        self.finished_at = None
+
+    @classmethod
+    def restore(cls, token, row):
+        """The job of a BroadcastStore.load row, and its recipients still to deliver."""
+        job_id, message, retries, created_at, finished_at, recipients = row
+        job = cls(token, message, [r[0] for r in recipients], job_id, created_at)
+        job.retries, job.finished_at = retries, finished_at
+        pending = []
+        for recipient, state, attempts, status_code, error in recipients:
+            if state == "sent":
+                job.sent += 1
+            elif state == "failed":
+                job.failures.append({"recipient_id": recipient, "attempts": attempts, "status_code": status_code, "error": error})
+            else:
+                pending.append(recipient)
+        return job, pending
+
+    @property
+    def pending(self):
+        return len(self.recipients) - self.sent - len(self.failures)
+
+    def status(self):
+        return {
+            "job_id": self.id,
+            "state": "done" if self.finished_at else "running" if self.sent or self.failures or self.retries else "queued",
+            "total": len(self.recipients),
+            "sent": self.sent,
+            "failed": len(self.failures),
+            "pending": self.pending,
+            "retries": self.retries,
+            "failures": self.failures,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class BroadcastService:
+    """Jobs by ID, the per-token delivery queues and the worker pool that drains them in turn."""
+
+    def __init__(self, workers=BROADCAST_WORKERS, max_attempts=BROADCAST_MAX_ATTEMPTS,
+                 retry_delay=BROADCAST_RETRY_DELAY, job_ttl=BROADCAST_JOB_TTL):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.job_ttl = job_ttl
+        self.store = None
+        self.jobs = {}
+        self.queues = {}      # scope -> deque of (job, recipient, attempt)
+        self.turns = deque()  # scopes with queued deliveries, in round-robin order
+        self.wakeup = None
+        self.resumed = set()  # scopes whose unfinished jobs were looked up in this process
+        self._workers = []
+
+    def _store(self):
+        if self.store is None:
+            self.store = BroadcastStore()
+        return self.store
+
+    def start(self):
+        if not self._workers:
+            self.wakeup = asyncio.Event()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(max(1, self.workers))]
+
+    def stop(self):
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        self.queues.clear()
+        self.turns.clear()
+        self.jobs.clear()     # unfinished jobs resume from the store
+        self.resumed.clear()
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def _enqueue(self, job, recipient, attempt):
+        if job.scope not in self.queues:
+            self.queues[job.scope] = deque()
+            self.turns.append(job.scope)
+        self.queues[job.scope].append((job, recipient, attempt))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _resume(self, token):
+        """Queues again the pending recipients of the token's jobs left unfinished by a previous process."""
+        scope = token_scope(token)
+        if scope in self.resumed:
+            return
+        self.resumed.add(scope)
+        for row in await run_in_threadpool(self._store().load, scope):
+            if row[0] in self.jobs:
+                continue
+            job, pending = BroadcastJob.restore(token, row)
+            self.jobs[job.id] = job
+            self.start()
+            for recipient in pending:
+                self._enqueue(job, recipient, 1)
+
+    async def submit(self, token, message, recipients):
+        self._prune()
+        await self._resume(token)
+        self.start()
+        job = BroadcastJob(token, message, recipients)
+        if not recipients:
+            job.finished_at = time.time()
+        await run_in_threadpool(self._store().create, job)
+        self.jobs[job.id] = job
+        for recipient in recipients:
+            self._enqueue(job, recipient, 1)
+        return job
+
+    async def get(self, token, job_id):
+        await self._resume(token)
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job if job.scope == token_scope(token) else None
+        rows = await run_in_threadpool(self._store().load, token_scope(token), job_id)
+        return BroadcastJob.restore(token, rows[0])[0] if rows else None
+
+    async def _next(self):
+        """The next delivery, from the tokens in turn, skipping tokens whose rate limit has no room yet."""
+        while True:
+            wait = None
+            for _ in range(len(self.turns)):
+                scope = self.turns.popleft()
+                queue = self.queues[scope]
+                delay = limiter_for(queue[0][0].token).try_acquire()
+                if delay:
+                    self.turns.append(scope)
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                delivery = queue.popleft()
+                if queue:
+                    self.turns.append(scope)  # back of the line, after the other tokens
+                else:
+                    del self.queues[scope]
+                return delivery
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, job, recipient, attempt):
+        try:
+            response = await run_in_threadpool(dooray_client.send_message, job.token, recipient, job.message)
+        except Exception as e:
+            response = {"error": str(e)}
+        if not (isinstance(response, dict) and "error" in response):
+            job.sent += 1
+            outcome = ("sent", attempt)
+        elif attempt < self.max_attempts and _retryable(response):
+            job.retries += 1
+            delay = self.retry_delay * 2 ** (attempt - 1)
+            asyncio.get_running_loop().call_later(delay, self._enqueue, job, recipient, attempt + 1)
+            return
+        else:
+            failure = {
+                "recipient_id": recipient, "attempts": attempt,
+                "status_code": response.get("status_code"), "error": str(response.get("response", response["error"])),
+            }
+            job.failures.append(failure)
+            outcome = ("failed", attempt, failure["status_code"], failure["error"])
+        if job.pending == 0:
+            job.finished_at = time.time()
+        await run_in_threadpool(self._store().record, job, recipient, *outcome)
+
+    async def _work(self):
+        while True:
+            job, recipient, attempt = await self._next()
+            try:
+                await self._deliver(job, recipient, attempt)
+            except Exception as e:
+                print(f"Error delivering broadcast message: {e}")
+
+
+BROADCAST = BroadcastService()
+
+
+def install(app):
+    """Stops the delivery workers with `app`; they are started by the first broadcast."""
+    app.router.add_event_handler("shutdown", BROADCAST.stop)
+
+
+async def expand_recipients(token, recipients=(), department=None):
+    """Member IDs for the given member IDs / emails and department (with sub-departments), without duplicates."""
+    found = {}
+    unknown = []
+    index = None
+    for recipient in recipients or ():
+        recipient = str(recipient).strip()
+        if "@" in recipient:
+            index = index or await DIRECTORY.get(token)
+            matches = index.lookup(email=recipient, limit=1)
+            if matches:
+                found.setdefault(matches[0]["id"], None)
+            else:
+                unknown.append(recipient)
+        elif recipient:
+            found.setdefault(recipient, None)
+    if department:
+        index = index or await DIRECTORY.get(token)
+        department_ids = index.department_ids(department)
+        if not department_ids:
+            unknown.append(str(department))
+        for member_id in sorted({m for d in department_ids for m in index.by_department.get(d, ())}):
+            found.setdefault(member_id, None)
+    return list(found), unknown
+
+
+# --- Messenger Broadcast API ---
+@router.post("/mcp/messenger/broadcast")
+async def api_messenger_broadcast(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    message = body.get("message")
+    recipients = body.get("recipient_ids") or []
+    department = body.get("department_id") or body.get("department")
+    if not message or not (recipients or department):
+        raise HTTPException(status_code=400, detail="message and recipient_ids or department_id are required")
+    if not isinstance(recipients, list):
+        raise HTTPException(status_code=400, detail="recipient_ids must be a list")
+    try:
+        member_ids, unknown = await expand_recipients(api_key, recipients, department)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if not member_ids:
+        raise HTTPException(status_code=400, detail={"message": "no recipients found", "unknown": unknown})
+    job = await BROADCAST.submit(api_key, message, member_ids)
+    return {"dooray_response": dict(job.status(), unknown=unknown)}
+
+
+@router.post("/mcp/messenger/broadcast/status")
+async def api_messenger_broadcast_status(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    job = await BROADCAST.get(api_key, str(body.get("job_id", "")))
+    if job is None:
+        raise HTTPException(status_code=404, detail="broadcast job not found")
+    return {"dooray_response": job.status()}
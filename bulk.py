@@ -0,0 +1,298 @@
+"""
+Building blocks for the bulk endpoints: a per-token token-bucket rate limiter,
+a bounded-concurrency map over blocking dooray_client calls, row parsing for
+JSON / NDJSON / CSV uploads, client-key idempotency and per-row result
+responses (a JSON summary, or an NDJSON stream with Accept: application/x-ndjson).
+"""
+import asyncio
+import csv
+import json
+import time
+from collections import deque
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from auth import token_scope
+from config import BULK_RATE_PER_SECOND, BULK_BURST, BULK_CONCURRENCY, BULK_MAX_ROWS, BULK_DB_PATH, BULK_IDEMPOTENCY_TTL
+from store import open_store
+
+NDJSON = "application/x-ndjson"
+
+
+class RateLimiter:
+    """Token bucket: `rate` acquisitions per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate=BULK_RATE_PER_SECOND, burst=BULK_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self):
+        """Takes a token without waiting: 0 when one was taken, else the seconds until one is available."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+_LIMITERS = {}
+
+
+def limiter_for(token):
+    """The shared limiter of a token, so concurrent bulk requests of one user share one budget."""
+    key = token_scope(token)
+    if key not in _LIMITERS:
+        _LIMITERS[key] = RateLimiter()
+    return _LIMITERS[key]
+
+
+async def map_bounded(func, items, concurrency, limiter=None, buffered=0):
+    """
+    Awaits `func(item)` for every item with at most `concurrency` calls in flight,
+    each after a `limiter` token. Yields (index, result) in completion order; an
+    exception raised by `func` is yielded as the result instead of propagating.
+    With `buffered`, at most that many results wait for the consumer before the
+    calls pause (0: no bound).
+    """
+    items = list(items)
+    results = asyncio.Queue(buffered)
+    positions = iter(range(len(items)))
+
+    async def worker():
+        for index in positions:
+            try:
+                if limiter is not None:
+                    await limiter.acquire()
+                result = await func(items[index])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = e
+            await results.put((index, result))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def _lines(request: Request):
+    """Decoded lines of the request body, read as it arrives."""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+
+def _csv_row(header, values):
+    row = {}
+    for name, value in zip(header, values):
+        if value == "":
+            continue
+        if value[:1] in "[{":
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        row[name] = value
+    return row
+
+
+async def read_rows(request: Request, items_key, max_rows=BULK_MAX_ROWS):
+    """
+    Rows of a bulk request: a JSON list or {items_key: [...]}, NDJSON (one object per
+    line) or CSV with a header line (cells starting with [ or { are parsed as JSON).
+    NDJSON/CSV bodies are parsed line by line as they are received. A line that
+    cannot be parsed becomes {"_error": ...} so its row is reported, not dropped.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    rows = []
+    if content_type in (NDJSON, "application/jsonl", "text/csv"):
+        header = None
+        # one reader over the whole body, fed a record at a time: quoted cells may span lines
+        buffered = deque()
+        reader = csv.reader(iter(buffered.popleft, None))
+        quoted = False
+        async for line in _lines(request):
+            if not quoted and not line.strip():
+                continue
+            if content_type == "text/csv":
+                buffered.append(line + "\n")
+                quoted ^= line.count('"') % 2 == 1
+                if quoted:
+                    continue  # the record goes on in the next line
+                values = next(reader)
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                rows.append(_csv_row(header, values))
+            else:
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {"_error": f"invalid JSON line: {e}"}
+                rows.append(row if isinstance(row, dict) else {"_error": "each line must be a JSON object"})
+            if len(rows) > max_rows:
+                raise HTTPException(status_code=413, detail=f"at most {max_rows} rows per request")
+        if quoted:
+            rows.append({"_error": "unterminated quoted CSV cell"})
+        return rows
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    rows = body if isinstance(body, list) else body.get(items_key) if isinstance(body, dict) else None
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail=f"{items_key} (list) is required")
+    if len(rows) > max_rows:
+        raise HTTPException(status_code=413, detail=f"at most {max_rows} rows per request")
+    return [row if isinstance(row, dict) else {"_error": "each row must be an object"} for row in rows]
+
+
+class IdempotencyStore:
+    """Results of completed rows by client key, in SQLite so retries after a restart are still recognised."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS completed (
+        scope TEXT NOT NULL,
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        result TEXT NOT NULL,
+        completed_at REAL NOT NULL,
+        PRIMARY KEY (scope, namespace, key)
+    );
+    """
+
+    def __init__(self, path=BULK_DB_PATH, ttl=BULK_IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self.conn, self.lock = open_store(path, self.SCHEMA)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM completed WHERE completed_at < ?", (time.time() - ttl,))
+
+    def get(self, scope, namespace, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM completed WHERE scope = ? AND namespace = ? AND key = ? AND completed_at >= ?",
+                (scope, namespace, key, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, scope, namespace, key, result):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completed (scope, namespace, key, result, completed_at) VALUES (?, ?, ?, ?, ?)",
+                (scope, namespace, key, json.dumps(result, ensure_ascii=False, default=str), time.time()),
+            )
+
+
+_idempotency = None
+_in_flight = set()
+
+
+def _store():
+    global _idempotency
+    if _idempotency is None:
+        _idempotency = IdempotencyStore()
+    return _idempotency
+
+
+async def run_rows(token, rows, execute, namespace, concurrency=BULK_CONCURRENCY):
+    """
+    Runs `await execute(row)` for every row under the token's rate limit and yields
+    one result dict per row, in completion order. `execute` raises ValueError for an
+    invalid row and RuntimeError for an upstream failure. Rows with a client `key`
+    that already completed (in this or an earlier request) are not executed again;
+    their stored result is returned with status "replayed". Only rows that are
+    executed take a rate-limit token.
+    """
+    scope = token_scope(token)
+    limiter = limiter_for(token)
+
+    async def run(indexed):
+        index, row = indexed
+        key = row.get("key")
+        key = str(key) if key not in (None, "") else None
+        outcome = {"index": index, "key": key}
+        if "_error" in row:
+            return dict(outcome, status="invalid", error=row["_error"])
+        if key is not None:
+            stored = await run_in_threadpool(_store().get, scope, namespace, key)
+            if stored is not None:
+                return dict(outcome, status="replayed", result=stored)
+            if (scope, namespace, key) in _in_flight:
+                return dict(outcome, status="duplicate", error="a row with this key is already running")
+            _in_flight.add((scope, namespace, key))
+        try:
+            await limiter.acquire()
+            try:
+                result = await execute(row)
+            except ValueError as e:
+                return dict(outcome, status="invalid", error=str(e))
+            except RuntimeError as e:
+                return dict(outcome, status="error", error=str(e))
+            if key is not None:
+                await run_in_threadpool(_store().put, scope, namespace, key, result)
+        finally:
+            # only once the result is stored: a retry in between would otherwise run the row again
+            _in_flight.discard((scope, namespace, key))
+        return dict(outcome, status="ok", result=result)
+
+    async for _, outcome in map_bounded(run, list(enumerate(rows)), concurrency):
+        if isinstance(outcome, Exception):  # a bug in execute, not a row failure
+            outcome = {"index": None, "status": "error", "error": str(outcome)}
+        yield outcome
+
+
+def summarize(results):
+    summary = {"rows": len(results)}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return summary
+
+
+async def respond_rows(request: Request, results):
+    """NDJSON stream of row results (then a summary line) when asked for, otherwise one JSON document."""
+    if NDJSON in request.headers.get("accept", ""):
+        async def lines():
+            seen = []
+            try:
+                async for result in results:
+                    seen.append(result)
+                    yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+                yield json.dumps({"summary": summarize(seen)}) + "\n"
+            finally:
+                await results.aclose()
+        return StreamingResponse(lines(), media_type=NDJSON)
+    collected = [result async for result in results]
+    collected.sort(key=lambda result: (result["index"] is None, result["index"]))
+    return {"dooray_response": {"results": collected, "summary": summarize(collected)}}
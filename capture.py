@@ -0,0 +1,278 @@
+"""
+Opt-in traffic capture for building replay corpora (see bench/replay.py).
+
+When CAPTURE_ENABLED is set, every sampled inbound REST and /mcp call and
+every upstream _call_dooray_api exchange is written as one JSON line to
+rotating gzip files in CAPTURE_DIR. The request path only snapshots the data
+and puts it on a queue; redaction, serialisation and compression happen in a
+background writer thread, which batches writes and drops records rather
+than block when it falls behind.
+"""
+import contextvars
+import gzip
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode
+
+from config import (
+    CAPTURE_ENABLED,
+    CAPTURE_DIR,
+    CAPTURE_SAMPLE_RATE,
+    CAPTURE_MAX_BODY_BYTES,
+    CAPTURE_MAX_FILE_BYTES,
+    CAPTURE_MAX_FILES,
+)
+
+REDACTED = "[REDACTED]"
+# mcp-session-id keys the session's stored Dooray token (auth.SESSION_TOKENS), so it is a credential too
+SENSITIVE_HEADERS = {
+    "authorization", "x-api-key", "cookie", "set-cookie", "claude-conversation-id", "x-conversation-id", "mcp-session-id",
+}
+SENSITIVE_KEY = re.compile(r"token|password|secret|authorization|api[_-]?key|session[_-]?id|phone|mobile", re.IGNORECASE)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+PHONE = re.compile(r"\+?\d{2,4}[ -]\d{3,4}[ -]\d{4}")
+
+# Capture id of the inbound request being served: None outside a request,
+# False when the request was not sampled.
+_current_capture = contextvars.ContextVar("capture_id", default=None)
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if SENSITIVE_KEY.search(str(k)) else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return PHONE.sub(REDACTED, EMAIL.sub(REDACTED, value))
+    return value
+
+
+def redact_headers(headers):
+    return {k: REDACTED if k.lower() in SENSITIVE_HEADERS else v for k, v in headers.items()}
+
+
+def redact_query(query):
+    """An inbound query string redacted by parameter name, like body keys; upstream params are dicts."""
+    if not isinstance(query, str):
+        return redact(query)
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, REDACTED if SENSITIVE_KEY.search(k) else redact(v)) for k, v in pairs])
+
+
+def _decode_body(raw: bytes, size: int, limit: int):
+    if not size:
+        return None
+    if size > limit:
+        return {"truncated": True, "bytes": size}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return {"binary": True, "bytes": len(raw)}
+
+
+class CaptureWriter:
+    def __init__(self, directory, max_file_bytes, max_files, max_body_bytes, queue_size=10000, flush_interval=1.0):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_body_bytes = max_body_bytes
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._path = None
+        self._sequence = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout=5.0):
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < 500:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+        self._close()
+
+    def _serialize(self, record):
+        if "raw_body" in record:
+            record["body"] = _decode_body(record.pop("raw_body"), record.pop("body_bytes"), self.max_body_bytes)
+        record["body"] = redact(record.get("body"))
+        if "raw_response" in record:
+            record["response"] = redact(_decode_body(record.pop("raw_response"), record["response_bytes"], self.max_body_bytes))
+        if "headers" in record:
+            record["headers"] = redact_headers(record["headers"])
+        if record.get("query"):
+            record["query"] = redact_query(record["query"])
+        return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+    def _write(self, batch):
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write("".join(self._serialize(record) for record in batch))
+            self._file.flush()
+            self.written += len(batch)
+            if os.path.getsize(self._path) >= self.max_file_bytes:
+                self._close()
+        except Exception as e:
+            self.dropped += len(batch)
+            print(f"Error writing capture batch: {e}")
+
+    def _open(self):
+        self._sequence += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        self._path = os.path.join(self.directory, f"capture-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl.gz")
+        self._file = gzip.open(self._path, "at", encoding="utf-8")
+        self._prune()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _prune(self):
+        files = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.startswith("capture-")),
+            key=os.path.getmtime,
+        )
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_writer = None
+
+
+def start():
+    global _writer
+    if _writer is None:
+        _writer = CaptureWriter(CAPTURE_DIR, CAPTURE_MAX_FILE_BYTES, CAPTURE_MAX_FILES, CAPTURE_MAX_BODY_BYTES)
+        _writer.start()
+    return _writer
+
+
+def stop():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def record_upstream(method, endpoint, params, json_data, status, duration_ms, raw_response):
+    """Called by dooray_client._call_dooray_api after every upstream exchange."""
+    if _writer is None:
+        return
+    capture_id = _current_capture.get()
+    if capture_id is False or (capture_id is None and random.random() >= CAPTURE_SAMPLE_RATE):
+        return
+    raw_response = raw_response or b""
+    _writer.put({
+        "ts": _now(), "kind": "upstream", "capture_id": capture_id, "method": method, "path": endpoint,
+        "query": dict(params) if params else None,
+        "body": json_data,
+        "status": status, "duration_ms": round(duration_ms, 2),
+        "raw_response": raw_response[:_writer.max_body_bytes + 1], "response_bytes": len(raw_response),
+    })
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording sampled inbound HTTP calls without buffering the response stream."""
+
+    def __init__(self, app, sample_rate=CAPTURE_SAMPLE_RATE, max_body_bytes=CAPTURE_MAX_BODY_BYTES):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _writer is None:
+            return await self.app(scope, receive, send)
+        if random.random() >= self.sample_rate:
+            token = _current_capture.set(False)
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _current_capture.reset(token)
+
+        capture_id = uuid.uuid4().hex
+        token = _current_capture.set(capture_id)
+        started = time.perf_counter()
+        request_chunks, response_chunks = [], []
+        sizes = {"request": 0, "response": 0}
+        status = {}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                sizes["request"] += len(chunk)
+                if sizes["request"] <= self.max_body_bytes:
+                    request_chunks.append(chunk)
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                sizes["response"] += len(chunk)
+                if sizes["response"] <= self.max_body_bytes:
+                    response_chunks.append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            _current_capture.reset(token)
+            _writer.put({
+                "ts": _now(), "kind": "inbound", "capture_id": capture_id, "method": scope["method"],
+                "path": scope["path"], "query": scope.get("query_string", b"").decode("latin-1") or None,
+                "headers": {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])},
+                "raw_body": b"".join(request_chunks), "body_bytes": sizes["request"], "status": status.get("code"),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "raw_response": b"".join(response_chunks), "response_bytes": sizes["response"],
+            })
+
+
+def install(app):
+    """Adds the capture middleware and writer lifecycle to `app` when CAPTURE_ENABLED is set."""
+    if not CAPTURE_ENABLED:
+        return
+    app.add_middleware(CaptureMiddleware)
+    app.router.add_event_handler("startup", start)
+    app.router.add_event_handler("shutdown", stop)
@@ -0,0 +1,205 @@
+"""
+Condensed post, wiki page and comment bodies for LLM-facing reads.
+
+Bodies are relayed in full by default and are often large: embedded images
+(sometimes as data: URIs), wide tables and HTML markup. With the "condense"
+option (true, or {"max_chars", "section", "strip_images", "table_rows"}) the
+read routes of posts, wiki pages and their comments, and the MCP read tools,
+return a reduced body instead:
+
+- HTML bodies are turned into plain text, HTML comments are dropped;
+- images become "[image: alt]" placeholders;
+- tables keep their first CONDENSE_TABLE_ROWS rows;
+- runs of blank lines are collapsed;
+- "section" keeps only the section under that markdown heading;
+- the result is cut at a line boundary to at most max_chars
+  (CONDENSE_MAX_CHARS), and the headings of the page are listed so a
+  section can be asked for next.
+
+Condensed bodies are cached by a hash of the content and the options, so a
+re-read of an unchanged page does no work beyond the upstream call.
+"""
+import hashlib
+import html
+import json
+import re
+from collections import OrderedDict
+
+from config import CONDENSE_MAX_CHARS, CONDENSE_TABLE_ROWS, CONDENSE_CACHE_ENTRIES
+from routes import result_filter
+from wiki_patch import find_section, sections
+
+_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_REF_IMAGE = re.compile(r"!\[([^\]]*)\]\[[^\]]*\]")
+_HTML_IMAGE = re.compile(r"<img\b[^>]*>", re.I)
+_HTML_ALT = re.compile(r"\balt\s*=\s*[\"']([^\"']*)[\"']", re.I)
+_HTML_COMMENT = re.compile(r"<!--.*?-->", re.S)
+_HTML_DROP = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.I | re.S)
+_HTML_BREAK = re.compile(r"<\s*(br|/p|/div|/tr|/h[1-6]|/table|/blockquote)\b[^>]*>", re.I)
+_HTML_CELL = re.compile(r"<\s*/t[dh]\s*>", re.I)
+_HTML_ITEM = re.compile(r"<\s*li\b[^>]*>", re.I)
+_HTML_TAG = re.compile(r"<[^>]+>")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{3,}")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+OPTIONS = ("max_chars", "section", "strip_images", "table_rows")
+
+
+def condense_options(value, defaults=None):
+    """Options of a "condense" request value (true or a dict); ValueError when they are invalid."""
+    options = {"max_chars": CONDENSE_MAX_CHARS, "section": None, "strip_images": True, "table_rows": CONDENSE_TABLE_ROWS}
+    options.update(defaults or {})
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip().startswith("{") else value.lower() in ("1", "true", "yes")
+        except ValueError:
+            raise ValueError("condense must be true or an object")
+    if isinstance(value, dict):
+        unknown = set(value) - set(OPTIONS)
+        if unknown:
+            raise ValueError(f"unknown condense options: {', '.join(sorted(unknown))}")
+        options.update({key: val for key, val in value.items() if val is not None})
+    elif value is not True:
+        raise ValueError("condense must be true or an object")
+    try:
+        options["max_chars"] = max(0, int(options["max_chars"]))
+        options["table_rows"] = max(0, int(options["table_rows"]))
+    except (TypeError, ValueError):
+        raise ValueError("max_chars and table_rows must be integers")
+    options["strip_images"] = bool(options["strip_images"])
+    return options
+
+
+def _placeholder(alt):
+    return f"[image: {alt}]" if alt else "[image]"
+
+
+def _html_image(match):
+    alt = _HTML_ALT.search(match.group(0))
+    return _placeholder(alt.group(1) if alt else None)
+
+
+def html_to_text(text):
+    text = _HTML_DROP.sub("", text)
+    text = _HTML_IMAGE.sub(_html_image, text)
+    text = _HTML_ITEM.sub("\n- ", text)
+    text = _HTML_CELL.sub(" | ", text)
+    text = _HTML_BREAK.sub("\n", text)
+    return html.unescape(_HTML_TAG.sub("", text))
+
+
+def _shorten_tables(lines, keep):
+    """Keeps the header and first `keep` rows of every markdown table."""
+    result, rows = [], 0
+    for index, line in enumerate(lines):
+        if not _TABLE_ROW.match(line):
+            rows = 0
+            result.append(line)
+            continue
+        rows += 1
+        if not _TABLE_RULE.match(line) and rows > keep + 2:  # header and rule line are not counted
+            following = index + 1 < len(lines) and _TABLE_ROW.match(lines[index + 1])
+            if not following:
+                result.append(f"| … {rows - keep - 2} more rows |")
+            continue
+        result.append(line)
+    return result
+
+
+def _truncate(text, max_chars):
+    if not max_chars or len(text) <= max_chars:
+        return text, False
+    cut = text.rfind("\n", 0, max_chars)
+    cut = cut if cut > max_chars // 2 else max_chars  # no line break nearby: cut mid-line
+    return text[:cut].rstrip() + f"\n\n… [truncated: {cut} of {len(text)} characters]", True
+
+
+def condense_text(text, mime_type="text/x-markdown", options=None):
+    """(condensed text, facts about the reduction) for one body."""
+    options = options or condense_options(True)
+    original = len(text)
+    text = _HTML_COMMENT.sub("", text.replace("\r\n", "\n"))
+    if "html" in (mime_type or ""):
+        text = html_to_text(text)
+    if options["strip_images"]:
+        for pattern in (_IMAGE, _REF_IMAGE):
+            text = pattern.sub(lambda m: _placeholder(m.group(1)), text)
+        text = _HTML_IMAGE.sub(_html_image, text)
+    lines = [line.rstrip() for line in text.split("\n")]
+    headings = [("#" * level) + " " + title for _, level, title in sections(lines)]
+    if options["section"]:
+        start, end = find_section(lines, str(options["section"]))
+        lines = lines[start:end]
+    if options["table_rows"]:
+        lines = _shorten_tables(lines, options["table_rows"])
+    text = _BLANK_RUNS.sub("\n\n", "\n".join(lines)).strip("\n")
+    text, truncated = _truncate(text, options["max_chars"])
+    facts = {"original_chars": original, "chars": len(text), "truncated": truncated}
+    if truncated or options["section"]:
+        facts["sections"] = headings
+    return text, facts
+
+
+class CondenseCache:
+    """Condensed bodies by hash of content, MIME type and options, least recently used dropped first."""
+
+    def __init__(self, size=CONDENSE_CACHE_ENTRIES):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def condense(self, text, mime_type, options):
+        key = hashlib.sha256(
+            json.dumps([text, mime_type, options], ensure_ascii=False, sort_keys=True).encode(),
+        ).hexdigest()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = condense_text(text, mime_type, options)
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+
+CONDENSED = CondenseCache()
+
+
+def _condense_item(item, options):
+    """A copy of a post / page / comment with its body (body or content field) condensed."""
+    if not isinstance(item, dict):
+        return item
+    for field in ("body", "content"):
+        value = item.get(field)
+        if isinstance(value, dict) and isinstance(value.get("content"), str):
+            text, facts = CONDENSED.condense(value["content"], value.get("mimeType"), options)
+            mime_type = "text/plain" if "html" in (value.get("mimeType") or "") else value.get("mimeType")
+            return dict(item, **{field: dict(value, content=text, mimeType=mime_type, condensed=facts)})
+    return item
+
+
+def condense_response(result, options=True, defaults=None):
+    """A Dooray response ({"header", "result"}) whose post, page or comment bodies are condensed."""
+    if not isinstance(options, dict) or set(options) != set(OPTIONS):
+        options = condense_options(options, defaults)
+    if not isinstance(result, dict) or "result" not in result:
+        return result
+    payload = result["result"]
+    if isinstance(payload, list):
+        # a section only makes sense for one body; comment lists are condensed whole
+        item_options = dict(options, section=None)
+        payload = [_condense_item(item, item_options) for item in payload]
+    else:
+        payload = _condense_item(payload, options)
+    return dict(result, result=payload)
+
+
+@result_filter(
+    "get_project_post", "get_project_post_comments", "get_wiki_page", "get_wiki_page_comments", "get_wiki_page_comment",
+    parse_options=condense_options,
+)
+def _condense_route_result(result, options):
+    return condense_response(result, options)
@@ -1,3 +1,106 @@
 import os
+from dotenv import load_dotenv
+
+# .env is loaded once here; every other module reads settings from config.
+load_dotenv()
 
 DOORAY_BASE_URL = os.getenv("DOORAY_BASE_URL", "https://api.gov-dooray.com")
+DOORAY_API_TOKEN = os.getenv("DOORAY_API_TOKEN")
+DOORAY_DOMAIN = os.getenv("DOORAY_DOMAIN")
+
+# Cold-start budget for `python main.py --profile-startup` (startup_profile.py)
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "800"))
+
+# Opt-in traffic capture for replay corpora (capture.py)
+CAPTURE_ENABLED = os.getenv("CAPTURE_ENABLED", "").lower() in ("1", "true", "yes")
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "captures")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_MAX_BODY_BYTES = int(os.getenv("CAPTURE_MAX_BODY_BYTES", str(64 * 1024)))
+CAPTURE_MAX_FILE_BYTES = int(os.getenv("CAPTURE_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+CAPTURE_MAX_FILES = int(os.getenv("CAPTURE_MAX_FILES", "20"))
+
+# MCP Streamable HTTP sessions (mcp_events.py)
+MCP_EVENT_BUFFER_SIZE = int(os.getenv("MCP_EVENT_BUFFER_SIZE", "256"))
+MCP_SESSION_TTL = int(os.getenv("MCP_SESSION_TTL", "3600"))
+MCP_MAX_SESSIONS = int(os.getenv("MCP_MAX_SESSIONS", "1000"))
+
+# Organization directory index (directory.py)
+DIRECTORY_REFRESH_SECONDS = int(os.getenv("DIRECTORY_REFRESH_SECONDS", "600"))
+
+# Local full-text search index (search_index.py)
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", "data/search.sqlite3")
+SEARCH_CRAWL_INTERVAL = int(os.getenv("SEARCH_CRAWL_INTERVAL", "1800"))
+SEARCH_CRAWL_CONCURRENCY = int(os.getenv("SEARCH_CRAWL_CONCURRENCY", "4"))
+
+# Background sync of slow-changing reads (sync_engine.py)
+SYNC_DB_PATH = os.getenv("SYNC_DB_PATH", "data/sync.sqlite3")
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "300"))
+SYNC_FULL_INTERVAL = int(os.getenv("SYNC_FULL_INTERVAL", "3600"))
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "4"))
+SYNC_TOKEN_TTL = int(os.getenv("SYNC_TOKEN_TTL", "86400"))
+
+# Calendar free/busy event window cache (freebusy.py)
+FREEBUSY_CACHE_TTL = int(os.getenv("FREEBUSY_CACHE_TTL", "120"))
+FREEBUSY_MAX_WINDOWS = int(os.getenv("FREEBUSY_MAX_WINDOWS", "8"))
+
+# Recursive drive tree crawler (drive_tree.py)
+DRIVE_TREE_DB_PATH = os.getenv("DRIVE_TREE_DB_PATH", "data/drive_tree.sqlite3")
+DRIVE_TREE_TTL = int(os.getenv("DRIVE_TREE_TTL", "600"))
+DRIVE_TREE_FULL_INTERVAL = int(os.getenv("DRIVE_TREE_FULL_INTERVAL", "3600"))
+DRIVE_TREE_CONCURRENCY = int(os.getenv("DRIVE_TREE_CONCURRENCY", "4"))
+DRIVE_TREE_MAX_ENTRIES = int(os.getenv("DRIVE_TREE_MAX_ENTRIES", "100000"))
+
+# Content-addressed cache of downloaded drive/wiki files (file_cache.py)
+FILE_CACHE_DIR = os.getenv("FILE_CACHE_DIR", "data/file_cache")
+FILE_CACHE_DB_PATH = os.getenv("FILE_CACHE_DB_PATH", "data/file_cache.sqlite3")
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Multi-file drive archive downloads (archive.py)
+ARCHIVE_CONCURRENCY = int(os.getenv("ARCHIVE_CONCURRENCY", "4"))
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "1000"))
+
+# Wiki export checkpoints and import (wiki_export.py)
+WIKI_EXPORT_DB_PATH = os.getenv("WIKI_EXPORT_DB_PATH", "data/wiki_export.sqlite3")
+WIKI_EXPORT_CONCURRENCY = int(os.getenv("WIKI_EXPORT_CONCURRENCY", "4"))
+WIKI_EXPORT_TTL = int(os.getenv("WIKI_EXPORT_TTL", "604800"))
+
+# Condensed post / wiki bodies for LLM-facing reads (condense.py)
+CONDENSE_MAX_CHARS = int(os.getenv("CONDENSE_MAX_CHARS", "8000"))
+CONDENSE_TABLE_ROWS = int(os.getenv("CONDENSE_TABLE_ROWS", "20"))
+CONDENSE_CACHE_ENTRIES = int(os.getenv("CONDENSE_CACHE_ENTRIES", "1024"))
+
+# Compound context reads: lifetime of cached project-level pieces (context.py)
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "60"))
+
+# Name -> ID resolution: map refresh interval and minimum similarity of a misspelled name (resolver.py)
+RESOLVER_REFRESH_SECONDS = int(os.getenv("RESOLVER_REFRESH_SECONDS", "300"))
+RESOLVER_FUZZY_CUTOFF = float(os.getenv("RESOLVER_FUZZY_CUTOFF", "0.7"))
+
+# Reservation availability index (availability.py)
+AVAILABILITY_REFRESH_SECONDS = int(os.getenv("AVAILABILITY_REFRESH_SECONDS", "60"))
+
+# Bulk endpoints: per-token rate limit and concurrency (bulk.py)
+BULK_RATE_PER_SECOND = float(os.getenv("BULK_RATE_PER_SECOND", "10"))
+BULK_BURST = int(os.getenv("BULK_BURST", "20"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "5000"))
+BULK_DB_PATH = os.getenv("BULK_DB_PATH", "data/bulk.sqlite3")
+BULK_IDEMPOTENCY_TTL = int(os.getenv("BULK_IDEMPOTENCY_TTL", "86400"))
+
+# Messenger broadcast delivery workers (broadcast.py)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "4"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+BROADCAST_RETRY_DELAY = float(os.getenv("BROADCAST_RETRY_DELAY", "2"))
+BROADCAST_JOB_TTL = int(os.getenv("BROADCAST_JOB_TTL", "86400"))
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "data/broadcast.sqlite3")
+
+# Background jobs for async=true requests (jobs.py)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOBS_PER_TOKEN = int(os.getenv("JOBS_PER_TOKEN", "2"))
+JOBS_TTL = int(os.getenv("JOBS_TTL", "86400"))
+
+# Bulk account-sync pipeline (account_sync.py)
+ACCOUNT_SYNC_DB_PATH = os.getenv("ACCOUNT_SYNC_DB_PATH", "data/account_sync.sqlite3")
+ACCOUNT_SYNC_CHUNK_SIZE = int(os.getenv("ACCOUNT_SYNC_CHUNK_SIZE", "500"))
+ACCOUNT_SYNC_CHUNK_BYTES = int(os.getenv("ACCOUNT_SYNC_CHUNK_BYTES", str(1024 * 1024)))
+ACCOUNT_SYNC_CONCURRENCY = int(os.getenv("ACCOUNT_SYNC_CONCURRENCY", "4"))
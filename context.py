@@ -0,0 +1,408 @@
+"""
+Compound "context" reads: everything an agent needs about a post, a project
+or a wiki page in one request.
+
+Instead of get_project_post, then its comments, then the project's
+workflows, members and tags one after another, the context routes issue the
+reads concurrently and join them here: workflow and tag IDs become names,
+member IDs become names (through the directory index, directory.py), bodies
+are condensed (condense.py) unless asked otherwise, and only the fields an
+agent reads are kept.
+
+Project-level pieces (project, workflows, tags, members) are shared by every
+post of a project, so they are cached per token for CONTEXT_CACHE_TTL
+seconds, concurrent requests sharing one fetch. Fresh reads through the
+other routes refresh that cache and workflow writes drop it.
+
+A failing secondary read does not fail the request: its piece is left out
+and reported under "errors".
+"""
+import asyncio
+import json
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from condense import condense_response, condense_options
+from config import CONTEXT_CACHE_TTL
+from directory import DIRECTORY
+from resolver import resolve_request
+from routes import on_success
+from token_cache import TokenCache
+
+router = APIRouter()
+
+SHARED_CLIENTS = ("get_project", "get_project_workflows", "get_project_tags", "get_project_members")
+
+# writes -> shared reads they make stale
+INVALIDATES = {
+    "create_project_workflow": "get_project_workflows",
+    "update_project_workflow": "get_project_workflows",
+    "delete_project_workflow": "get_project_workflows",
+}
+
+
+class ContextError(RuntimeError):
+    """The primary read of a context failed; carries the upstream status code."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _error_of(response):
+    if isinstance(response, dict) and "error" in response:
+        return str(response.get("response", response["error"]))
+    return None
+
+
+class SharedReads:
+    """Short-lived per-token cache of project-level reads; concurrent misses share one upstream call."""
+
+    def __init__(self, ttl=CONTEXT_CACHE_TTL):
+        self.cache = TokenCache(self._read, ttl, refresh_in_background=False, idle_ttl=ttl, name="context read")
+
+    @staticmethod
+    async def _read(token, client, arguments, previous=None):
+        return await run_in_threadpool(getattr(dooray_client, client), token, **json.loads(arguments))
+
+    @staticmethod
+    def _arguments(kwargs):
+        return json.dumps(kwargs, sort_keys=True, default=str)
+
+    async def get(self, token, client, **kwargs):
+        arguments = self._arguments(kwargs)
+        response = await self.cache.get(token, client, arguments)
+        if _error_of(response) is not None:
+            self.cache.discard(token, client, arguments, value=response)  # errors are not cached
+        return response
+
+    def put(self, token, client, kwargs, response):
+        self.cache.put(token, client, self._arguments(kwargs), value=response)
+
+    def invalidate(self, token, client, kwargs):
+        self.cache.invalidate(token, client, self._arguments(kwargs))
+
+
+SHARED = SharedReads()
+
+
+def _make_storer(client):
+    def store(api_key, kwargs, result):
+        SHARED.put(api_key, client, kwargs, result)
+    return store
+
+
+for _client in SHARED_CLIENTS:
+    on_success(_client)(_make_storer(_client))
+
+
+def _make_invalidator(client):
+    def invalidate(api_key, kwargs, result):
+        SHARED.invalidate(api_key, client, {"project_id": kwargs.get("project_id")})
+    return invalidate
+
+
+for _write, _client in INVALIDATES.items():
+    on_success(_write)(_make_invalidator(_client))
+
+
+async def _gather(pieces):
+    """{name: response} for {name: awaitable}, run concurrently; failures become error dicts."""
+    names = list(pieces)
+    results = await asyncio.gather(*pieces.values(), return_exceptions=True)
+    return {
+        name: {"error": str(result)} if isinstance(result, Exception) else result
+        for name, result in zip(names, results)
+    }
+
+
+def _payload(response):
+    """The result of a response, or None for an error (reported separately, see _errors)."""
+    return None if _error_of(response) is not None else dooray_client.payload(response)
+
+
+async def _directory(token):
+    try:
+        return await DIRECTORY.get(token)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _names(directory):
+    return {member_id: entry["name"] for member_id, entry in directory.members.items()} if hasattr(directory, "members") else {}
+
+
+def _person(user, names):
+    """{"id", "name"} of a Dooray user reference (member, or email user)."""
+    if not isinstance(user, dict):
+        return None
+    member = user.get("member") or {}
+    if member.get("organizationMemberId"):
+        member_id = str(member["organizationMemberId"])
+        return {"id": member_id, "name": member.get("name") or names.get(member_id)}
+    email_user = user.get("emailUser") or {}
+    if email_user:
+        return {"email": email_user.get("emailAddress"), "name": email_user.get("name")}
+    if user.get("organizationMemberId"):
+        member_id = str(user["organizationMemberId"])
+        return {"id": member_id, "name": user.get("name") or names.get(member_id)}
+    return None
+
+
+def _body(item):
+    body = item.get("body") or item.get("content") or {}
+    return body.get("content") if isinstance(body, dict) else body
+
+
+def _compact_workflows(response):
+    return [
+        {"id": str(w.get("id")), "name": w.get("name"), "class": w.get("class")}
+        for w in _payload(response) or () if isinstance(w, dict)
+    ]
+
+
+def _compact_tags(response):
+    return [
+        {"id": str(t.get("id")), "name": t.get("name")}
+        for t in _payload(response) or () if isinstance(t, dict)
+    ]
+
+
+def _compact_members(response, names):
+    members = []
+    for m in _payload(response) or ():
+        if isinstance(m, dict):
+            member_id = str(m.get("organizationMemberId") or m.get("id"))
+            members.append({"id": member_id, "name": m.get("name") or names.get(member_id), "role": m.get("role")})
+    return members
+
+
+def _compact_comments(response, names):
+    return [
+        {
+            "id": str(c.get("id")),
+            "creator": _person(c.get("creator"), names),
+            "created_at": c.get("createdAt"),
+            "body": _body(c),
+        }
+        for c in _payload(response) or () if isinstance(c, dict)
+    ]
+
+
+def _condense_options(condense):
+    """Parsed condense options, or None to keep bodies whole; ValueError before anything is read."""
+    return None if condense in (False, None, "false", "0") else condense_options(condense)
+
+
+def _condensed(response, condense):
+    """The response with its bodies condensed; a section option only applies to a single item, not lists."""
+    if condense is None or _error_of(response) is not None:
+        return response
+    return condense_response(response, condense)
+
+
+def _errors(responses):
+    return {name: _error_of(response) for name, response in responses.items() if _error_of(response) is not None}
+
+
+def _primary(response, what):
+    error = _error_of(response)
+    if error is not None:
+        raise ContextError(f"{what}: {error}", response.get("status_code"))
+    return _payload(response) or {}
+
+
+async def post_context(token, project_id, post_id, comments=True, condense=True):
+    """The post (names joined in, body condensed), its comments and the project's workflows and tags."""
+    condense = _condense_options(condense)
+    pieces = {
+        "post": run_in_threadpool(dooray_client.get_project_post, token, project_id, post_id),
+        "workflows": SHARED.get(token, "get_project_workflows", project_id=project_id),
+        "tags": SHARED.get(token, "get_project_tags", project_id=project_id),
+        "directory": _directory(token),
+    }
+    if comments:
+        pieces["comments"] = run_in_threadpool(dooray_client.get_project_post_comments, token, project_id, post_id)
+    responses = await _gather(pieces)
+    directory = responses.pop("directory")
+    names = _names(directory)
+    post = _primary(_condensed(responses["post"], condense), f"post {post_id}")
+    workflows = _compact_workflows(responses["workflows"])
+    tags = _compact_tags(responses["tags"])
+    workflow_names = {w["id"]: w["name"] for w in workflows}
+    tag_names = {t["id"]: t["name"] for t in tags}
+
+    workflow = post.get("workflow") or {}
+    workflow_id = str(workflow.get("id") or post.get("workflowId") or "")
+    users = post.get("users") or {}
+    document = {
+        "post": {
+            "id": str(post.get("id", post_id)),
+            "number": post.get("number") or post.get("taskNumber"),
+            "subject": post.get("subject"),
+            "workflow": {"id": workflow_id, "name": workflow.get("name") or workflow_names.get(workflow_id),
+                         "class": post.get("workflowClass")} if workflow_id else None,
+            "priority": post.get("priority"),
+            "due_date": post.get("dueDate"),
+            "created_at": post.get("createdAt"),
+            "updated_at": post.get("updatedAt"),
+            "from": _person(users.get("from"), names),
+            "to": [p for p in (_person(u, names) for u in users.get("to") or ()) if p],
+            "cc": [p for p in (_person(u, names) for u in users.get("cc") or ()) if p],
+            "tags": [
+                {"id": str(t.get("id")), "name": t.get("name") or tag_names.get(str(t.get("id")))}
+                for t in post.get("tags") or () if isinstance(t, dict)
+            ],
+            "parent_post_id": (post.get("parent") or {}).get("id") if isinstance(post.get("parent"), dict) else None,
+            "body": _body(post),
+            "condensed": (post.get("body") or {}).get("condensed") if isinstance(post.get("body"), dict) else None,
+        },
+        "workflows": workflows,
+        "tags": tags,
+    }
+    if comments:
+        document["comments"] = _compact_comments(_condensed(responses["comments"], condense), names)
+    errors = _errors(responses)
+    if isinstance(directory, dict):
+        errors["directory"] = directory["error"]
+    if errors:
+        document["errors"] = errors
+    return document
+
+
+async def project_context(token, project_id):
+    """The project with its workflows, tags and members (with names)."""
+    responses = await _gather({
+        "project": SHARED.get(token, "get_project", project_id=project_id),
+        "workflows": SHARED.get(token, "get_project_workflows", project_id=project_id),
+        "tags": SHARED.get(token, "get_project_tags", project_id=project_id),
+        "members": SHARED.get(token, "get_project_members", project_id=project_id),
+        "directory": _directory(token),
+    })
+    directory = responses.pop("directory")
+    project = _primary(responses["project"], f"project {project_id}")
+    document = {
+        "project": {
+            "id": str(project.get("id", project_id)),
+            "code": project.get("code"),
+            "name": project.get("name") or project.get("code"),
+            "description": project.get("description"),
+            "state": project.get("state"),
+            "scope": project.get("scope"),
+        },
+        "workflows": _compact_workflows(responses["workflows"]),
+        "tags": _compact_tags(responses["tags"]),
+        "members": _compact_members(responses["members"], _names(directory)),
+    }
+    errors = _errors(responses)
+    if isinstance(directory, dict):
+        errors["directory"] = directory["error"]
+    if errors:
+        document["errors"] = errors
+    return document
+
+
+async def wiki_page_context(token, wiki_id, page_id, comments=True, condense=True):
+    """The page (body condensed), its comments, its child pages and its parent page's title."""
+    condense = _condense_options(condense)
+    pieces = {
+        "page": run_in_threadpool(dooray_client.get_wiki_page, token, wiki_id, page_id),
+        "children": run_in_threadpool(dooray_client.get_wiki_pages, token, wiki_id, page_id),
+        "directory": _directory(token),
+    }
+    if comments:
+        pieces["comments"] = run_in_threadpool(dooray_client.get_wiki_page_comments, token, wiki_id, page_id)
+    responses = await _gather(pieces)
+    directory = responses.pop("directory")
+    names = _names(directory)
+    page = _primary(_condensed(responses["page"], condense), f"wiki page {page_id}")
+
+    parent = None
+    if page.get("parentPageId"):
+        # the only dependent read: the parent is known once the page is; its title is cached like project pieces
+        response = await SHARED.get(token, "get_wiki_page", wiki_id=wiki_id, page_id=str(page["parentPageId"]))
+        responses["parent"] = response
+        parent_page = _payload(response) or {}
+        parent = {"id": str(page["parentPageId"]), "subject": parent_page.get("subject")}
+
+    document = {
+        "page": {
+            "id": str(page.get("id", page_id)),
+            "subject": page.get("subject"),
+            "version": page.get("version"),
+            "creator": _person(page.get("creator"), names),
+            "created_at": page.get("createdAt"),
+            "updated_at": page.get("updatedAt") or page.get("modifiedAt"),
+            "files": [
+                {"id": str(f.get("id")), "name": f.get("name"), "size": f.get("size")}
+                for f in page.get("files") or () if isinstance(f, dict)
+            ],
+            "body": _body(page),
+            "condensed": (page.get("body") or {}).get("condensed") if isinstance(page.get("body"), dict) else None,
+        },
+        "parent": parent,
+        "children": [
+            {"id": str(p.get("id")), "subject": p.get("subject")}
+            for p in _payload(responses["children"]) or ()
+            if isinstance(p, dict) and str(p.get("parentPageId") or page_id) == str(page_id)
+        ],
+    }
+    if comments:
+        document["comments"] = _compact_comments(_condensed(responses["comments"], condense), names)
+    errors = _errors(responses)
+    if isinstance(directory, dict):
+        errors["directory"] = directory["error"]
+    if errors:
+        document["errors"] = errors
+    return document
+
+
+async def _respond(build):
+    try:
+        return {"dooray_response": await build}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ContextError as e:
+        status = e.status_code if e.status_code in (403, 404) else 502
+        raise HTTPException(status_code=status, detail=str(e))
+
+
+# --- Context API ---
+@router.post("/mcp/context/post")
+async def api_context_post(request: Request):
+    """Body: {"project_id": "...", "post_id": "...", "comments": true, "condense": true | {...} | false}."""
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if not body.get("project_id") or not body.get("post_id"):
+        raise HTTPException(status_code=400, detail="project_id and post_id are required")
+    body = await resolve_request(api_key, body)
+    return await _respond(post_context(
+        api_key, str(body["project_id"]), str(body["post_id"]),
+        body.get("comments", True) is not False, body.get("condense", True),
+    ))
+
+
+@router.post("/mcp/context/project")
+async def api_context_project(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if not body.get("project_id"):
+        raise HTTPException(status_code=400, detail="project_id is required")
+    body = await resolve_request(api_key, body)
+    return await _respond(project_context(api_key, str(body["project_id"])))
+
+
+@router.post("/mcp/context/wiki_page")
+async def api_context_wiki_page(request: Request):
+    """Body: {"wiki_id": "...", "page_id": "...", "comments": true, "condense": true | {...} | false}."""
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if not body.get("wiki_id") or not body.get("page_id"):
+        raise HTTPException(status_code=400, detail="wiki_id and page_id are required")
+    return await _respond(wiki_page_context(
+        api_key, str(body["wiki_id"]), str(body["page_id"]),
+        body.get("comments", True) is not False, body.get("condense", True),
+    ))
@@ -0,0 +1,309 @@
+"""
+In-memory organization directory index.
+
+Built per token from get_organization_chart and get_members, so resolving a
+person ("Kim in Infra") is a dictionary or bisect lookup instead of an
+upstream call plus a scan of the whole payload. Supported lookups: member
+id, email, name prefix (including Korean given names and initial consonants,
+e.g. "민수" or "ㄱㅁㅅ" for "김민수") and department id / name prefix.
+
+The first lookup for a token builds the index; afterwards lookups are
+answered from memory and an index older than DIRECTORY_REFRESH_SECONDS is
+refreshed in the background. A refresh only re-normalizes members whose
+content hash changed. A token not used for SYNC_TOKEN_TTL is forgotten along
+with its index.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import time
+import unicodedata
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from config import DIRECTORY_REFRESH_SECONDS, SYNC_TOKEN_TTL
+from token_cache import TokenCache
+
+router = APIRouter()
+
+CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+CHILD_DEPARTMENT_KEYS = ("departments", "subDepartments", "children")
+MEMBER_LIST_KEYS = ("members", "users", "organizationMembers")
+# fields only member records carry; a chart node with none of them is a department
+MEMBER_FIELDS = ("organizationMemberId", "memberId", "emailAddress", "email", "externalEmailAddress", "userCode")
+MEMBER_TYPES = ("member", "organizationmember", "user", "person")
+DEPARTMENT_TYPES = ("department", "organization", "group", "team")
+
+
+def normalize(text):
+    return unicodedata.normalize("NFC", str(text or "")).casefold().strip()
+
+
+def _is_hangul(ch):
+    return "가" <= ch <= "힣"
+
+
+def choseong(text):
+    return "".join(CHOSEONG[(ord(ch) - 0xAC00) // 588] if _is_hangul(ch) else ch for ch in text)
+
+
+def name_keys(name):
+    """Search keys for a display name: full name, tokens, Korean given name and initials."""
+    name = normalize(name)
+    if not name:
+        return set()
+    compact = name.replace(" ", "")
+    keys = {name, compact}
+    keys.update(name.split())
+    if compact and all(_is_hangul(ch) for ch in compact):
+        keys.add(choseong(compact))
+        if 2 < len(compact) <= 4:
+            keys.add(compact[1:])  # given name without the family name
+    return keys
+
+
+def _result_list(response):
+    response = dooray_client.payload(response)
+    if isinstance(response, dict):
+        return [response]
+    return response if isinstance(response, list) else []
+
+
+def _member_id(raw):
+    return raw.get("id") or raw.get("organizationMemberId") or raw.get("memberId")
+
+
+def _is_member_node(node):
+    """Whether an org chart node is a member (by its type, else by its fields) rather than a department."""
+    kind = normalize(node.get("type") or node.get("nodeType") or node.get("kind"))
+    if kind in MEMBER_TYPES:
+        return True
+    if kind in DEPARTMENT_TYPES or any(key in node for key in CHILD_DEPARTMENT_KEYS + MEMBER_LIST_KEYS):
+        return False
+    return any(node.get(field) for field in MEMBER_FIELDS)
+
+
+def _walk_org_chart(nodes, departments, memberships, parent=None):
+    """Collects departments and (member, department_id) pairs from a nested org chart payload."""
+    for node in nodes:
+        if not isinstance(node, dict):
+            continue
+        if _is_member_node(node):
+            member = node["member"] if isinstance(node.get("member"), dict) else node
+            if _member_id(member):
+                memberships.append((member, parent))
+            continue
+        department_id = parent
+        if node.get("id"):
+            department_id = str(node["id"])
+            departments[department_id] = {"id": department_id, "name": node.get("name"), "parentId": parent}
+        for key in MEMBER_LIST_KEYS:
+            for member in node.get(key) or []:
+                if isinstance(member, dict):
+                    memberships.append((member.get("member", member), department_id))
+        for key in CHILD_DEPARTMENT_KEYS:
+            _walk_org_chart(node.get(key) or [], departments, memberships, department_id)
+
+
+class DirectoryIndex:
+    def __init__(self):
+        self.members = {}          # id -> entry
+        self.hashes = {}           # id -> content hash of the merged raw record
+        self.by_email = {}
+        self.departments = {}      # id -> {"id", "name", "parentId"}
+        self.by_department = {}    # department id -> set(member ids)
+        self.children = {}         # department id -> [sub-department ids]
+        self.name_index = []       # sorted [(key, member id)]
+        self.department_index = []  # sorted [(normalized name, department id)]
+        self.built_at = 0.0
+        self.stats = {}
+
+    def rebuild(self, org_chart, members, previous=None):
+        """Fills this index; entries whose content hash is unchanged in `previous` are reused."""
+        started = time.perf_counter()
+        departments, memberships = {}, []
+        _walk_org_chart(_result_list(org_chart), departments, memberships)
+
+        merged = {}
+        member_departments = {}
+        for raw, department_id in memberships:
+            member_id = str(_member_id(raw))
+            merged.setdefault(member_id, {}).update(raw)
+            if department_id:
+                member_departments.setdefault(member_id, set()).add(department_id)
+        for raw in _result_list(members):
+            if isinstance(raw, dict) and _member_id(raw):
+                member_id = str(_member_id(raw))
+                merged.setdefault(member_id, {}).update(raw)
+                for key in ("departmentId", "department"):
+                    value = raw.get(key)
+                    value = value.get("id") if isinstance(value, dict) else value
+                    if value:
+                        member_departments.setdefault(member_id, set()).add(str(value))
+
+        entries, hashes, changed = {}, {}, 0
+        for member_id, raw in merged.items():
+            digest = hashlib.sha1(json.dumps(raw, sort_keys=True, default=str).encode()).hexdigest()
+            department_ids = sorted(member_departments.get(member_id, ()))
+            old = previous.members.get(member_id) if previous else None
+            if old is not None and previous.hashes.get(member_id) == digest and old["departmentIds"] == department_ids:
+                entries[member_id] = old
+            else:
+                changed += 1
+                entries[member_id] = {
+                    "id": member_id,
+                    "name": raw.get("name") or raw.get("displayName"),
+                    "email": raw.get("emailAddress") or raw.get("email") or raw.get("externalEmailAddress"),
+                    "departmentIds": department_ids,
+                    "member": raw,
+                }
+            hashes[member_id] = digest
+
+        by_email, by_department, name_index = {}, {}, []
+        for member_id, entry in entries.items():
+            if entry["email"]:
+                by_email[normalize(entry["email"])] = member_id
+                name_index.append((normalize(entry["email"]).split("@")[0], member_id))
+            for department_id in entry["departmentIds"]:
+                by_department.setdefault(department_id, set()).add(member_id)
+            name_index.extend((key, member_id) for key in name_keys(entry["name"]))
+        name_index.sort()
+        department_index = sorted(
+            (key, department_id) for department_id, department in departments.items() for key in name_keys(department["name"])
+        )
+
+        children = {}
+        for department_id, department in departments.items():
+            if department["parentId"]:
+                children.setdefault(department["parentId"], []).append(department_id)
+
+        removed = len(set(previous.members) - set(entries)) if previous else 0
+        self.members, self.hashes, self.by_email = entries, hashes, by_email
+        self.departments, self.by_department, self.children = departments, by_department, children
+        self.name_index, self.department_index = name_index, department_index
+        self.built_at = time.time()
+        self.stats = {
+            "members": len(entries), "departments": len(departments), "changed": changed, "removed": removed,
+            "build_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return self.stats
+
+    @staticmethod
+    def _prefix(index, prefix):
+        """Ids whose keys start with `prefix`, in key order, without duplicates."""
+        prefix = normalize(prefix)
+        found = {}
+        position = bisect.bisect_left(index, (prefix,))
+        while position < len(index) and index[position][0].startswith(prefix):
+            found.setdefault(index[position][1], None)
+            position += 1
+        return list(found)
+
+    def exact_name(self, name):
+        """Ids of every member whose whole display name is `name` (case and spacing ignored)."""
+        wanted = " ".join(normalize(name).split())
+        return [
+            member_id for member_id in self._prefix(self.name_index, wanted)
+            if " ".join(normalize(self.members[member_id]["name"]).split()) == wanted
+        ]
+
+    def department_ids(self, department):
+        """Matching departments (by id or name prefix) and all their sub-departments."""
+        if str(department) in self.departments:
+            matched = [str(department)]
+        else:
+            matched = self._prefix(self.department_index, department)
+        found = dict.fromkeys(matched)
+        pending = list(matched)
+        while pending:
+            parent = pending.pop()
+            for child in self.children.get(parent, ()):
+                if child not in found:
+                    found[child] = None
+                    pending.append(child)
+        return list(found)
+
+    def lookup(self, member_id=None, email=None, name=None, department=None, limit=20):
+        if member_id:
+            candidates = [str(member_id)] if str(member_id) in self.members else []
+        elif email:
+            found = self.by_email.get(normalize(email))
+            candidates = [found] if found else []
+        elif name:
+            candidates = self._prefix(self.name_index, name)
+        elif department:
+            candidates = sorted({m for d in self.department_ids(department) for m in self.by_department.get(d, ())})
+        else:
+            candidates = []
+
+        if department and (member_id or email or name):
+            allowed = {m for d in self.department_ids(department) for m in self.by_department.get(d, ())}
+            candidates = [m for m in candidates if m in allowed]
+
+        results = []
+        for candidate in candidates[:limit]:
+            entry = dict(self.members[candidate])
+            entry["departments"] = [self.departments[d]["name"] for d in entry["departmentIds"] if d in self.departments]
+            results.append(entry)
+        return results
+
+
+class DirectoryService:
+    """Per-token directory indexes with single-flight background refresh (token_cache.TokenCache)."""
+
+    def __init__(self, refresh_seconds=DIRECTORY_REFRESH_SECONDS, token_ttl=SYNC_TOKEN_TTL):
+        self.cache = TokenCache(self._build, refresh_seconds, idle_ttl=token_ttl, name="directory index")
+
+    @staticmethod
+    async def _build(token, previous=None):
+        org_chart, members = await asyncio.gather(
+            run_in_threadpool(dooray_client.get_organization_chart, token),
+            run_in_threadpool(dooray_client.get_members, token),
+        )
+        # Built off the event loop and swapped in whole, so readers never see a half-built index
+        index = DirectoryIndex()
+        await run_in_threadpool(index.rebuild, org_chart, members, previous)
+        return index
+
+    async def get(self, token, force_refresh=False):
+        return await self.cache.get(token, force_refresh=force_refresh)
+
+    def invalidate(self, token):
+        self.cache.invalidate(token)
+
+
+DIRECTORY = DirectoryService()
+
+
+async def lookup_members(token, member_id=None, email=None, name=None, department=None, limit=20, refresh=False):
+    index = await DIRECTORY.get(token, force_refresh=refresh)
+    started = time.perf_counter()
+    results = index.lookup(member_id, email, name, department, limit)
+    return {
+        "results": results,
+        "count": len(results),
+        "lookup_us": round((time.perf_counter() - started) * 1_000_000, 1),
+        "index": dict(index.stats, built_at=index.built_at),
+    }
+
+
+# --- Directory API ---
+@router.post("/mcp/organization_chart/lookup")
+async def api_lookup_members(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    member_id = body.get("member_id")
+    email = body.get("email")
+    name = body.get("name")
+    department = body.get("department")
+    if not any([member_id, email, name, department]):
+        raise HTTPException(status_code=400, detail="one of member_id, email, name or department is required")
+    try:
+        result = await lookup_members(api_key, member_id, email, name, department, int(body.get("limit", 20)), bool(body.get("refresh")))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": result}
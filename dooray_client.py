@@ -1,11 +1,10 @@
-import os
-import requests
-from dotenv import load_dotenv
+import time
+import capture
 from config import DOORAY_BASE_URL
 
-load_dotenv()
-
 def _call_dooray_api(access_token: str, method, endpoint, json_data=None, params=None, files=None):
+    import requests # Deferred: requests is the slowest import on the cold-start path
+
     headers = {
         "Authorization": f"dooray-api {access_token}"
     }
@@ -14,6 +13,8 @@ def _call_dooray_api(access_token: str, method, endpoint, json_data=None, params
 
     url = f"{DOORAY_BASE_URL}{endpoint}"
 
+    response = None
+    started = time.perf_counter()
     try:
         if method == "GET":
             response = requests.get(url, headers=headers, params=params)
@@ -41,6 +42,71 @@ def _call_dooray_api(access_token: str, method, endpoint, json_data=None, params
         }
     except requests.exceptions.RequestException as e:
         return {"error": f"Network or request error: {e}"}
+    finally:
+        capture.record_upstream(
+            method, endpoint, params, json_data,
+            response.status_code if response is not None else None,
+            (time.perf_counter() - started) * 1000,
+            response.content if response is not None else None,
+        )
+
+def _stream_dooray_download(access_token: str, endpoint, write, params=None, chunk_size=64 * 1024):
+    """
+    Raw download passed to `write(chunk)` as it arrives instead of being buffered.
+    Returns {"bytes": <total>} or the same error dict as _call_dooray_api.
+    """
+    import requests
+
+    headers = {"Authorization": f"dooray-api {access_token}"}
+    url = f"{DOORAY_BASE_URL}{endpoint}"
+    params = dict(params or {}, media="raw")
+
+    response = None
+    total = 0
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, headers=headers, params=params, stream=True)
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size):
+            write(chunk)
+            total += len(chunk)
+        return {"bytes": total}
+    except requests.exceptions.HTTPError as e:
+        return {
+            "error": "API request failed",
+            "status_code": e.response.status_code,
+            "response": e.response.text
+        }
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Network or request error: {e}"}
+    finally:
+        if response is not None:
+            response.close()
+        capture.record_upstream(
+            "GET", endpoint, params, None,
+            response.status_code if response is not None else None,
+            (time.perf_counter() - started) * 1000,
+            None,  # the body went to `write`, it is not kept
+        )
+
+class DoorayError(RuntimeError):
+    """An error dict returned by _call_dooray_api, raised by `unwrap`/`payload`."""
+
+    def __init__(self, response):
+        super().__init__(str(response.get("response", response["error"])))
+        self.error = response["error"]
+        self.status_code = response.get("status_code")
+
+def unwrap(response):
+    """`response`, or DoorayError when it is an error dict."""
+    if isinstance(response, dict) and "error" in response:
+        raise DoorayError(response)
+    return response
+
+def payload(response):
+    """The `result` of a response (the response itself when it has none); DoorayError on errors."""
+    response = unwrap(response)
+    return response.get("result", response) if isinstance(response, dict) else response
 
 # --- Common API ---
 def get_members(access_token: str):
@@ -85,8 +151,12 @@ def get_drive_list(access_token: str, type: str = "private"):
 def get_drive(access_token: str, drive_id: str):
     return _call_dooray_api(access_token, "GET", f"/drive/v1/drives/{drive_id}")
 
-def get_drive_files(access_token: str, drive_id: str):
-    return _call_dooray_api(access_token, "GET", f"/drive/v1/drives/{drive_id}/files")
+def get_drive_files(access_token: str, drive_id: str, parent_id: str = None, page: int = None, size: int = None):
+    params = {}
+    if parent_id: params["parentId"] = parent_id
+    if page is not None: params["page"] = page
+    if size is not None: params["size"] = size
+    return _call_dooray_api(access_token, "GET", f"/drive/v1/drives/{drive_id}/files", params=params or None)
 
 def get_drive_file_metadata(access_token: str, drive_id: str, file_id: str):
     return _call_dooray_api(access_token, "GET", f"/drive/v1/drives/{drive_id}/files/{file_id}", params={"media": "meta"})
@@ -94,6 +164,9 @@ def get_drive_file_metadata(access_token: str, drive_id: str, file_id: str):
 def download_drive_file(access_token: str, drive_id: str, file_id: str):
     return _call_dooray_api(access_token, "GET", f"/drive/v1/drives/{drive_id}/files/{file_id}", params={"media": "raw"})
 
+def download_drive_file_to(access_token: str, drive_id: str, file_id: str, write):
+    return _stream_dooray_download(access_token, f"/drive/v1/drives/{drive_id}/files/{file_id}", write)
+
 # --- Messenger API (1:1 message) ---
 def send_message(access_token: str, recipient_id: str, message: str):
     endpoint = "/messenger/v1/channels/direct-send"
@@ -110,6 +183,31 @@ def get_projects(access_token: str, limit: int = 50, cursor: str = None):
         params["cursor"] = cursor
     return _call_dooray_api(access_token, "GET", "/project/v1/projects", params=params)
 
+def next_cursor(response):
+    """The cursor of the page after `response`, None on the last page."""
+    if not isinstance(response, dict):
+        return None
+    header = response.get("header") if isinstance(response.get("header"), dict) else {}
+    return response.get("nextCursor") or header.get("nextCursor")
+
+def get_all_projects(access_token: str, limit: int = 50):
+    """
+    Every project, following the cursor page by page, as one {"header", "result"} envelope.
+    The first error response is returned as is.
+    """
+    items, cursor, seen = [], None, set()
+    while True:
+        response = get_projects(access_token, limit, cursor)
+        if not isinstance(response, dict) or "error" in response:
+            return response
+        batch = response.get("result")
+        batch = batch if isinstance(batch, list) else []
+        items.extend(batch)
+        cursor = next_cursor(response)
+        if not batch or not cursor or cursor in seen:
+            return {"header": response.get("header"), "result": items, "totalCount": len(items)}
+        seen.add(cursor)
+
 def create_project(access_token: str, name: str, code: str, description: str = None):
     json_data = {
         "name": name,
@@ -149,18 +247,27 @@ def update_project_workflow(access_token: str, project_id: str, workflow_id: str
 def delete_project_workflow(access_token: str, project_id: str, workflow_id: str):
     return _call_dooray_api(access_token, "POST", f"/project/v1/projects/{project_id}/workflows/{workflow_id}/delete")
 
-def get_project_posts(access_token: str, project_id: str):
-    return _call_dooray_api(access_token, "GET", f"/project/v1/projects/{project_id}/posts")
+def get_project_posts(access_token: str, project_id: str, page: int = None, size: int = None):
+    params = {}
+    if page is not None: params["page"] = page
+    if size is not None: params["size"] = size
+    return _call_dooray_api(access_token, "GET", f"/project/v1/projects/{project_id}/posts", params=params or None)
 
 def get_project_post(access_token: str, project_id: str, post_id: str):
     return _call_dooray_api(access_token, "GET", f"/project/v1/projects/{project_id}/posts/{post_id}")
 
-def create_project_post(access_token: str, project_id: str, subject: str, body: str, post_type: str = "task"):
+def create_project_post(access_token: str, project_id: str, subject: str, body: str, post_type: str = "task",
+                        users: dict = None, tag_ids: list = None, due_date: str = None):
     json_data = {
         "subject": subject,
         "body": {"mimeType": "text/x-markdown", "content": body},
         "postType": post_type
     }
+    if users: json_data["users"] = users
+    if tag_ids: json_data["tagIds"] = tag_ids
+    if due_date:
+        json_data["dueDate"] = due_date
+        json_data["dueDateFlag"] = True
     return _call_dooray_api(access_token, "POST", f"/project/v1/projects/{project_id}/posts", json_data)
 
 def update_project_post(access_token: str, project_id: str, post_id: str, subject: str = None, body: str = None):
@@ -198,8 +305,9 @@ def delete_project_post_comment(access_token: str, project_id: str, post_id: str
 def get_wikis(access_token: str):
     return _call_dooray_api(access_token, "GET", "/wiki/v1/wikis")
 
-def get_wiki_pages(access_token: str, wiki_id: str):
-    return _call_dooray_api(access_token, "GET", f"/wiki/v1/wikis/{wiki_id}/pages")
+def get_wiki_pages(access_token: str, wiki_id: str, parent_page_id: str = None):
+    params = {"parentPageId": parent_page_id} if parent_page_id else None
+    return _call_dooray_api(access_token, "GET", f"/wiki/v1/wikis/{wiki_id}/pages", params=params)
 
 def get_wiki_page(access_token: str, wiki_id: str, page_id: str):
     return _call_dooray_api(access_token, "GET", f"/wiki/v1/wikis/{wiki_id}/pages/{page_id}")
@@ -254,6 +362,12 @@ def upload_wiki_page_file(access_token: str, wiki_id: str, page_id: str, file_na
 def get_wiki_page_file(access_token: str, wiki_id: str, page_id: str, file_id: str):
     return _call_dooray_api(access_token, "GET", f"/wiki/v1/wikis/{wiki_id}/pages/{page_id}/files/{file_id}")
 
+def download_wiki_page_file(access_token: str, wiki_id: str, page_id: str, file_id: str):
+    return _call_dooray_api(access_token, "GET", f"/wiki/v1/wikis/{wiki_id}/pages/{page_id}/files/{file_id}", params={"media": "raw"})
+
+def download_wiki_page_file_to(access_token: str, wiki_id: str, page_id: str, file_id: str, write):
+    return _stream_dooray_download(access_token, f"/wiki/v1/wikis/{wiki_id}/pages/{page_id}/files/{file_id}", write)
+
 def delete_wiki_page_file(access_token: str, wiki_id: str, page_id: str, file_id: str):
     return _call_dooray_api(access_token, "DELETE", f"/wiki/v1/wikis/{wiki_id}/pages/{page_id}/files/{file_id}")
 
@@ -0,0 +1,360 @@
+"""
+Recursive drive tree crawler.
+
+get_drive_files lists one folder level, so the crawler walks a drive's folder
+tree with DRIVE_TREE_CONCURRENCY listings in flight (a shared frontier queue
+of folders still to list) and stores the flattened index (path, type, size,
+updatedAt, file ID) per token and drive in SQLite (DRIVE_TREE_DB_PATH).
+
+Refreshes are incremental: a folder whose updatedAt is unchanged since the
+last crawl reuses its stored children instead of being listed again, except
+on a full crawl (every DRIVE_TREE_FULL_INTERVAL seconds, or on request).
+Queries match paths with SQLite GLOB, where `*` also matches across folders.
+"""
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from bulk import NDJSON
+from config import DRIVE_TREE_DB_PATH, DRIVE_TREE_TTL, DRIVE_TREE_FULL_INTERVAL, DRIVE_TREE_CONCURRENCY, DRIVE_TREE_MAX_ENTRIES
+from store import open_store
+
+router = APIRouter()
+
+PAGE_SIZE = 100
+TYPES = ("file", "folder")
+COLUMNS = ("file_id", "parent_id", "path", "name", "type", "size", "updated_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    scope TEXT NOT NULL,
+    drive_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    parent_id TEXT,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    updated_at TEXT,
+    PRIMARY KEY (scope, drive_id, file_id)
+);
+CREATE INDEX IF NOT EXISTS entries_path ON entries (scope, drive_id, path);
+CREATE TABLE IF NOT EXISTS crawls (
+    scope TEXT NOT NULL,
+    drive_id TEXT NOT NULL,
+    crawled_at REAL NOT NULL,
+    full_at REAL NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (scope, drive_id)
+);
+"""
+
+
+def glob_pattern(pattern):
+    """Patterns not starting with / or * match at any depth ("*.pdf", "docs/*")."""
+    pattern = (pattern or "*").strip()
+    return pattern if pattern[:1] in ("/", "*") else "*/" + pattern
+
+
+def glob_escape(text):
+    """`text` as a literal inside a GLOB pattern."""
+    return "".join(f"[{ch}]" if ch in "*?[" else ch for ch in text)
+
+
+class DriveTreeStore:
+    """SQLite copy of crawled drive trees."""
+
+    def __init__(self, path=DRIVE_TREE_DB_PATH):
+        self.conn, self.lock = open_store(path, SCHEMA)
+
+    def entries(self, scope, drive_id):
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM entries WHERE scope = ? AND drive_id = ?", (scope, drive_id),
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def replace(self, scope, drive_id, entries, stats, full):
+        """Swaps in a drive's new index in one transaction, so readers see either the old or the new tree."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE scope = ? AND drive_id = ?", (scope, drive_id))
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO entries (scope, drive_id, {', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(scope, drive_id) + tuple(entry[c] for c in COLUMNS) for entry in entries],
+            )
+            previous = self.conn.execute(
+                "SELECT full_at FROM crawls WHERE scope = ? AND drive_id = ?", (scope, drive_id),
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO crawls (scope, drive_id, crawled_at, full_at, stats) VALUES (?, ?, ?, ?, ?)",
+                (scope, drive_id, now, now if full or previous is None else previous[0], json.dumps(stats)),
+            )
+
+    def crawl_state(self, scope, drive_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT crawled_at, full_at, stats FROM crawls WHERE scope = ? AND drive_id = ?", (scope, drive_id),
+            ).fetchone()
+        if row is None:
+            return {"crawled_at": None, "full_at": None, "stats": None}
+        return {"crawled_at": row[0], "full_at": row[1], "stats": json.loads(row[2])}
+
+    def entry(self, scope, drive_id, file_id):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM entries WHERE scope = ? AND drive_id = ? AND file_id = ?",
+                (scope, drive_id, file_id),
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def query(self, scope, drive_id, pattern="*", type=None, limit=100, offset=0):
+        """(entries whose path matches the glob, in path order, total number of matches)."""
+        where = "scope = ? AND drive_id = ? AND path GLOB ?"
+        args = [scope, drive_id, glob_pattern(pattern)]
+        if type:
+            where += " AND type = ?"
+            args.append(type)
+        with self.lock:
+            total = self.conn.execute(f"SELECT count(*) FROM entries WHERE {where}", args).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM entries WHERE {where} ORDER BY path LIMIT ? OFFSET ?", args + [limit, offset],
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows], total
+
+
+def _entry(item, parent_id, parent_path):
+    name = str(item.get("name") or item["id"])
+    size = item.get("size")
+    return {
+        "file_id": str(item["id"]),
+        "parent_id": parent_id,
+        "path": f"{parent_path}/{name}",
+        "name": name,
+        "type": "folder" if item.get("type") == "folder" else "file",
+        "size": int(size) if isinstance(size, (int, float)) or str(size).isdigit() else None,
+        "updated_at": item.get("updatedAt") or item.get("lastUpdatedAt") or item.get("createdAt"),
+    }
+
+
+class DriveTreeService:
+    """Per (token, drive) crawls on top of a DriveTreeStore, with at most one crawl per drive at a time."""
+
+    def __init__(self, ttl=DRIVE_TREE_TTL, full_interval=DRIVE_TREE_FULL_INTERVAL,
+                 concurrency=DRIVE_TREE_CONCURRENCY, max_entries=DRIVE_TREE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.full_interval = full_interval
+        self.concurrency = concurrency
+        self.max_entries = max_entries
+        self.store = None
+        self.crawls = {}  # (scope, drive_id) -> running crawl task
+
+    def _store(self):
+        if self.store is None:
+            self.store = DriveTreeStore()
+        return self.store
+
+    async def _list(self, token, drive_id, folder_id):
+        """Every child of a folder (the drive root when folder_id is None), page by page."""
+        items, page = [], 0
+        while True:
+            response = await run_in_threadpool(dooray_client.get_drive_files, token, drive_id, folder_id, page, PAGE_SIZE)
+            batch = dooray_client.payload(response)
+            batch = batch if isinstance(batch, list) else []
+            items.extend(item for item in batch if isinstance(item, dict) and item.get("id"))
+            total = response.get("totalCount") if isinstance(response, dict) else None
+            if len(batch) < PAGE_SIZE or (total is not None and len(items) >= total):
+                return items
+            page += 1
+
+    async def _crawl(self, scope, token, drive_id, full):
+        started = time.perf_counter()
+        store = self._store()
+        state = await run_in_threadpool(store.crawl_state, scope, drive_id)
+        full = full or state["full_at"] is None or time.time() - state["full_at"] > self.full_interval
+        previous = {} if full else await run_in_threadpool(store.entries, scope, drive_id)
+        known = {entry["file_id"]: entry for entry in previous} if previous else {}
+        children = {}
+        for entry in previous:
+            children.setdefault(entry["parent_id"], []).append(entry)
+
+        entries = []
+        stats = {"listed": 0, "reused": 0, "errors": 0, "truncated": False, "full": full}
+        frontier = asyncio.Queue()
+        frontier.put_nowait((None, "", None))  # (folder id, path, updatedAt)
+
+        def add(entry):
+            if len(entries) >= self.max_entries:
+                stats["truncated"] = True
+                return
+            entries.append(entry)
+            if entry["type"] == "folder":
+                frontier.put_nowait((entry["file_id"], entry["path"], entry["updated_at"]))
+
+        async def visit(folder_id, path, updated_at):
+            old = known.get(folder_id)
+            if folder_id is not None and old and updated_at and old["updated_at"] == updated_at and old["path"] == path:
+                stats["reused"] += 1
+                for child in children.get(folder_id, ()):
+                    add(child)
+                return
+            try:
+                items = await self._list(token, drive_id, folder_id)
+            except RuntimeError as e:
+                if folder_id is None:
+                    raise
+                stats["errors"] += 1
+                print(f"Error listing drive folder {folder_id}: {e}")
+                items = None
+            if items is None:  # keep what we knew rather than dropping the subtree
+                for child in children.get(folder_id, ()):
+                    add(dict(child, path=f"{path}/{child['name']}"))
+                return
+            stats["listed"] += 1
+            for item in items:
+                add(_entry(item, folder_id, path))
+
+        failure = []
+
+        async def worker():
+            while True:
+                folder = await frontier.get()
+                try:
+                    if not failure:
+                        await visit(*folder)
+                except Exception as e:
+                    failure.append(e)
+                finally:
+                    frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, self.concurrency))]
+        try:
+            await frontier.join()
+        finally:
+            for task in workers:
+                task.cancel()
+        if failure:
+            raise failure[0]
+
+        stats.update(entries=len(entries), crawl_ms=round((time.perf_counter() - started) * 1000, 2))
+        await run_in_threadpool(store.replace, scope, drive_id, entries, stats, full)
+        return stats
+
+    async def _run_crawl(self, key, token, full):
+        try:
+            return await self._crawl(key[0], token, key[1], full)
+        except Exception as e:
+            print(f"Error crawling drive {key[1]}: {e}")
+            return {"error": str(e)}
+        finally:
+            self.crawls.pop(key, None)
+
+    def crawl(self, token, drive_id, full=False):
+        """Starts a crawl of the drive unless one is already running; returns its task."""
+        key = (token_scope(token), str(drive_id))
+        if key not in self.crawls:
+            self.crawls[key] = asyncio.create_task(self._run_crawl(key, token, full))
+        return self.crawls[key]
+
+    async def ensure(self, token, drive_id, refresh=False):
+        """Crawl state of the drive, waiting for a crawl when there is no index yet (or refresh is asked)."""
+        scope, drive_id = token_scope(token), str(drive_id)
+        state = await run_in_threadpool(self._store().crawl_state, scope, drive_id)
+        if state["crawled_at"] is None or refresh:
+            stats = await asyncio.shield(self.crawl(token, drive_id))
+            if "error" in stats:
+                raise RuntimeError(stats["error"])
+            state = await run_in_threadpool(self._store().crawl_state, scope, drive_id)
+        elif time.time() - state["crawled_at"] > self.ttl:
+            self.crawl(token, drive_id)
+        return dict(state, crawling=(scope, drive_id) in self.crawls)
+
+    async def query(self, token, drive_id, pattern="*", type=None, limit=100, offset=0, refresh=False):
+        state = await self.ensure(token, drive_id, refresh)
+        entries, total = await run_in_threadpool(
+            self._store().query, token_scope(token), str(drive_id), pattern, type, limit, offset,
+        )
+        return {"entries": entries, "total": total, "limit": limit, "offset": offset, "index": state}
+
+    async def stream(self, token, drive_id, pattern="*", type=None, chunk=1000):
+        """Every matching entry in path order, read from the index chunk by chunk."""
+        offset = 0
+        while True:
+            entries, _ = await run_in_threadpool(
+                self._store().query, token_scope(token), str(drive_id), pattern, type, chunk, offset,
+            )
+            for entry in entries:
+                yield entry
+            if len(entries) < chunk:
+                return
+            offset += chunk
+
+    async def files_under(self, token, drive_id, folder_id=None, path=None):
+        """(files anywhere below a folder, given by ID or path, the folder's path); ValueError when it is unknown."""
+        await self.ensure(token, drive_id)
+        if folder_id:
+            folder = await run_in_threadpool(self._store().entry, token_scope(token), str(drive_id), str(folder_id))
+            if folder is None or folder["type"] != "folder":
+                raise ValueError(f"folder {folder_id} not found in drive {drive_id}")
+            path = folder["path"]
+        path = "/" + str(path or "").strip("/") if str(path or "").strip("/") else ""
+        files = [entry async for entry in self.stream(token, drive_id, glob_escape(path) + "/*", "file")]
+        return files, path
+
+
+DRIVE_TREE = DriveTreeService()
+
+
+def _tree_arguments(body):
+    if not body.get("drive_id"):
+        raise HTTPException(status_code=400, detail="drive_id is required")
+    if body.get("type") and body["type"] not in TYPES:
+        raise HTTPException(status_code=400, detail="type must be file or folder")
+    try:
+        limit = min(1000, max(1, int(body.get("limit", 100))))
+        offset = max(0, int(body.get("offset", 0)))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="limit and offset must be integers")
+    return str(body["drive_id"]), body.get("pattern") or "*", body.get("type"), limit, offset
+
+
+# --- Drive Tree API ---
+@router.post("/mcp/drive/tree")
+async def api_drive_tree(request: Request):
+    """Flattened drive index; with Accept: application/x-ndjson every match is streamed, one entry per line."""
+    api_key = _get_api_key(request)
+    body = await request.json()
+    drive_id, pattern, type, limit, offset = _tree_arguments(body)
+    try:
+        if NDJSON in request.headers.get("accept", ""):
+            await DRIVE_TREE.ensure(api_key, drive_id, bool(body.get("refresh")))
+
+            async def lines():
+                async for entry in DRIVE_TREE.stream(api_key, drive_id, pattern, type):
+                    yield json.dumps(entry, ensure_ascii=False) + "\n"
+            return StreamingResponse(lines(), media_type=NDJSON)
+        result = await DRIVE_TREE.query(api_key, drive_id, pattern, type, limit, offset, bool(body.get("refresh")))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": result}
+
+
+@router.post("/mcp/drive/tree/crawl")
+async def api_drive_tree_crawl(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if not body.get("drive_id"):
+        raise HTTPException(status_code=400, detail="drive_id is required")
+    task = DRIVE_TREE.crawl(api_key, body["drive_id"], bool(body.get("full")))
+    if not body.get("wait"):
+        return {"dooray_response": {"crawling": True}}
+    stats = await asyncio.shield(task)
+    if "error" in stats:
+        raise HTTPException(status_code=502, detail=stats["error"])
+    return {"dooray_response": stats}
@@ -0,0 +1,385 @@
+"""
+Content-addressed on-disk cache for drive and wiki file downloads.
+
+A download is keyed by source (drive / wiki), container, file ID and the
+file's version (its updatedAt from the metadata call, which also checks that
+the token may read the file). The key points at a blob stored under its
+SHA-256 in FILE_CACHE_DIR, so identical content is stored once. Blobs are
+evicted least recently used first once they exceed FILE_CACHE_MAX_BYTES,
+except blobs pinned until their readers have opened them: the blob just
+added, a hit being sent and a finished download whose waiters are still to
+open it. An opened blob stays readable when it is evicted (the handle keeps
+the data), so a file larger than the cache is still served whole.
+
+Hits are answered with FileResponse, which hands the file to the server
+(sendfile / pathsend where the server supports it). Concurrent misses of the
+same key share one upstream download: it is written to a temporary file that
+every waiter reads while it grows, and becomes the blob when complete.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from config import FILE_CACHE_DIR, FILE_CACHE_DB_PATH, FILE_CACHE_MAX_BYTES
+from routes import file_server
+from store import open_store
+
+CHUNK_SIZE = 64 * 1024
+
+# source -> (metadata function, streaming download function, id kwargs in order)
+SOURCES = {
+    "drive": (dooray_client.get_drive_file_metadata, dooray_client.download_drive_file_to, ("drive_id", "file_id")),
+    "wiki": (dooray_client.get_wiki_page_file, dooray_client.download_wiki_page_file_to, ("wiki_id", "page_id", "file_id")),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    source TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (source, file_key)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+"""
+
+
+def file_version(meta):
+    """What identifies one version of a file: its modification time, else its size (name kept as a tie-breaker)."""
+    for field in ("updatedAt", "lastUpdatedAt", "modifiedAt", "createdAt"):
+        if meta.get(field):
+            return str(meta[field])
+    return f"{meta.get('size')}:{meta.get('name')}"
+
+
+class BlobIndex:
+    """File key -> blob digest and blob LRU bookkeeping."""
+
+    def __init__(self, path=FILE_CACHE_DB_PATH, directory=FILE_CACHE_DIR, max_bytes=FILE_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.conn, self.lock = open_store(path, SCHEMA)
+        self.pins = {}  # digest -> readers that still have to open the blob; never evicted meanwhile
+        for name in os.listdir(directory):
+            if name.endswith(".part"):  # left behind by a download that was cut off
+                os.unlink(os.path.join(directory, name))
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _pin(self, digest):
+        self.pins[digest] = self.pins.get(digest, 0) + 1
+
+    def release(self, path):
+        """Drops one pin of the blob at `path` (see lookup and add)."""
+        digest = os.path.basename(path)
+        with self.lock:
+            if self.pins.get(digest, 0) > 1:
+                self.pins[digest] -= 1
+            else:
+                self.pins.pop(digest, None)
+
+    def lookup(self, source, file_key, version, pin=False):
+        """
+        Path of the cached blob for this file version (marking it recently used), or None.
+        With `pin` the blob is not evicted until `release(path)`.
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT digest FROM files WHERE source = ? AND file_key = ? AND version = ?", (source, file_key, version),
+            ).fetchone()
+            if row is None or not os.path.exists(self.blob_path(row[0])):
+                return None
+            self.conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), row[0]))
+            if pin:
+                self._pin(row[0])
+        return self.blob_path(row[0])
+
+    def add(self, source, file_key, version, temp_path, digest, size):
+        """
+        Moves a completed download into the blob store and points the file key at it; returns the
+        blob path, pinned (it survives the eviction this triggers) until `release(path)`.
+        """
+        path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(temp_path)  # same content already cached under another key
+        else:
+            os.replace(temp_path, path)
+        with self.lock, self.conn:
+            self._pin(digest)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)", (digest, size, time.time()),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (source, file_key, version, digest) VALUES (?, ?, ?, ?)",
+                (source, file_key, version, digest),
+            )
+        self.evict()
+        return path
+
+    def evict(self):
+        """
+        Drops unreferenced blobs, then least recently used ones until the cache fits in max_bytes.
+        Pinned blobs are kept, even when that leaves the cache above max_bytes for now.
+        """
+        with self.lock, self.conn:
+            doomed = [row[0] for row in self.conn.execute(
+                "SELECT digest FROM blobs WHERE digest NOT IN (SELECT digest FROM files)",
+            ) if row[0] not in self.pins]
+            total = self.conn.execute(
+                "SELECT coalesce(sum(size), 0) FROM blobs WHERE digest IN (SELECT digest FROM files)",
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                for digest, size in self.conn.execute(
+                    "SELECT digest, size FROM blobs WHERE digest IN (SELECT digest FROM files) ORDER BY last_access",
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    if digest in self.pins:
+                        continue
+                    doomed.append(digest)
+                    total -= size
+            self.conn.executemany("DELETE FROM files WHERE digest = ?", [(d,) for d in doomed])
+            self.conn.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d in doomed])
+        for digest in doomed:
+            try:
+                os.unlink(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+        return len(doomed)
+
+
+class Download:
+    """One upstream download in progress, readable by any number of waiters while it is written."""
+
+    def __init__(self, temp_path):
+        self.temp_path = temp_path
+        self.final_path = None
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.event = asyncio.Event()
+        self.readers = 0     # waiters that have not opened the file yet
+        self.release = None  # unpins the finished blob once every waiter has opened it
+
+    def join(self):
+        """Registers a waiter; it calls `opened()` once it holds a handle (or gives up)."""
+        self.readers += 1
+
+    def opened(self):
+        self.readers -= 1
+        self._release_if_idle()
+
+    def _release_if_idle(self):
+        if self.done and self.readers <= 0 and self.release is not None:
+            release, self.release = self.release, None
+            release()
+
+    def advance(self, written=None):
+        if written is not None:
+            self.written = written
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    def finish(self, final_path=None, error=None, release=None):
+        self.final_path, self.error, self.done = final_path, error, True
+        self.release = release
+        self.advance()
+        self._release_if_idle()
+
+    async def started(self):
+        """Waits for the first bytes (or the end), so an upstream error can still become the HTTP status."""
+        while not self.written and not self.done:
+            await self.event.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def finished(self):
+        while not self.done:
+            await self.event.wait()
+        if self.error is not None:
+            raise self.error
+
+    def _open(self):
+        if self.final_path:
+            return open(self.final_path, "rb")
+        try:
+            return open(self.temp_path, "rb")
+        except FileNotFoundError:  # moved into the blob store in the meantime
+            return None
+
+    async def open(self):
+        """A handle on the file (None when the download failed) for a waiter registered with `join`."""
+        try:
+            handle = self._open()
+            while handle is None and not self.done:
+                await self.event.wait()
+                handle = self._open()
+            return handle
+        finally:
+            self.opened()
+
+    async def read(self):
+        """
+        The file's bytes from the start, following the download until it completes, for a waiter
+        registered with `join`. Raises the download's error when it fails, so a response cut short
+        is not sent as complete.
+        """
+        handle = await self.open()
+        if self.error is not None:
+            if handle is not None:
+                handle.close()
+            raise self.error
+        if handle is None:
+            return
+        try:
+            position = 0
+            while True:
+                event = self.event
+                if self.error is not None:
+                    raise self.error
+                if position < self.written or self.done:
+                    chunk = await run_in_threadpool(handle.read, CHUNK_SIZE)
+                    if chunk:
+                        position += len(chunk)
+                        yield chunk
+                        continue
+                    if self.done:
+                        return
+                await event.wait()
+        finally:
+            handle.close()
+
+
+class FileCache:
+    def __init__(self):
+        self.index = None
+        self.downloads = {}  # (source, file_key, version) -> Download in progress
+        self.tasks = set()
+
+    def _index(self):
+        if self.index is None:
+            self.index = BlobIndex()
+        return self.index
+
+    async def _download(self, token, source, ids, key, download):
+        loop = asyncio.get_running_loop()
+        hasher = hashlib.sha256()
+        handle = open(download.temp_path, "wb")
+        written = 0
+
+        def write(chunk):
+            nonlocal written
+            handle.write(chunk)
+            handle.flush()
+            hasher.update(chunk)
+            written += len(chunk)
+            loop.call_soon_threadsafe(download.advance, written)
+
+        try:
+            try:
+                result = await run_in_threadpool(SOURCES[source][1], token, *ids, write)
+            finally:
+                handle.close()
+            if isinstance(result, dict) and "error" in result:
+                raise HTTPException(status_code=result.get("status_code", 502), detail=result["error"])
+            path = await run_in_threadpool(self._index().add, *key, download.temp_path, hasher.hexdigest(), written)
+            download.finish(final_path=path, release=lambda: self._index().release(path))
+        except Exception as e:
+            if os.path.exists(download.temp_path):
+                os.unlink(download.temp_path)
+            download.finish(error=e)
+        finally:
+            self.downloads.pop(key, None)
+
+    async def _lookup(self, token, source, kwargs):
+        """
+        (metadata, path of the cached blob or the shared Download filling it, "hit" | "shared" | "miss").
+        A hit's blob is pinned until released; the caller is a registered waiter of a Download.
+        """
+        meta_func, _, id_fields = SOURCES[source]
+        ids = [str(kwargs[field]) for field in id_fields]
+        try:
+            meta = dooray_client.payload(await run_in_threadpool(meta_func, token, *ids))
+        except dooray_client.DoorayError as e:
+            raise HTTPException(status_code=e.status_code or 502, detail=e.error)
+        meta = meta if isinstance(meta, dict) else {}
+        key = (source, "/".join(ids), file_version(meta))
+
+        path = await run_in_threadpool(self._index().lookup, *key, True)
+        if path is not None:
+            return meta, path, "hit"
+        download = self.downloads.get(key)
+        if download is not None:
+            download.join()
+            return meta, download, "shared"
+        descriptor, temp_path = tempfile.mkstemp(dir=self._index().directory, suffix=".part")
+        os.close(descriptor)
+        download = self.downloads[key] = Download(temp_path)
+        download.join()
+        task = asyncio.create_task(self._download(token, source, ids, key, download))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return meta, download, "miss"
+
+    async def serve(self, token, source, kwargs):
+        """Response for one file download: from the cache, or streamed while the (shared) fetch fills it."""
+        meta, found, status = await self._lookup(token, source, kwargs)
+        media_type = meta.get("mimeType") or "application/octet-stream"
+        if status == "hit":
+            release = BackgroundTask(self._index().release, found)
+            return FileResponse(found, media_type=media_type, headers={"X-Cache": status}, background=release)
+        try:
+            await found.started()
+        except Exception:
+            found.opened()  # the stream below is never read
+            raise
+        return StreamingResponse(found.read(), media_type=media_type, headers={"X-Cache": status})
+
+    async def fetch(self, token, source, kwargs):
+        """
+        (metadata, open binary handle on the cached blob) once the file is in the cache; the blob's
+        name (handle.name) is its SHA-256. The handle keeps the content readable if the blob is
+        evicted before the caller is done; the caller closes it.
+        """
+        meta, found, _ = await self._lookup(token, source, kwargs)
+        if isinstance(found, Download):
+            try:
+                await found.finished()
+            except Exception:
+                found.opened()
+                raise
+            handle = await found.open()
+        else:
+            try:
+                handle = open(found, "rb")
+            finally:
+                self._index().release(found)
+        return meta, handle
+
+
+FILE_CACHE = FileCache()
+
+
+@file_server("download_drive_file")
+async def _serve_drive_file(api_key, kwargs):
+    return await FILE_CACHE.serve(api_key, "drive", kwargs)
+
+
+@file_server("download_wiki_page_file")
+async def _serve_wiki_page_file(api_key, kwargs):
+    return await FILE_CACHE.serve(api_key, "wiki", kwargs)
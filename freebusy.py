@@ -0,0 +1,301 @@
+"""
+Calendar free/busy and conflict computation.
+
+Fetches the events of several calendars (and/or the events of specific
+members from the "*" calendar) for one time window concurrently, merges the
+busy intervals with a sorted sweep and answers with free slots, each
+participant's busy blocks and conflicts in one response.
+
+Fetched event windows are cached per token and calendar for
+FREEBUSY_CACHE_TTL seconds; a request whose window lies inside a cached one
+is answered without an upstream call. create/update/delete_calendar_event
+calls made through this server drop the cached windows of that calendar.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from config import FREEBUSY_CACHE_TTL, FREEBUSY_MAX_WINDOWS
+from routes import on_success
+from resolver import resolve_request
+
+router = APIRouter()
+
+ALL_CALENDARS = "*"
+# Dooray timestamps carry an offset; times without one are read as KST
+DEFAULT_TZ = timezone(timedelta(hours=9))
+
+
+def parse_time(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        value = str(value).strip().replace("Z", "+00:00")
+        parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=DEFAULT_TZ)
+
+
+def format_time(value):
+    return value.isoformat(timespec="seconds")
+
+
+def _event_interval(event):
+    """(start, end) of an event; whole-day events cover their days from midnight."""
+    start, end = parse_time(event["startedAt"]), parse_time(event["endedAt"])
+    if event.get("wholeDayFlag"):
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        if end.time() != datetime.min.time() or end == start:
+            end = end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return start, end
+
+
+def _event_members(event):
+    """organizationMemberIds found anywhere under the event's users (from / to / cc)."""
+    found = set()
+    pending = [event.get("users")]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            if value.get("organizationMemberId"):
+                found.add(str(value["organizationMemberId"]))
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return found
+
+
+def merge_intervals(intervals):
+    """Sorted sweep: overlapping or touching (start, end) pairs become one."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def parse_zone(value):
+    """A UTC offset ("+09:00") or an IANA zone name ("Asia/Seoul")."""
+    value = str(value).strip()
+    if value[:1] in "+-":
+        return datetime.strptime(value.replace(":", ""), "%z").tzinfo
+    try:
+        return ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {value!r}")
+
+
+def free_slots(busy, window_start, window_end, min_duration=timedelta(0), working_hours=None, tz=DEFAULT_TZ):
+    """
+    Gaps between merged `busy` intervals inside the window, optionally clipped to daily
+    working hours, which are wall-clock times in `tz` whatever the window's offset.
+    """
+    gaps, cursor = [], window_start
+    for start, end in merge_intervals(busy):
+        if start > cursor:
+            gaps.append((cursor, min(start, window_end)))
+        cursor = max(cursor, end)
+        if cursor >= window_end:
+            break
+    if cursor < window_end:
+        gaps.append((cursor, window_end))
+
+    if working_hours:
+        day_start, day_end = working_hours
+        clipped = []
+        for start, end in gaps:
+            start, end = start.astimezone(tz), end.astimezone(tz)
+            day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < end:
+                open_at = max(start, day.replace(hour=day_start.hour, minute=day_start.minute))
+                close_at = min(end, day.replace(hour=day_end.hour, minute=day_end.minute))
+                if open_at < close_at:
+                    clipped.append((open_at, close_at))
+                day += timedelta(days=1)
+        gaps = clipped
+    return [(start, end) for start, end in gaps if end > start and end - start >= min_duration]
+
+
+def find_conflicts(events):
+    """Overlapping events of one participant (double bookings), found with a sweep over start times."""
+    conflicts = []
+    active = []  # (end, event) of events still running at the sweep position
+    for start, end, event in sorted(events, key=lambda e: (e[0], e[1])):
+        active = [(active_end, other) for active_end, other in active if active_end > start]
+        for active_end, other in active:
+            conflicts.append({
+                "start": format_time(start), "end": format_time(min(end, active_end)),
+                "events": [_summary(other), _summary(event)],
+            })
+        active.append((end, event))
+    return conflicts
+
+
+def _summary(event):
+    return {"id": event.get("id"), "subject": event.get("subject")}
+
+
+class EventWindowCache:
+    """Per (token, calendar) event windows with TTL, de-duplicated in-flight fetches and invalidation."""
+
+    def __init__(self, ttl=FREEBUSY_CACHE_TTL, max_windows=FREEBUSY_MAX_WINDOWS):
+        self.ttl = ttl
+        self.max_windows = max_windows
+        self.windows = {}   # (scope, calendar_id) -> [(start, end, fetched_at, events)]
+        self.inflight = {}  # (scope, calendar_id, start, end) -> future
+        self.generation = {}  # (scope, calendar_id) -> bumped on invalidation
+
+    def _cached(self, key, start, end):
+        now = time.monotonic()
+        windows = [w for w in self.windows.get(key, ()) if now - w[2] < self.ttl]
+        self.windows[key] = windows
+        for window_start, window_end, _, events in windows:
+            if window_start <= start and end <= window_end:
+                return events
+        return None
+
+    async def _fetch(self, token, key, calendar_id, start, end):
+        generation = self.generation.get(key, 0)
+        response = await run_in_threadpool(
+            dooray_client.get_calendar_events, token, calendar_id, format_time(start), format_time(end),
+        )
+        events = dooray_client.payload(response)
+        events = events if isinstance(events, list) else []
+        if self.generation.get(key, 0) == generation:  # not invalidated while we were fetching
+            windows = self.windows.setdefault(key, [])
+            windows.append((start, end, time.monotonic(), events))
+            del windows[:-self.max_windows]
+        return events
+
+    async def events(self, token, calendar_id, start, end):
+        """(events overlapping [start, end), "cache" | "upstream")."""
+        key = (token_scope(token), calendar_id)
+        events = self._cached(key, start, end)
+        source = "cache"
+        if events is None:
+            source = "upstream"
+            flight = key + (start, end)
+            if flight not in self.inflight:
+                self.inflight[flight] = asyncio.ensure_future(self._fetch(token, key, calendar_id, start, end))
+                self.inflight[flight].add_done_callback(lambda _: self.inflight.pop(flight, None))
+            events = await asyncio.shield(self.inflight[flight])
+        overlapping = []
+        for event in events:
+            try:
+                event_start, event_end = _event_interval(event)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if event_start < end and event_end > start:
+                overlapping.append((event_start, event_end, event))
+        return overlapping, source
+
+    def invalidate(self, token, calendar_id):
+        scope = token_scope(token)
+        for key in ((scope, str(calendar_id)), (scope, ALL_CALENDARS)):
+            self.windows.pop(key, None)
+            self.generation[key] = self.generation.get(key, 0) + 1
+
+
+EVENT_WINDOWS = EventWindowCache()
+
+
+@on_success("create_calendar_event", "update_calendar_event", "delete_calendar_event")
+def _on_event_written(api_key, kwargs, result):
+    EVENT_WINDOWS.invalidate(api_key, kwargs.get("calendar_id"))
+
+
+def _parse_clock(value):
+    hour, minute = str(value).split(":")
+    return datetime.min.replace(hour=int(hour), minute=int(minute)).time()
+
+
+async def compute_freebusy(token, time_min, time_max, calendar_ids=(), member_ids=(), min_duration_minutes=30,
+                           working_hours=None, proposed=None):
+    start, end = parse_time(time_min), parse_time(time_max)
+    if end <= start:
+        raise ValueError("time_max must be after time_min")
+    tz = DEFAULT_TZ
+    if working_hours:
+        tz = parse_zone(working_hours["timezone"]) if working_hours.get("timezone") else DEFAULT_TZ
+        working_hours = (_parse_clock(working_hours["start"]), _parse_clock(working_hours["end"]))
+    calendar_ids = [str(c) for c in calendar_ids or ()]
+    member_ids = [str(m) for m in member_ids or ()]
+    fetch_ids = list(dict.fromkeys(calendar_ids + ([ALL_CALENDARS] if member_ids else [])))
+
+    fetched = await asyncio.gather(
+        *(EVENT_WINDOWS.events(token, calendar_id, start, end) for calendar_id in fetch_ids), return_exceptions=True,
+    )
+    participants, sources, errors = {}, {}, {}
+    for calendar_id, outcome in zip(fetch_ids, fetched):
+        if isinstance(outcome, Exception):
+            errors[calendar_id] = str(outcome)
+            continue
+        events, sources[calendar_id] = outcome
+        if calendar_id in calendar_ids:
+            participants[f"calendar:{calendar_id}"] = events
+        if calendar_id == ALL_CALENDARS:
+            for member_id in member_ids:
+                participants[f"member:{member_id}"] = [e for e in events if member_id in _event_members(e[2])]
+
+    all_busy = [(s, e) for events in participants.values() for s, e, _ in events]
+    result = {
+        "window": {"start": format_time(start), "end": format_time(end)},
+        "free": [
+            {"start": format_time(s), "end": format_time(e), "minutes": int((e - s).total_seconds() // 60)}
+            for s, e in free_slots(all_busy, start, end, timedelta(minutes=min_duration_minutes), working_hours, tz)
+        ],
+        "participants": {
+            name: {
+                "events": len(events),
+                "busy": [{"start": format_time(s), "end": format_time(e)} for s, e in merge_intervals((s, e) for s, e, _ in events)],
+                "conflicts": find_conflicts(events),
+            }
+            for name, events in participants.items()
+        },
+        "sources": sources,
+    }
+    if proposed:
+        proposed_start, proposed_end = parse_time(proposed["started_at"]), parse_time(proposed["ended_at"])
+        result["proposed"] = {
+            "start": format_time(proposed_start), "end": format_time(proposed_end),
+            "conflicts": [
+                dict(_summary(event), participant=name, start=format_time(s), end=format_time(e))
+                for name, events in participants.items() for s, e, event in events if s < proposed_end and e > proposed_start
+            ],
+        }
+        result["proposed"]["available"] = not result["proposed"]["conflicts"]
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+# --- Calendar Free/Busy API ---
+@router.post("/mcp/calendar/freebusy")
+async def api_calendar_freebusy(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    calendar_ids = body.get("calendar_ids") or []
+    member_ids = body.get("member_ids") or []
+    if not body.get("time_min") or not body.get("time_max") or not (calendar_ids or member_ids):
+        raise HTTPException(status_code=400, detail="time_min, time_max and calendar_ids or member_ids are required")
+    if not isinstance(calendar_ids, list) or not isinstance(member_ids, list):
+        raise HTTPException(status_code=400, detail="calendar_ids and member_ids must be lists")
+    calendar_ids = (await resolve_request(api_key, {"calendar_ids": calendar_ids}))["calendar_ids"]
+    try:
+        result = await compute_freebusy(
+            api_key, body["time_min"], body["time_max"], calendar_ids, member_ids,
+            int(body.get("min_duration_minutes", 30)), body.get("working_hours"), body.get("proposed"),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    if len(result.get("errors", {})) == len(set(calendar_ids) | ({ALL_CALENDARS} if member_ids else set())):
+        raise HTTPException(status_code=502, detail=result["errors"])
+    return {"dooray_response": result}
@@ -0,0 +1,323 @@
+"""
+Background jobs for operations too slow to hold an HTTP request open.
+
+A job runs an async function in the background and is tracked by ID: state
+(queued, running, completed, failed, cancelled), progress, result and error.
+At most JOBS_PER_TOKEN jobs of one token run at a time; the others wait
+queued. Every state change is written to SQLite (JOBS_DB_PATH), so the status
+and result of a job can still be read after a restart. A job submitted with
+its call (dooray_client function and arguments, as generated routes do) that
+was still queued when its process stopped, or was running but is idempotent,
+is queued again in the next one as soon as its token is seen (tokens
+themselves are not stored); any other job that was running is reported as
+"interrupted".
+
+Cancelling stops the job at its next await. A dooray_client call already
+running in the threadpool cannot be interrupted; it finishes and its result
+is discarded.
+"""
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from auth import _get_api_key, token_scope
+from config import JOBS_DB_PATH, JOBS_PER_TOKEN, JOBS_TTL
+from store import open_store
+
+router = APIRouter()
+
+UNFINISHED = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    call TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_scope ON jobs (scope, created_at);
+"""
+
+
+class JobStore:
+    """SQLite copy of every job."""
+
+    def __init__(self, path=JOBS_DB_PATH, ttl=JOBS_TTL):
+        self.conn, self.lock = open_store(path, SCHEMA)
+        with self.lock, self.conn:
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            if "call" not in columns:  # stores created before calls were kept
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN call TEXT")
+            self.conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - ttl,))
+
+    def save(self, job):
+        """
+        Writes a job snapshot. Writes may land out of order: one never overwrites a finished
+        job, never moves a started job back to queued and never clears its start time.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, scope, kind, state, progress, result, error, created_at, started_at, finished_at, call)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id) DO UPDATE SET state = excluded.state, progress = excluded.progress,"
+                " result = excluded.result, error = excluded.error,"
+                " started_at = COALESCE(excluded.started_at, jobs.started_at), finished_at = excluded.finished_at"
+                " WHERE jobs.finished_at IS NULL AND (excluded.state != 'queued' OR jobs.state = 'queued')",
+                (
+                    job["job_id"], job["scope"], job["kind"], job["state"], json.dumps(job["progress"], ensure_ascii=False),
+                    json.dumps(job["result"], ensure_ascii=False, default=str) if job["result"] is not None else None,
+                    job["error"], job["created_at"], job["started_at"], job["finished_at"], job["call"],
+                ),
+            )
+
+    def rerunnable(self, scope):
+        """
+        (job_id, kind, call, created_at) of the scope's unfinished jobs that can be re-created:
+        those that never started, and those marked idempotent in their call.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT job_id, kind, call, created_at, started_at FROM jobs"
+                " WHERE scope = ? AND state IN ('queued', 'running') AND call IS NOT NULL ORDER BY created_at",
+                (scope,),
+            ).fetchall()
+        jobs = []
+        for job_id, kind, call, created_at, started_at in rows:
+            call = json.loads(call)
+            if started_at is None or call.get("idempotent"):
+                jobs.append((job_id, kind, call, created_at))
+        return jobs
+
+    @staticmethod
+    def _row(row):
+        job_id, kind, state, progress, result, error, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id, "kind": kind, "state": state, "progress": json.loads(progress),
+            "result": json.loads(result) if result is not None else None, "error": error,
+            "created_at": created_at, "started_at": started_at, "finished_at": finished_at,
+        }
+
+    def get(self, job_id, scope):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT job_id, kind, state, progress, result, error, created_at, started_at, finished_at"
+                " FROM jobs WHERE job_id = ? AND scope = ?", (job_id, scope),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, scope, state=None, limit=50):
+        query = "SELECT job_id, kind, state, progress, NULL, error, created_at, started_at, finished_at FROM jobs WHERE scope = ?"
+        args = [scope]
+        if state:
+            query += " AND state = ?"
+            args.append(state)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY created_at DESC LIMIT ?", args + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+
+class Job:
+    # progress is written to SQLite at most this often; state changes are always written
+    PERSIST_INTERVAL = 1.0
+
+    def __init__(self, manager, scope, kind, call=None, job_id=None, created_at=None):
+        self.manager = manager
+        self.id = job_id or uuid.uuid4().hex
+        self.scope = scope
+        self.kind = kind
+        self.call = call  # JSON text of what re-creates the job after a restart, if anything
+        self.state = "queued"
+        self.done, self.total, self.message = 0, None, None
+        self.result = self.error = None
+        self.created_at = created_at or time.time()
+        self.started_at = self.finished_at = None
+        self.task = None
+        self.persisted_at = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Reports progress from inside the job function."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        if time.monotonic() - self.persisted_at >= self.PERSIST_INTERVAL:
+            self.manager.persist_later(self)
+
+    def snapshot(self):
+        return {
+            "job_id": self.id, "scope": self.scope, "kind": self.kind, "state": self.state,
+            "progress": {"done": self.done, "total": self.total, "message": self.message},
+            "result": self.result, "error": self.error,
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+            "call": self.call,
+        }
+
+    def status(self):
+        status = self.snapshot()
+        del status["scope"], status["call"]
+        return status
+
+
+class JobManager:
+    def __init__(self, per_token=JOBS_PER_TOKEN):
+        self.per_token = per_token
+        self.store = None
+        self.jobs = {}   # job_id -> Job, while queued or running in this process
+        self.slots = {}  # scope -> semaphore bounding the token's running jobs
+        self.tasks = set()
+        self.factory = None   # factory(token, call) -> job function, for jobs re-queued after a restart
+        self.resumed = set()  # scopes whose never-started jobs were looked up in this process
+
+    def _store(self):
+        if self.store is None:
+            self.store = JobStore()
+        return self.store
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def persist_later(self, job):
+        job.persisted_at = time.monotonic()
+        self._spawn(run_in_threadpool(self._store().save, job.snapshot()))
+
+    def resumable(self, factory):
+        """
+        Registers `factory(token, call)` returning the job function for the `call`
+        a job was submitted with, so it can be queued again after a restart.
+        """
+        self.factory = factory
+        return factory
+
+    async def resume(self, token):
+        """Queues again the token's jobs that a previous process accepted but never started (or may repeat)."""
+        scope = token_scope(token)
+        if self.factory is None or scope in self.resumed:
+            return
+        self.resumed.add(scope)
+        for job_id, kind, call, created_at in await run_in_threadpool(self._store().rerunnable, scope):
+            if job_id in self.jobs:
+                continue
+            try:
+                func = self.factory(token, call)
+            except Exception as e:
+                print(f"Error re-creating job {job_id}: {e}")
+                continue
+            job = Job(self, scope, kind, json.dumps(call, ensure_ascii=False), job_id, created_at)
+            self.jobs[job.id] = job
+            job.task = asyncio.create_task(self._run(job, func))
+
+    async def _run(self, job, func):
+        try:
+            async with self.slots.setdefault(job.scope, asyncio.Semaphore(self.per_token)):
+                job.state, job.started_at = "running", time.time()
+                self.persist_later(job)
+                job.result = await func(job)
+                job.state = "completed"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            try:
+                await run_in_threadpool(self._store().save, job.snapshot())
+            finally:
+                self.jobs.pop(job.id, None)
+
+    async def submit(self, token, kind, func, call=None):
+        """
+        Starts `await func(job)` in the background and returns the job; its return value becomes the result.
+        The queued job is stored before it can start, so its later writes cannot be overtaken.
+        `call` (JSON-serializable) lets the `resumable` factory re-create the job after a restart;
+        with "idempotent": True in it, even when the job was already running.
+        """
+        try:
+            call = json.dumps(call, ensure_ascii=False) if call is not None else None
+        except (TypeError, ValueError):
+            call = None  # e.g. uploaded bytes: the job just cannot be re-created
+        job = Job(self, token_scope(token), kind, call)
+        await run_in_threadpool(self._store().save, job.snapshot())
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, func))
+        self._spawn(self.resume(token))
+        return job
+
+    async def status(self, token, job_id):
+        await self.resume(token)
+        job = self.jobs.get(job_id)
+        if job is not None and job.scope == token_scope(token):
+            return job.status()
+        status = await run_in_threadpool(self._store().get, job_id, token_scope(token))
+        if status and status["state"] in UNFINISHED:
+            status["state"] = "interrupted"  # the process that ran it stopped
+        return status
+
+    async def cancel(self, token, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.scope == token_scope(token):
+            job.task.cancel()
+            try:
+                await asyncio.shield(job.task)
+            except asyncio.CancelledError:
+                pass
+        return await self.status(token, job_id)
+
+    async def list(self, token, state=None, limit=50):
+        await self.resume(token)
+        jobs = await run_in_threadpool(self._store().list, token_scope(token), state, limit)
+        for status in jobs:
+            if status["state"] in UNFINISHED and status["job_id"] not in self.jobs:
+                status["state"] = "interrupted"
+            elif status["job_id"] in self.jobs:
+                status.update(self.jobs[status["job_id"]].status(), result=None)
+        return jobs
+
+
+JOBS = JobManager()
+
+
+# --- Background Job API ---
+@router.post("/mcp/jobs/status")
+async def api_jobs_status(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    status = await JOBS.status(api_key, str(body.get("job_id", "")))
+    if status is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {"dooray_response": status}
+
+
+@router.post("/mcp/jobs/cancel")
+async def api_jobs_cancel(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json()
+    status = await JOBS.cancel(api_key, str(body.get("job_id", "")))
+    if status is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {"dooray_response": status}
+
+
+@router.post("/mcp/jobs/list")
+async def api_jobs_list(request: Request):
+    api_key = _get_api_key(request)
+    body = await request.json() if await request.body() else {}
+    try:
+        limit = min(200, max(1, int(body.get("limit", 50))))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="limit must be an integer")
+    return {"dooray_response": {"jobs": await JOBS.list(api_key, body.get("state"), limit)}}
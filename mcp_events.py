@@ -0,0 +1,162 @@
+"""
+Per-session event streams for the MCP Streamable HTTP transport.
+
+Every MCP session (created by `initialize`, identified by the Mcp-Session-Id
+header) owns an EventBuffer. Messages the server pushes to the client are
+published into the buffer on a named stream: "get" for the standalone
+GET /mcp stream, and one "post<n>" stream per POST answered with SSE
+(progress notifications, partial results and finally the tool response).
+Event ids are "<stream>/<n>", so a client reconnecting with Last-Event-ID
+resumes exactly the stream it lost, from the last MCP_EVENT_BUFFER_SIZE
+events kept per session. Sessions idle (no subscriber, no event) for longer
+than MCP_SESSION_TTL are dropped by a periodic sweep.
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+
+from config import MCP_EVENT_BUFFER_SIZE, MCP_SESSION_TTL, MCP_MAX_SESSIONS
+
+GET_STREAM = "get"
+SWEEP_SECONDS = 60
+
+
+class EventBuffer:
+    def __init__(self, session_id=None, maxlen=MCP_EVENT_BUFFER_SIZE):
+        self.session_id = session_id
+        self.events = deque(maxlen=maxlen)
+        self.next_id = 1
+        self.next_stream = 1
+        self.subscribers = {}
+        self.last_seen = time.monotonic()
+
+    def new_stream(self):
+        stream = f"post{self.next_stream}"
+        self.next_stream += 1
+        return stream
+
+    def publish(self, message, stream=GET_STREAM, final=False):
+        """Stores `message` and delivers it to the stream's live subscribers. Must run on the event loop."""
+        number = self.next_id
+        self.next_id += 1
+        event = {"id": f"{stream}/{number}", "event": "message", "data": json.dumps(message, ensure_ascii=False)}
+        self.events.append((number, stream, final, event))
+        for queue in self.subscribers.get(stream, ()):
+            queue.put_nowait((event, final))
+        self.last_seen = time.monotonic()
+        return event
+
+    def since(self, last_event_id):
+        """
+        Returns (stream, [(event, final)]) for the events after `last_event_id`,
+        or None when the id is malformed or the events already fell out of the buffer.
+        """
+        try:
+            stream, number = str(last_event_id).rsplit("/", 1)
+            number = int(number)
+        except ValueError:
+            return None
+        if self.events and self.events[0][0] > number + 1:
+            return None
+        return stream, [(event, final) for n, s, final, event in self.events if s == stream and n > number]
+
+    def subscribe(self, stream=GET_STREAM):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(stream, set()).add(queue)
+        self.last_seen = time.monotonic()
+        return queue
+
+    def unsubscribe(self, stream, queue):
+        queues = self.subscribers.get(stream)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[stream]
+        self.last_seen = time.monotonic()
+
+    def open_stream(self, stream=GET_STREAM, backlog=()):
+        """
+        Subscribes to `stream` right away (so nothing published from now on is missed)
+        and returns an async generator of SSE events that ends after a final event.
+        """
+        queue = self.subscribe(stream)
+
+        async def events():
+            try:
+                for event, final in backlog:
+                    yield event
+                    if final:
+                        return
+                while True:
+                    event, final = await queue.get()
+                    yield event
+                    if final:
+                        return
+            finally:
+                self.unsubscribe(stream, queue)
+
+        return events()
+
+
+class SessionRegistry:
+    def __init__(self, ttl=MCP_SESSION_TTL, max_sessions=MCP_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self._sweeper = None
+
+    def create(self):
+        self._evict()
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = EventBuffer(session_id)
+        return self.sessions[session_id]
+
+    def get(self, session_id):
+        buffer = self.sessions.get(session_id) if session_id else None
+        if buffer is not None:
+            buffer.last_seen = time.monotonic()
+        return buffer
+
+    def close(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    def sweep(self):
+        """Drops the sessions idle for longer than the TTL; returns how many."""
+        now = time.monotonic()
+        expired = [session_id for session_id, buffer in self.sessions.items()
+                   if not buffer.subscribers and now - buffer.last_seen > self.ttl]
+        for session_id in expired:
+            del self.sessions[session_id]
+        return len(expired)
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(min(SWEEP_SECONDS, self.ttl))
+            self.sweep()
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def _evict(self):
+        self.sweep()
+        if len(self.sessions) >= self.max_sessions:
+            idle = sorted((b for b in self.sessions.values() if not b.subscribers), key=lambda b: b.last_seen)
+            for buffer in idle[:len(self.sessions) - self.max_sessions + 1]:
+                del self.sessions[buffer.session_id]
+
+
+SESSIONS = SessionRegistry()
+
+
+def install(app):
+    """Sweeps expired sessions for the lifetime of `app`."""
+    app.router.add_event_handler("startup", SESSIONS.start)
+    app.router.add_event_handler("shutdown", SESSIONS.stop)
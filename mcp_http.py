@@ -1,20 +1,119 @@
 import asyncio
-import os
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Response
 from fastapi.responses import JSONResponse
-from sse_starlette.sse import EventSourceResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timezone
 import json
-from dotenv import load_dotenv
-from main import SESSION_TOKENS
+from auth import SESSION_TOKENS
+from config import DOORAY_API_TOKEN, DOORAY_DOMAIN
+from mcp_events import SESSIONS, EventBuffer, GET_STREAM
+from directory import lookup_members
+from routes import notify_success
+from search_index import SEARCH
+from sync_engine import SYNC
+from freebusy import compute_freebusy
+from availability import find_available, book_first_available
+from wiki_patch import patch_wiki_page, PatchConflict
+from condense import condense_response, condense_options
+from context import post_context, project_context, wiki_page_context, ContextError
+from resolver import RESOLVER, KINDS, resolve_arguments
+from post_create import create_task
+import dooray_client
 
-load_dotenv(dotenv_path=".env")
-
-from dooray_client import get_projects as dooray_get_projects, create_project_post as dooray_create_task, get_project_members as dooray_get_members, get_project_tags as dooray_get_tags, get_drive_list as dooray_get_drive_list, get_drive_files as dooray_get_drive_files
+from dooray_client import get_projects as dooray_get_projects, get_project_members as dooray_get_members, get_project_tags as dooray_get_tags, get_drive_list as dooray_get_drive_list, get_drive_files as dooray_get_drive_files
 
 # MCP Router
 router = APIRouter()
 
+SSE_PING_SECONDS = 15
+STREAM_PAGE_SIZE = 100  # drive files per page when a listing is streamed page by page
+
+# tools that write: names given for their ID arguments must match exactly
+WRITE_TOOLS = {"dooray_createTask", "dooray_bulkPosts"}
+# tools that write when the argument is set (dooray_findAvailableResources books with "book")
+WRITE_FLAGS = {"dooray_findAvailableResources": "book"}
+
+# Strong references to tool calls running behind an SSE response
+_background_calls = set()
+
+
+class ToolContext:
+    """
+    Handed to tools/call so a running tool can push progress notifications and
+    partial results to the client. Without a stream (plain JSON responses) the
+    notifications are dropped. Safe to use from the threadpool.
+    """
+
+    def __init__(self, request_id=None, progress_token=None, publish=None):
+        self.request_id = request_id
+        self.progress_token = progress_token
+        self._publish = publish
+        self._loop = asyncio.get_running_loop() if publish else None
+
+    @property
+    def streaming(self):
+        return self._publish is not None
+
+    def notify(self, message):
+        if not self._publish:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._publish(message)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, message)
+
+    def progress(self, progress, total=None, message=None):
+        if self.progress_token is None:
+            return
+        params = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message:
+            params["message"] = message
+        self.notify({"jsonrpc": "2.0", "method": "notifications/progress", "params": params})
+
+    def partial(self, content):
+        self.notify({"jsonrpc": "2.0", "method": "notifications/dooray/partialResult",
+                     "params": {"requestId": self.request_id, "content": content}})
+
+    async def call(self, func, **kwargs):
+        """Runs a blocking dooray_client call off the event loop."""
+        return await run_in_threadpool(func, **kwargs)
+
+    async def stream_pages(self, fetch_page):
+        """
+        Reads every page of a paged Dooray listing and pushes each page's items as a
+        partial result as soon as the page arrives. `fetch_page(position)` is awaited
+        with None for the first page and returns (response, position of the next page
+        or None). Returns the upstream error response, or the whole listing
+        ({"header", "result", "totalCount", "pages"}): partial results are extra
+        progress, clients that ignore them still get every item in the final result.
+        """
+        items, header, pages, position = [], None, 0, None
+        while True:
+            response, position = await fetch_page(position)
+            if not isinstance(response, dict) or "error" in response:
+                return response
+            page = response.get("result")
+            page = page if isinstance(page, list) else []
+            header = header or response.get("header")
+            pages += 1
+            items.extend(page)
+            total = response.get("totalCount")
+            if page:
+                self.partial([{"type": "text", "text": str(page)}])
+            self.progress(len(items), total, f"page {pages}")
+            if not page or position is None:
+                return {"header": header, "result": items, "totalCount": total if total is not None else len(items), "pages": pages}
+
+
+def _get_session_id(request: Request):
+    return request.headers.get("Mcp-Session-Id")
+
 # --- MCP Standard Methods ---
 
 async def handle_initialize(request_id):
@@ -54,12 +153,12 @@ async def handle_tools_list(request_id):
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "projectId": {"type": "string", "description": "The ID of the project."},
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project."},
                     "title": {"type": "string", "description": "The title of the task."},
                     "description": {"type": "string", "description": "The description of the task."},
-                    "assignees": {"type": "array", "items": {"type": "string"}},
-                    "tags": {"type": "array", "items": {"type": "string"}},
-                    "dueDate": {"type": "string", "format": "date", "description": "The due date of the task."}
+                    "assignees": {"type": "array", "items": {"type": "string"}, "description": "Member IDs, emails or names."},
+                    "tags": {"type": "array", "items": {"type": "string"}, "description": "Tag names or IDs of the project."},
+                    "dueDate": {"type": "string", "format": "date", "description": "The due date of the task (a date means the end of that day; a date-time is also accepted)."}
                 },
                 "required": ["projectId", "title"]
             }
@@ -82,7 +181,7 @@ async def handle_tools_list(request_id):
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "projectId": {"type": "string"}
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project"}
                 },
                 "required": ["projectId"]
             }
@@ -93,7 +192,8 @@ async def handle_tools_list(request_id):
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "projectId": {"type": "string"}
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project"},
+                    "consistency": {"type": "string", "enum": ["fresh", "cached"], "default": "fresh", "description": "cached answers from the locally synced copy"}
                 },
                 "required": ["projectId"]
             }
@@ -119,6 +219,221 @@ async def handle_tools_list(request_id):
                 "required": ["driveId"]
             }
         },
+        {
+            "name": "dooray_lookupMember",
+            "description": "Find organization members by ID, email, name prefix (Korean given names and initials such as 'ㄱㅁㅅ' work) or department, answered from a cached directory index",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "memberId": {"type": "string"},
+                    "email": {"type": "string"},
+                    "name": {"type": "string", "description": "Name or name prefix"},
+                    "department": {"type": "string", "description": "Department ID or name prefix; narrows the other filters"},
+                    "limit": {"type": "integer", "default": 20}
+                }
+            }
+        },
+        {
+            "name": "dooray_search",
+            "description": "Full-text search over project posts and wiki pages (Korean supported), answered from a local index; results are ranked and paginated",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "kind": {"type": "string", "enum": ["post", "wiki"], "description": "Restrict to posts or wiki pages"},
+                    "projectId": {"type": "string", "description": "Restrict to one project (ID, code or name)"},
+                    "wikiId": {"type": "string", "description": "Restrict to one wiki"},
+                    "page": {"type": "integer", "default": 1},
+                    "size": {"type": "integer", "default": 20}
+                },
+                "required": ["query"]
+            }
+        },
+        {
+            "name": "dooray_freeBusy",
+            "description": "Compute free slots, busy blocks and conflicts for several calendars and/or members in one time window",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "timeMin": {"type": "string", "format": "date-time"},
+                    "timeMax": {"type": "string", "format": "date-time"},
+                    "calendarIds": {"type": "array", "items": {"type": "string"}, "description": "Calendar IDs or names"},
+                    "memberIds": {"type": "array", "items": {"type": "string"}, "description": "Organization member IDs, matched against event participants"},
+                    "minDurationMinutes": {"type": "integer", "default": 30},
+                    "workingHours": {"type": "object", "properties": {"start": {"type": "string"}, "end": {"type": "string"}, "timezone": {"type": "string"}}, "description": "Wall-clock hours in `timezone` (UTC offset or IANA name, default +09:00), e.g. {\"start\": \"09:00\", \"end\": \"18:00\"}"}
+                },
+                "required": ["timeMin", "timeMax"]
+            }
+        },
+        {
+            "name": "dooray_findAvailableResources",
+            "description": "Find resources (e.g. meeting rooms) free for a time range, optionally in one category; with book=true, reserve the first free one",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "startedAt": {"type": "string", "format": "date-time"},
+                    "endedAt": {"type": "string", "format": "date-time"},
+                    "category": {"type": "string", "description": "Resource category ID or name prefix"},
+                    "resourceIds": {"type": "array", "items": {"type": "string"}, "description": "Candidate resource IDs or names, tried in this order when booking"},
+                    "book": {"type": "boolean", "default": False},
+                    "subject": {"type": "string", "description": "Reservation subject, required with book"}
+                },
+                "required": ["startedAt", "endedAt"]
+            }
+        },
+        {
+            "name": "dooray_bulkPosts",
+            "description": "Create, update, transition (workflow by name or ID) or close many project posts in one call; returns a result per operation",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "projectId": {"type": "string", "description": "Default project for operations without projectId"},
+                    "operations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "op": {"type": "string", "enum": ["create", "update", "transition", "close"]},
+                                "projectId": {"type": "string", "description": "The ID, code or name of the project"},
+                                "postId": {"type": "string"},
+                                "subject": {"type": "string"},
+                                "body": {"type": "string"},
+                                "workflow": {"type": "string", "description": "Workflow name or ID"},
+                                "key": {"type": "string", "description": "Idempotency key"}
+                            },
+                            "required": ["op"]
+                        }
+                    }
+                },
+                "required": ["operations"]
+            }
+        },
+        {
+            "name": "dooray_driveTree",
+            "description": "Query the crawled folder tree of a Dooray drive by path glob (e.g. '*.pdf', '/Design/*'); the whole drive is crawled on first use and refreshed incrementally",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "driveId": {"type": "string", "description": "The ID of the drive"},
+                    "pattern": {"type": "string", "description": "Path glob; * also matches across folders", "default": "*"},
+                    "type": {"type": "string", "enum": ["file", "folder"]},
+                    "limit": {"type": "integer", "default": 100},
+                    "offset": {"type": "integer", "default": 0},
+                    "refresh": {"type": "boolean", "default": False, "description": "Re-crawl before answering"}
+                },
+                "required": ["driveId"]
+            }
+        },
+        {
+            "name": "dooray_getPost",
+            "description": "Read a project post (task) with its body condensed for reading: images replaced by placeholders, long tables shortened, cut to maxChars with the list of its sections; optionally only one section, and its comments",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project"},
+                    "postId": {"type": "string", "description": "The ID of the post"},
+                    "section": {"type": "string", "description": "Only the section under this markdown heading"},
+                    "maxChars": {"type": "integer", "description": "Body length limit (0 = no limit)"},
+                    "includeComments": {"type": "boolean", "default": False},
+                    "full": {"type": "boolean", "default": False, "description": "Return the body unchanged"}
+                },
+                "required": ["projectId", "postId"]
+            }
+        },
+        {
+            "name": "dooray_getWikiPage",
+            "description": "Read a wiki page with its body condensed for reading: images replaced by placeholders, long tables shortened, cut to maxChars with the list of its sections; optionally only one section, and its comments",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "wikiId": {"type": "string", "description": "The ID of the wiki"},
+                    "pageId": {"type": "string", "description": "The ID of the page"},
+                    "section": {"type": "string", "description": "Only the section under this markdown heading"},
+                    "maxChars": {"type": "integer", "description": "Body length limit (0 = no limit)"},
+                    "includeComments": {"type": "boolean", "default": False},
+                    "full": {"type": "boolean", "default": False, "description": "Return the body unchanged"}
+                },
+                "required": ["wikiId", "pageId"]
+            }
+        },
+        {
+            "name": "dooray_postContext",
+            "description": "Everything about one project post in a single call: the post with workflow, tag and member names, condensed body, comments, and the project's workflows and tags",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project"},
+                    "postId": {"type": "string", "description": "The ID of the post"},
+                    "comments": {"type": "boolean", "default": True},
+                    "full": {"type": "boolean", "default": False, "description": "Do not condense bodies"}
+                },
+                "required": ["projectId", "postId"]
+            }
+        },
+        {
+            "name": "dooray_projectContext",
+            "description": "A project with its workflows, tags and members (with names) in a single call",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "projectId": {"type": "string", "description": "The ID, code or name of the project"}
+                },
+                "required": ["projectId"]
+            }
+        },
+        {
+            "name": "dooray_wikiPageContext",
+            "description": "A wiki page with its condensed body, comments, child pages and parent page in a single call",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "wikiId": {"type": "string", "description": "The ID of the wiki"},
+                    "pageId": {"type": "string", "description": "The ID of the page"},
+                    "comments": {"type": "boolean", "default": True},
+                    "full": {"type": "boolean", "default": False, "description": "Do not condense bodies"}
+                },
+                "required": ["wikiId", "pageId"]
+            }
+        },
+        {
+            "name": "dooray_patchWikiPage",
+            "description": "Edit a wiki page without resending it: apply a unified diff or replace/append/prepend/delete sections by markdown heading. Nothing is written when the content is unchanged; fails on conflicting edits",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "wikiId": {"type": "string", "description": "The ID of the wiki"},
+                    "pageId": {"type": "string", "description": "The ID of the page"},
+                    "patch": {"type": "string", "description": "Unified diff against the current page content"},
+                    "edits": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "section": {"type": "string", "description": "Heading text, optionally with its # level"},
+                                "op": {"type": "string", "enum": ["replace", "append", "prepend", "delete"], "default": "replace"},
+                                "content": {"type": "string"}
+                            },
+                            "required": ["section"]
+                        }
+                    },
+                    "baseVersion": {"type": "string", "description": "Page version the change was made against"}
+                },
+                "required": ["wikiId", "pageId"]
+            }
+        },
+        {
+            "name": "dooray_resolveName",
+            "description": "Find the ID of a project (by code or name), workflow, tag, calendar or resource from its name; tolerates prefixes and small misspellings. Other tools also accept these names directly",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "kind": {"type": "string", "enum": ["project", "workflow", "tag", "calendar", "resource"]},
+                    "name": {"type": "string"},
+                    "projectId": {"type": "string", "description": "The project of a workflow or tag (ID, code or name)"}
+                },
+                "required": ["kind", "name"]
+            }
+        },
         {
             "name": "dooray_setToken",
             "description": "Set Dooray API token for authentication",
@@ -137,9 +452,10 @@ async def handle_tools_list(request_id):
         "result": {"tools": tools}
     }
 
-async def handle_tools_call(request_id, params, request: Request):
+async def handle_tools_call(request_id, params, request: Request, context: ToolContext = None):
     tool_name = params.get("name")
     arguments = params.get("arguments", {})
+    context = context or ToolContext(request_id)
     
     # Handle token setting first (no authentication required)
     if tool_name == "dooray_setToken":
@@ -151,13 +467,13 @@ async def handle_tools_call(request_id, params, request: Request):
             }
         
         # Get conversation ID for session-based token storage
-        conversation_id = request.headers.get("claude-conversation-id") or request.headers.get("X-Conversation-ID") or "default"
+        conversation_id = request.headers.get("claude-conversation-id") or request.headers.get("X-Conversation-ID") or _get_session_id(request) or "default"
         SESSION_TOKENS[conversation_id] = token
         
         return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": "Dooray API token has been set successfully. You can now use other Dooray functions."}]}}
     
     # Get API token for other functions
-    conversation_id = request.headers.get("claude-conversation-id") or request.headers.get("X-Conversation-ID")
+    conversation_id = request.headers.get("claude-conversation-id") or request.headers.get("X-Conversation-ID") or _get_session_id(request)
     if conversation_id:
         token = SESSION_TOKENS.get(conversation_id)
         if not token:
@@ -167,7 +483,7 @@ async def handle_tools_call(request_id, params, request: Request):
             }
         
     else:
-        token = os.getenv("DOORAY_API_TOKEN")
+        token = DOORAY_API_TOKEN
         if not token:
             return {
                 "jsonrpc": "2.0", "id": request_id,
@@ -175,34 +491,42 @@ async def handle_tools_call(request_id, params, request: Request):
             }
 
     try:
+        # every ID argument may be given as a name (project code, workflow name, ...)
+        writes = tool_name in WRITE_TOOLS or bool(arguments.get(WRITE_FLAGS.get(tool_name, "")))
+        arguments = await resolve_arguments(token, arguments, exact=writes)
+
         if tool_name == "dooray_getProjects":
-            result = dooray_get_projects(
-                access_token=token,
-                limit=arguments.get("limit", 50),
-                cursor=arguments.get("cursor")
-            )
+            async def fetch_projects(cursor):
+                response = await context.call(
+                    dooray_get_projects,
+                    access_token=token,
+                    limit=arguments.get("limit", 50),
+                    cursor=cursor
+                )
+                return response, dooray_client.next_cursor(response)
+
+            if context.streaming and not arguments.get("cursor"):
+                result = await context.stream_pages(fetch_projects)  # every page, pushed as it arrives
+            else:
+                result, _ = await fetch_projects(arguments.get("cursor"))
             if "error" in result:
                 raise Exception(result.get("response", result.get("error")))
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
         
         elif tool_name == "dooray_createTask":
-            result = dooray_create_task(
-                access_token=token,
-                project_id=arguments.get("projectId"),
-                subject=arguments.get("title"),
-                body=arguments.get("description", "")
+            result = await create_task(
+                token, arguments.get("projectId"), arguments.get("title"), arguments.get("description", ""),
+                assignees=arguments.get("assignees"), tags=arguments.get("tags"), due_date=arguments.get("dueDate"),
             )
-            if "error" in result:
-                raise Exception(result.get("response", result.get("error")))
-            
-            task_id = result.get("id")
+            task_id = (result.get("result") or {}).get("id")
             # This is a placeholder for the URL, as the API doesn't return it directly.
-            url = f"https://{os.getenv('DOORAY_DOMAIN')}/projects/{arguments.get('projectId')}/{task_id}"
+            url = f"https://{DOORAY_DOMAIN}/projects/{arguments.get('projectId')}/{task_id}"
 
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": f"Task created successfully. ID: {task_id}, URL: {url}"}]}}
 
         elif tool_name == "dooray_getMembers":
-            result = dooray_get_members(
+            result = await context.call(
+                dooray_get_members,
                 access_token=token,
                 project_id=arguments.get("projectId")
             )
@@ -211,13 +535,19 @@ async def handle_tools_call(request_id, params, request: Request):
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
 
         elif tool_name == "dooray_getTags":
-            result = dooray_get_tags(access_token=token, project_id=arguments.get("projectId"))
-            if "error" in result:
-                 raise Exception(result.get("response", result.get("error")))
+            result = None
+            if arguments.get("consistency") == "cached":
+                result = await SYNC.read(token, "get_project_tags", {"project_id": arguments.get("projectId")})
+            if result is None:
+                result = await context.call(dooray_get_tags, access_token=token, project_id=arguments.get("projectId"))
+                if "error" in result:
+                     raise Exception(result.get("response", result.get("error")))
+                notify_success("get_project_tags", token, {"project_id": arguments.get("projectId")}, result)
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
 
         elif tool_name == "dooray_getDriveList":
-            result = dooray_get_drive_list(
+            result = await context.call(
+                dooray_get_drive_list,
                 access_token=token,
                 type=arguments.get("type", "private")
             )
@@ -226,14 +556,198 @@ async def handle_tools_call(request_id, params, request: Request):
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
 
         elif tool_name == "dooray_getDriveFiles":
-            result = dooray_get_drive_files(
-                access_token=token,
-                drive_id=arguments.get("driveId")
-            )
+            async def fetch_files(page):
+                page = page or 0
+                response = await context.call(
+                    dooray_get_drive_files,
+                    access_token=token,
+                    drive_id=arguments.get("driveId"),
+                    page=page,
+                    size=STREAM_PAGE_SIZE
+                )
+                items = response.get("result") if isinstance(response, dict) else None
+                total = response.get("totalCount") if isinstance(response, dict) else None
+                more = isinstance(items, list) and len(items) == STREAM_PAGE_SIZE and (total is None or (page + 1) * STREAM_PAGE_SIZE < total)
+                return response, page + 1 if more else None
+
+            if context.streaming:
+                result = await context.stream_pages(fetch_files)  # every page, pushed as it arrives
+            else:
+                result = await context.call(
+                    dooray_get_drive_files,
+                    access_token=token,
+                    drive_id=arguments.get("driveId")
+                )
             if "error" in result:
                 raise Exception(result.get("response", result.get("error")))
             return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
 
+        elif tool_name == "dooray_lookupMember":
+            result = await lookup_members(
+                token,
+                member_id=arguments.get("memberId"),
+                email=arguments.get("email"),
+                name=arguments.get("name"),
+                department=arguments.get("department"),
+                limit=arguments.get("limit", 20)
+            )
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_freeBusy":
+            if not arguments.get("calendarIds") and not arguments.get("memberIds"):
+                raise Exception("calendarIds or memberIds is required")
+            result = await compute_freebusy(
+                token,
+                arguments.get("timeMin"),
+                arguments.get("timeMax"),
+                calendar_ids=arguments.get("calendarIds"),
+                member_ids=arguments.get("memberIds"),
+                min_duration_minutes=int(arguments.get("minDurationMinutes", 30)),
+                working_hours=arguments.get("workingHours")
+            )
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_findAvailableResources":
+            if arguments.get("book"):
+                if not arguments.get("subject"):
+                    raise Exception("subject is required to book")
+                result = await book_first_available(
+                    token, arguments.get("startedAt"), arguments.get("endedAt"), arguments["subject"],
+                    category=arguments.get("category"), resource_ids=arguments.get("resourceIds")
+                )
+            else:
+                result = await find_available(
+                    token, arguments.get("startedAt"), arguments.get("endedAt"),
+                    category=arguments.get("category"), resource_ids=arguments.get("resourceIds")
+                )
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_bulkPosts":
+            operations = arguments.get("operations")
+            if not isinstance(operations, list) or not operations:
+                raise Exception("operations (list) is required")
+            rows = [
+                {
+                    "op": op.get("op"), "key": op.get("key"), "project_id": op.get("projectId"), "post_id": op.get("postId"),
+                    "subject": op.get("subject"), "body": op.get("body"), "workflow": op.get("workflow")
+                } if isinstance(op, dict) else {"_error": "each operation must be an object"}
+                for op in operations
+            ]
+            from post_bulk import run_post_operations  # rarely used; kept out of startup
+            results = [r async for r in run_post_operations(token, rows, arguments.get("projectId"))]
+            results.sort(key=lambda r: (r["index"] is None, r["index"]))
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(results)}]}}
+
+        elif tool_name == "dooray_driveTree":
+            if not arguments.get("driveId"):
+                raise Exception("driveId is required")
+            if arguments.get("type") and arguments["type"] not in ("file", "folder"):
+                raise Exception("type must be file or folder")
+            from drive_tree import DRIVE_TREE  # rarely used; kept out of startup
+            try:
+                result = await DRIVE_TREE.query(
+                    token,
+                    arguments["driveId"],
+                    arguments.get("pattern") or "*",
+                    arguments.get("type"),
+                    limit=min(1000, max(1, int(arguments.get("limit", 100)))),
+                    offset=max(0, int(arguments.get("offset", 0))),
+                    refresh=bool(arguments.get("refresh"))
+                )
+            except RuntimeError as e:
+                raise Exception(str(e))
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name in ("dooray_getPost", "dooray_getWikiPage"):
+            if tool_name == "dooray_getPost":
+                if not arguments.get("projectId") or not arguments.get("postId"):
+                    raise Exception("projectId and postId are required")
+                ids = {"project_id": arguments["projectId"], "post_id": arguments["postId"]}
+                read, read_comments = dooray_client.get_project_post, dooray_client.get_project_post_comments
+            else:
+                if not arguments.get("wikiId") or not arguments.get("pageId"):
+                    raise Exception("wikiId and pageId are required")
+                ids = {"wiki_id": arguments["wikiId"], "page_id": arguments["pageId"]}
+                read, read_comments = dooray_client.get_wiki_page, dooray_client.get_wiki_page_comments
+            if not arguments.get("full"):
+                options = condense_options({"section": arguments.get("section"), "max_chars": arguments.get("maxChars")})
+            calls = [context.call(read, access_token=token, **ids)]
+            if arguments.get("includeComments"):
+                calls.append(context.call(read_comments, access_token=token, **ids))
+            responses = await asyncio.gather(*calls)
+            for response in responses:
+                if isinstance(response, dict) and "error" in response:
+                    raise Exception(response.get("response", response.get("error")))
+            if not arguments.get("full"):
+                responses = [condense_response(responses[0], options)] + [
+                    condense_response(response, dict(options, section=None)) for response in responses[1:]
+                ]
+            result = {"item": responses[0].get("result")}
+            if len(responses) > 1:
+                result["comments"] = responses[1].get("result")
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name in ("dooray_postContext", "dooray_projectContext", "dooray_wikiPageContext"):
+            try:
+                if tool_name == "dooray_postContext":
+                    if not arguments.get("projectId") or not arguments.get("postId"):
+                        raise Exception("projectId and postId are required")
+                    result = await post_context(
+                        token, str(arguments["projectId"]), str(arguments["postId"]),
+                        comments=arguments.get("comments", True) is not False,
+                        condense=not arguments.get("full")
+                    )
+                elif tool_name == "dooray_projectContext":
+                    if not arguments.get("projectId"):
+                        raise Exception("projectId is required")
+                    result = await project_context(token, str(arguments["projectId"]))
+                else:
+                    if not arguments.get("wikiId") or not arguments.get("pageId"):
+                        raise Exception("wikiId and pageId are required")
+                    result = await wiki_page_context(
+                        token, str(arguments["wikiId"]), str(arguments["pageId"]),
+                        comments=arguments.get("comments", True) is not False,
+                        condense=not arguments.get("full")
+                    )
+            except ContextError as e:
+                raise Exception(str(e))
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_resolveName":
+            if arguments.get("kind") not in KINDS or not arguments.get("name"):
+                raise Exception(f"kind ({', '.join(KINDS)}) and name are required")
+            result = await RESOLVER.lookup(token, arguments["kind"], str(arguments["name"]), arguments.get("projectId"))
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_patchWikiPage":
+            if not arguments.get("wikiId") or not arguments.get("pageId"):
+                raise Exception("wikiId and pageId are required")
+            try:
+                result = await patch_wiki_page(
+                    token,
+                    arguments["wikiId"],
+                    arguments["pageId"],
+                    patch=arguments.get("patch"),
+                    edits=arguments.get("edits"),
+                    base_version=arguments.get("baseVersion")
+                )
+            except (ValueError, PatchConflict, RuntimeError) as e:
+                raise Exception(str(e))
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
+        elif tool_name == "dooray_search":
+            if not arguments.get("query"):
+                raise Exception("query is required")
+            result = await SEARCH.search(
+                token,
+                arguments["query"],
+                kind=arguments.get("kind"),
+                container_id=arguments.get("projectId") or arguments.get("wikiId"),
+                page=max(1, int(arguments.get("page", 1))),
+                size=min(100, max(1, int(arguments.get("size", 20))))
+            )
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": str(result)}]}}
+
         else:
             return {
                 "jsonrpc": "2.0", "id": request_id,
@@ -248,6 +762,38 @@ async def handle_tools_call(request_id, params, request: Request):
         }
 
 
+def _wants_event_stream(request: Request):
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def _stream_tools_call(request_id, params, request: Request, session: EventBuffer):
+    """Runs tools/call in the background and answers with an SSE stream of its notifications and result."""
+    buffer = session or EventBuffer()
+    stream = buffer.new_stream()
+    events = buffer.open_stream(stream)
+    context = ToolContext(request_id, (params.get("_meta") or {}).get("progressToken"), lambda message: buffer.publish(message, stream))
+
+    async def run():
+        try:
+            response = await handle_tools_call(request_id, params, request, context)
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "Internal error", "data": str(e)}}
+        # The task outlives a dropped connection; the result stays resumable via Last-Event-ID.
+        buffer.publish(response, stream, final=True)
+
+    task = asyncio.create_task(run())
+    _background_calls.add(task)
+    task.add_done_callback(_background_calls.discard)
+    headers = {"Mcp-Session-Id": buffer.session_id} if buffer.session_id else None
+    return _event_source(events, headers)
+
+
+def _event_source(events, headers=None):
+    # sse_starlette pulls in uvicorn; only pay for it when a client streams
+    from sse_starlette.sse import EventSourceResponse
+    return EventSourceResponse(events, headers=headers, ping=SSE_PING_SECONDS)
+
+
 @router.post("/mcp")
 async def mcp_endpoint(request: Request):
     try:
@@ -256,13 +802,29 @@ async def mcp_endpoint(request: Request):
         params = body.get("params", {})
         request_id = body.get("id")
 
+        session_id = _get_session_id(request)
+        session = SESSIONS.get(session_id)
+        if session_id and session is None and method != "initialize":
+            return JSONResponse(content={
+                "jsonrpc": "2.0", "id": request_id,
+                "error": {"code": -32001, "message": "Session not found"}
+            }, status_code=404)
+
+        if request_id is None and method and method.startswith("notifications/"):
+            return Response(status_code=202)
+
+        headers = None
         if method == "initialize":
+            session = SESSIONS.create()
+            headers = {"Mcp-Session-Id": session.session_id}
             response = await handle_initialize(request_id)
         elif method == "ping":
             response = await handle_ping(request_id)
         elif method == "tools/list":
             response = await handle_tools_list(request_id)
         elif method == "tools/call":
+            if _wants_event_stream(request):
+                return _stream_tools_call(request_id, params, request, session)
             response = await handle_tools_call(request_id, params, request)
         else:
             response = {
@@ -273,7 +835,7 @@ async def mcp_endpoint(request: Request):
                     "message": "Method not found"
                 }
             }
-        return JSONResponse(content=response)
+        return JSONResponse(content=response, headers=headers)
     except json.JSONDecodeError:
         return JSONResponse(content={
             "jsonrpc": "2.0", "id": None,
@@ -286,15 +848,36 @@ async def mcp_endpoint(request: Request):
         }, status_code=500)
 
 
+@router.get("/mcp")
+async def mcp_get(request: Request):
+    """
+    With 'Accept: text/event-stream' opens the session's server-to-client stream
+    (resumable with Last-Event-ID); otherwise describes the REST endpoints.
+    """
+    if not _wants_event_stream(request):
+        return {"message": "Dooray MCP base endpoint. Use /mcp/<service>/<action> for specific APIs."}
+    return await mcp_stream(request)
+
+
 @router.get("/mcp/stream")
 async def mcp_stream(request: Request):
-    async def event_generator():
-        while True:
-            # Send a keepalive message every 30 seconds
-            yield {
-                "event": "message",
-                "data": json.dumps({"type": "keepalive", "ts": datetime.now(timezone.utc).isoformat()})
-            }
-            await asyncio.sleep(30)
+    session_id = _get_session_id(request) or request.query_params.get("session_id")
+    session = SESSIONS.get(session_id)
+    if session_id and session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    buffer = session or EventBuffer()
+
+    stream, backlog = GET_STREAM, ()
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        resumed = buffer.since(last_event_id)
+        if resumed is not None:
+            stream, backlog = resumed
+    return _event_source(buffer.open_stream(stream, backlog))
+
 
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+@router.delete("/mcp")
+async def mcp_delete(request: Request):
+    if not SESSIONS.close(_get_session_id(request)):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return Response(status_code=204)
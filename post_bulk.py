@@ -0,0 +1,117 @@
+"""
+Bulk project post operations.
+
+One request carries many create / update / transition / close rows for one or
+more projects. Rows run with bounded concurrency under the token's rate limit
+(bulk.py) and every row gets its own result. Projects and workflows may be
+given by name; they are resolved through the shared name maps (resolver.py),
+so a project's workflows are fetched at most once however many rows refer
+to it.
+"""
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from bulk import read_rows, run_rows, respond_rows
+from config import BULK_CONCURRENCY
+from resolver import RESOLVER, UnknownName
+from routes import notify_success
+
+router = APIRouter()
+
+OPERATIONS = ("create", "update", "transition", "close")
+
+
+async def _call(api_key, client_name, **kwargs):
+    result = dooray_client.unwrap(await run_in_threadpool(getattr(dooray_client, client_name), api_key, **kwargs))
+    notify_success(client_name, api_key, kwargs, result)
+    return result
+
+
+async def run_post_operation(api_key, row, default_project_id=None, default_op=None):
+    """Performs one row; ValueError when the row is incomplete, RuntimeError when Dooray rejects it."""
+    op = row.get("op") or default_op
+    if op not in OPERATIONS:
+        raise ValueError("op must be create, update, transition or close")
+    project_id = row.get("project_id") or default_project_id
+    if not project_id:
+        raise ValueError("project_id is required")
+    project_id = str(project_id)
+    post_id = str(row["post_id"]) if row.get("post_id") else None
+    if op != "create" and not post_id:
+        raise ValueError(f"post_id is required for {op}")
+    workflow = row.get("workflow_id") or row.get("workflow")
+    if op == "transition" and not workflow:
+        raise ValueError("workflow (name or ID) is required for transition")
+    if op == "create" and not row.get("subject"):
+        raise ValueError("subject is required for create")
+    if op == "update" and not (row.get("subject") or row.get("body")):
+        raise ValueError("subject or body is required for update")
+    # resolve before writing anything, so an unknown workflow name does not leave a half-done row
+    try:
+        project_id = await RESOLVER.resolve(api_key, "project", project_id, exact=True)
+        if workflow and op in ("create", "transition"):
+            workflow_id = await RESOLVER.resolve(api_key, "workflow", str(workflow), project_id, exact=True)
+        else:
+            workflow_id = None
+    except UnknownName as e:
+        raise ValueError(str(e))
+
+    if op == "create":
+        result = await _call(
+            api_key, "create_project_post", project_id=project_id, subject=row["subject"],
+            body=row.get("body") or "", post_type=row.get("post_type") or "task",
+        )
+        if workflow_id is None:
+            return result
+        post_id = str((result.get("result") or {}).get("id", ""))
+        try:
+            await _call(api_key, "update_project_post_workflow", project_id=project_id, post_id=post_id, workflow_id=workflow_id)
+        except RuntimeError as e:
+            raise RuntimeError(f"post {post_id} was created but its workflow was not set: {e}")
+        return dict(result, workflowId=workflow_id)
+    if op == "update":
+        return await _call(
+            api_key, "update_project_post", project_id=project_id, post_id=post_id,
+            subject=row.get("subject"), body=row.get("body"),
+        )
+    if op == "transition":
+        return await _call(api_key, "update_project_post_workflow", project_id=project_id, post_id=post_id, workflow_id=workflow_id)
+    return await _call(api_key, "set_project_post_done", project_id=project_id, post_id=post_id)
+
+
+def run_post_operations(api_key, rows, project_id=None, default_op=None, concurrency=BULK_CONCURRENCY):
+    """Async iterator of per-row results (see bulk.run_rows) for post operation rows."""
+    async def execute(row):
+        return await run_post_operation(api_key, row, project_id, default_op)
+
+    return run_rows(api_key, rows, execute, "project_posts", concurrency)
+
+
+# --- Project Post Bulk API ---
+@router.post("/mcp/project/posts/bulk")
+async def api_project_posts_bulk(request: Request):
+    """
+    Body: {"project_id": "...", "operations": [{"op": "create|update|transition|close", "key": "...",
+    "project_id": "...", "post_id": "...", "subject": "...", "body": "...", "workflow": "<name or ID>"}]},
+    or the same rows as NDJSON / CSV. ?project_id= and ?op= set defaults for rows without one.
+    """
+    api_key = _get_api_key(request)
+    default_op = request.query_params.get("op")
+    if default_op is not None and default_op not in OPERATIONS:
+        raise HTTPException(status_code=400, detail="op must be create, update, transition or close")
+    try:
+        concurrency = min(BULK_CONCURRENCY, max(1, int(request.query_params.get("concurrency", BULK_CONCURRENCY))))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="concurrency must be an integer")
+    project_id = request.query_params.get("project_id")
+    if project_id is None and request.headers.get("content-type", "").startswith("application/json"):
+        # the body-level default is only known after parsing, so peek at the JSON body first
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        project_id = body.get("project_id") if isinstance(body, dict) else None
+    rows = await read_rows(request, "operations")
+    return await respond_rows(request, run_post_operations(api_key, rows, project_id, default_op, concurrency))
@@ -0,0 +1,100 @@
+"""
+Fully specified task creation for the dooray_createTask MCP tool.
+
+Assignees (member IDs, emails or names), tags (names or IDs) and the due date
+are resolved before the write: people through the directory index
+(directory.py), tags through the project's tag name map (resolver.py), both
+cached and looked up concurrently. The post is then created with one complete
+create_project_post call instead of a create followed by updates.
+"""
+import asyncio
+from datetime import datetime, time as day_time
+
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from directory import DIRECTORY, normalize
+from freebusy import parse_time, format_time
+from resolver import RESOLVER, UnknownName, AmbiguousName, is_id
+from routes import notify_success
+
+
+def _member(member_id):
+    return {"type": "member", "member": {"organizationMemberId": str(member_id)}}
+
+
+def _describe(entry):
+    return f"{entry['name']} <{entry['email']}>" if entry["email"] else f"{entry['name']} ({entry['id']})"
+
+
+def _assignee(index, value):
+    """The post user entry for a member ID, an email or a name that exactly one member has."""
+    value = str(value).strip()
+    if is_id(value):
+        return _member(value)
+    if "@" in value:
+        member_id = index.by_email.get(normalize(value))
+        # addresses outside the organization are assigned as email users
+        return _member(member_id) if member_id else {"type": "emailUser", "emailUser": {"emailAddress": value}}
+    exact = index.exact_name(value)
+    if len(exact) == 1:
+        return _member(exact[0])
+    if exact:
+        names = ", ".join(_describe(index.members[member_id]) for member_id in exact[:10])
+        raise AmbiguousName(f"member {value!r} is ambiguous: {names}")
+    # a write never picks a member by prefix; the prefix matches are only offered as candidates
+    candidates = index.lookup(name=value, limit=10)
+    if not candidates:
+        raise UnknownName(f"member {value!r} not found")
+    names = ", ".join(_describe(c) for c in candidates)
+    raise AmbiguousName(f"member {value!r} only matches by prefix; give the exact name, email or ID: {names}")
+
+
+async def resolve_assignees(token, assignees):
+    if not assignees:
+        return []
+    values = [str(a) for a in assignees]
+    # the directory index is only needed for emails and names
+    index = None if all(is_id(v) for v in values) else await DIRECTORY.get(token)
+    return [_member(v) if is_id(v) else _assignee(index, v) for v in values]
+
+
+async def resolve_tags(token, project_id, tags):
+    return list(await asyncio.gather(*(RESOLVER.resolve(token, "tag", str(tag), project_id, exact=True) for tag in tags or ())))
+
+
+def due_date_value(value):
+    """Dooray's due date for an ISO date (the end of that day, KST by default) or date-time."""
+    value = str(value).strip()
+    try:
+        if "T" not in value and " " not in value:
+            return format_time(parse_time(datetime.combine(datetime.fromisoformat(value).date(), day_time(23, 59, 59))))
+        return format_time(parse_time(value))
+    except ValueError:
+        raise ValueError(f"dueDate {value!r} is not an ISO date or date-time")
+
+
+async def create_task(token, project_id, subject, body="", assignees=None, tags=None, due_date=None):
+    """
+    Creates a task with its assignees, tags and due date in one upstream write.
+    ValueError for invalid arguments (UnknownName / AmbiguousName for names),
+    RuntimeError when Dooray rejects a read or the write.
+    """
+    if not project_id or not subject:
+        raise ValueError("projectId and title are required")
+    if not isinstance(assignees or [], list) or not isinstance(tags or [], list):
+        raise ValueError("assignees and tags must be lists")
+    due = due_date_value(due_date) if due_date else None
+    project_id = str(await RESOLVER.resolve(token, "project", project_id, exact=True))
+    to, tag_ids = await asyncio.gather(resolve_assignees(token, assignees), resolve_tags(token, project_id, tags))
+
+    kwargs = {"project_id": project_id, "subject": subject, "body": body or ""}
+    if to:
+        kwargs["users"] = {"to": to, "cc": []}
+    if tag_ids:
+        kwargs["tag_ids"] = tag_ids
+    if due:
+        kwargs["due_date"] = due
+    result = dooray_client.unwrap(await run_in_threadpool(dooray_client.create_project_post, token, **kwargs))
+    notify_success("create_project_post", token, kwargs, result)
+    return result
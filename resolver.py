@@ -0,0 +1,285 @@
+"""
+Name -> ID resolution for projects, workflows, tags, calendars and resources.
+
+Agents usually know names ("project KIC", "workflow Done", "tag urgent")
+while Dooray wants IDs. Every route and MCP tool argument that takes one of
+these IDs also accepts its name: numeric values are passed through as IDs
+without any lookup, anything else is resolved here.
+
+Names are matched against per-token maps built from the list reads
+(get_projects, get_project_workflows, get_project_tags, get_calendars,
+get_resources), in this order: exact name (or project code), then unique
+prefix, then the closest spelling (difflib, RESOLVER_FUZZY_CUTOFF). Arguments
+of writes only accept the ID, the exact name or the project code: a prefix or
+close spelling there fails with the candidates instead of picking one. A map
+older than RESOLVER_REFRESH_SECONDS is refreshed in the background while the
+old one keeps answering; a name that is not found rebuilds the map once, in
+case it was just created elsewhere. Fresh list reads through the other routes
+replace the map and writes through this server drop it.
+"""
+import difflib
+import time
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from config import RESOLVER_REFRESH_SECONDS, RESOLVER_FUZZY_CUTOFF, SYNC_TOKEN_TTL
+from directory import normalize
+from routes import on_success, argument_resolver
+from token_cache import TokenCache
+
+router = APIRouter()
+
+# kind -> (dooray_client list function, per-project, fields holding names)
+KINDS = {
+    "project": ("get_projects", False, ("code", "name")),
+    "workflow": ("get_project_workflows", True, ("name",)),
+    "tag": ("get_project_tags", True, ("name",)),
+    "calendar": ("get_calendars", False, ("name",)),
+    "resource": ("get_resources", False, ("name",)),
+}
+CLIENT_KINDS = {client: kind for kind, (client, _, _) in KINDS.items()}
+
+# request argument -> (kind, argument holding the project); route kwargs and MCP tool arguments.
+# Projects come first so the workflows and tags are looked up in the resolved project.
+ARGUMENTS = {
+    "project_id": ("project", None),
+    "projectId": ("project", None),
+    "workflow_id": ("workflow", "project_id"),
+    "workflowId": ("workflow", "projectId"),
+    "tag_ids": ("tag", "project_id"),
+    "tagIds": ("tag", "projectId"),
+    "calendar_id": ("calendar", None),
+    "calendar_ids": ("calendar", None),
+    "calendarId": ("calendar", None),
+    "calendarIds": ("calendar", None),
+    "resource_id": ("resource", None),
+    "resource_ids": ("resource", None),
+    "resourceId": ("resource", None),
+    "resourceIds": ("resource", None),
+}
+
+# writes -> (kind, argument holding the project) whose map they make stale
+INVALIDATES = {
+    "create_project": ("project", None),
+    "create_project_workflow": ("workflow", "project_id"),
+    "update_project_workflow": ("workflow", "project_id"),
+    "delete_project_workflow": ("workflow", "project_id"),
+}
+
+# a miss rebuilds the map, unless it was built this recently
+MISS_REBUILD_SECONDS = 5
+
+# kind -> dooray_client function reading the whole list, where the list read above is paged
+FULL_LISTS = {"project": "get_all_projects"}
+
+
+class UnknownName(LookupError):
+    """No entry of the kind matches the name."""
+
+
+class AmbiguousName(ValueError):
+    """Several entries match the name equally well."""
+
+
+def is_id(value):
+    """IDs are numeric; "*" (all calendars) is passed through too."""
+    value = str(value)
+    return value.isdigit() or value == "*"
+
+
+def _key(text):
+    return " ".join(normalize(text).split())
+
+
+def _items(response):
+    result = dooray_client.payload(response)
+    return [item for item in result if isinstance(item, dict) and item.get("id")] if isinstance(result, list) else []
+
+
+class NameMap:
+    """Names of one list (projects of a token, workflows of a project, ...) -> IDs."""
+
+    def __init__(self, kind, response):
+        self.kind = kind
+        self.names = {}  # id -> display name
+        self.ids = {}    # normalized name -> [ids]
+        for item in _items(response):
+            item_id = str(item["id"])
+            labels = [str(item[field]) for field in KINDS[kind][2] if item.get(field)]
+            self.names[item_id] = labels[-1] if labels else item_id
+            for label in labels:
+                ids = self.ids.setdefault(_key(label), [])
+                if item_id not in ids:
+                    ids.append(item_id)
+        self.keys = sorted(self.ids)
+        self.built_at = time.time()
+
+    def _candidates(self, name):
+        """(matched_by, [ids]) of the best matching rule that matches anything."""
+        wanted = _key(name)
+        if wanted in self.ids:
+            return "name", self.ids[wanted]
+        prefixed = list(dict.fromkeys(i for key in self.keys if key.startswith(wanted) for i in self.ids[key]))
+        if prefixed:
+            return "prefix", prefixed
+        close = difflib.get_close_matches(wanted, self.keys, n=3, cutoff=RESOLVER_FUZZY_CUTOFF)
+        if close:
+            best = difflib.SequenceMatcher(None, wanted, close[0]).ratio()
+            tied = [key for key in close if difflib.SequenceMatcher(None, wanted, key).ratio() == best]
+            return "fuzzy", list(dict.fromkeys(i for key in tied for i in self.ids[key]))
+        return None, []
+
+    def match(self, name, exact=False):
+        """
+        {"id", "name", "matched_by"}; UnknownName / AmbiguousName when there is no single match,
+        or with `exact` when the name only matches by prefix or spelling.
+        """
+        if str(name) in self.names:
+            return {"id": str(name), "name": self.names[str(name)], "matched_by": "id"}
+        matched_by, ids = self._candidates(str(name))
+        if not ids:
+            close = difflib.get_close_matches(_key(name), self.keys, n=5, cutoff=0.6)
+            suggestions = list(dict.fromkeys(self.names[i] for key in close for i in self.ids[key]))
+            hint = f" (did you mean {', '.join(repr(s) for s in suggestions)}?)" if suggestions else ""
+            raise UnknownName(f"{self.kind} {name!r} not found{hint}")
+        names = ", ".join(f"{self.names[i]!r} ({i})" for i in ids[:10])
+        if len(ids) > 1:
+            raise AmbiguousName(f"{self.kind} {name!r} is ambiguous: {names}")
+        if exact and matched_by != "name":
+            raise AmbiguousName(f"{self.kind} {name!r} only matches by {matched_by}; give the exact name or ID: {names}")
+        return {"id": ids[0], "name": self.names[ids[0]], "matched_by": matched_by}
+
+
+class NameResolver:
+    """Per-token name maps with single-flight builds and background refresh (token_cache.TokenCache)."""
+
+    def __init__(self, refresh_seconds=RESOLVER_REFRESH_SECONDS, token_ttl=SYNC_TOKEN_TTL):
+        self.cache = TokenCache(self._fetch, refresh_seconds, idle_ttl=token_ttl, name="name map")
+
+    @staticmethod
+    async def _fetch(token, kind, project_id, previous=None):
+        client, per_project, _ = KINDS[kind]
+        client = FULL_LISTS.get(kind, client)
+        kwargs = {"project_id": project_id} if per_project else {}
+        response = await run_in_threadpool(getattr(dooray_client, client), token, **kwargs)
+        return NameMap(kind, response)
+
+    async def get(self, token, kind, project_id=None, force_refresh=False):
+        if KINDS[kind][1] and not project_id:
+            raise ValueError(f"a project is required to resolve a {kind} name")
+        return await self.cache.get(token, kind, str(project_id or ""), force_refresh=force_refresh)
+
+    async def lookup(self, token, kind, name, project_id=None, exact=False):
+        """{"id", "name", "matched_by"} of `name`; UnknownName, AmbiguousName, RuntimeError (upstream)."""
+        name_map = await self.get(token, kind, project_id)
+        try:
+            return name_map.match(name, exact)
+        except UnknownName:
+            if time.time() - name_map.built_at < MISS_REBUILD_SECONDS:
+                raise
+        return (await self.get(token, kind, project_id, force_refresh=True)).match(name, exact)
+
+    async def resolve(self, token, kind, value, project_id=None, exact=False):
+        """The ID for `value`, an ID (returned as is) or a name; `exact` for arguments of writes."""
+        if value is None or is_id(value):
+            return value
+        return (await self.lookup(token, kind, value, project_id, exact))["id"]
+
+    def put(self, token, kind, project_id, response):
+        try:
+            self.cache.put(token, kind, str(project_id or ""), value=NameMap(kind, response))
+        except RuntimeError:
+            pass
+
+    def invalidate(self, token, kind, project_id=None):
+        self.cache.invalidate(token, kind, str(project_id or ""))
+
+
+RESOLVER = NameResolver()
+
+
+async def resolve_arguments(token, arguments, exact=False):
+    """
+    A copy of route kwargs or MCP tool arguments with every name given for an ID argument resolved.
+    `exact` (arguments of writes) accepts exact names only.
+    """
+    if not any(name in arguments and not _all_ids(arguments[name]) for name in ARGUMENTS):
+        return arguments  # IDs only: no lookup at all
+    resolved = dict(arguments)
+    for name, (kind, project_argument) in ARGUMENTS.items():
+        value = resolved.get(name)
+        if value is None or _all_ids(value):
+            continue
+        project_id = resolved.get(project_argument) if project_argument else None
+        if isinstance(value, list):
+            resolved[name] = [await RESOLVER.resolve(token, kind, item, project_id, exact) for item in value]
+        else:
+            resolved[name] = await RESOLVER.resolve(token, kind, value, project_id, exact)
+    return resolved
+
+
+def _all_ids(value):
+    values = value if isinstance(value, list) else [value]
+    return all(item is None or is_id(item) for item in values)
+
+
+async def resolve_request(token, body, exact=False):
+    """resolve_arguments for a hand-written route's body (`exact` for writes); failures become HTTP errors."""
+    try:
+        return await resolve_arguments(token, body, exact)
+    except UnknownName as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@argument_resolver
+async def _resolve_route_arguments(api_key, spec, kwargs):
+    return await resolve_arguments(api_key, kwargs, exact=not spec.cacheable)
+
+
+def _make_storer(kind):
+    def store(api_key, kwargs, result):
+        if kind == "project" and (kwargs.get("cursor") or dooray_client.next_cursor(result)):
+            return  # one page of projects is not the whole list
+        RESOLVER.put(api_key, kind, kwargs.get("project_id"), result)
+    return store
+
+
+for _client, _kind in CLIENT_KINDS.items():
+    on_success(_client)(_make_storer(_kind))  # fresh list reads replace the map
+
+
+def _make_invalidator(kind, project_argument):
+    def invalidate(api_key, kwargs, result):
+        RESOLVER.invalidate(api_key, kind, kwargs.get(project_argument) if project_argument else None)
+    return invalidate
+
+
+for _write, (_kind, _argument) in INVALIDATES.items():
+    on_success(_write)(_make_invalidator(_kind, _argument))
+
+
+# --- Name Resolution API ---
+@router.post("/mcp/resolve")
+async def api_resolve(request: Request):
+    """Body: {"kind": "project|workflow|tag|calendar|resource", "name": "...", "project_id": "<for workflow and tag>"}"""
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if body.get("kind") not in KINDS or not body.get("name"):
+        raise HTTPException(status_code=400, detail=f"kind ({', '.join(KINDS)}) and name are required")
+    body = await resolve_request(api_key, body)
+    try:
+        result = await RESOLVER.lookup(api_key, body["kind"], str(body["name"]), body.get("project_id"))
+    except UnknownName as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": result}
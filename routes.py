@@ -0,0 +1,459 @@
+"""
+Declarative route table for the /mcp/<service>/<action> REST endpoints.
+
+Every entry describes one endpoint: the path, the dooray_client function it
+proxies, the request body fields it forwards and which of them are required.
+Handlers are generated from this table by `register_routes`, so cross-cutting
+behaviour (threadpool offloading, caching, ...) lives in one place instead of
+being repeated in ~80 hand-written handlers.
+"""
+import base64
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from jobs import JOBS
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str                          # key in the JSON request body
+    arg: Optional[str] = None          # dooray_client keyword argument, defaults to `name`
+    required: bool = True
+    default: Any = _MISSING            # value used when an optional field is absent
+    kind: Optional[type] = None        # e.g. dict / list, checked with isinstance
+    decode: Optional[Callable] = None  # converts the raw body value, ValueError -> 400
+
+    @property
+    def label(self):
+        return f"{self.name} ({self.kind.__name__})" if self.kind else self.name
+
+
+@dataclass(frozen=True)
+class RouteSpec:
+    path: str
+    client: str                        # name of the dooray_client function
+    fields: Tuple[Field, ...] = ()
+    any_of: Tuple[str, ...] = ()       # at least one of these optional fields must be set
+    detail: Optional[str] = None       # overrides the generated 400 message
+    method: str = "POST"
+    raw: bool = False                  # return the upstream bytes instead of JSON
+    cacheable: bool = False            # read-only: served from a cached reader, names matched loosely
+    idempotent: bool = False           # safe to repeat: an async job cut off while running is run again
+
+    @property
+    def name(self):
+        return f"api_{self.client}"
+
+    @property
+    def required(self):
+        return tuple(f.name for f in self.fields if f.required)
+
+    @property
+    def missing_detail(self):
+        if self.detail:
+            return self.detail
+        labels = [f.label for f in self.fields if f.required]
+        if len(labels) == 1:
+            return f"{labels[0]} is required"
+        return f"{', '.join(labels[:-1])} and {labels[-1]} are required"
+
+
+def opt(name, default=_MISSING, **kwargs):
+    return Field(name, required=False, default=default, **kwargs)
+
+
+def _b64decode(value):
+    try:
+        return base64.b64decode(value)
+    except Exception:
+        raise ValueError("Invalid base64 content")
+
+
+def route(path, client, *fields, **options):
+    fields = tuple(Field(f) if isinstance(f, str) else f for f in fields)
+    return RouteSpec(path, client, fields, **options)
+
+
+def _read(path, client, *fields, **options):
+    return route(path, client, *fields, cacheable=True, idempotent=True, **options)
+
+
+ROUTES = (
+    # --- Common API ---
+    _read("/mcp/common/members/list", "get_members"),
+    _read("/mcp/common/members/get", "get_member", "member_id"),
+    route("/mcp/common/incoming_hooks/create", "create_incoming_hook", "name", "url", opt("description")),
+    _read("/mcp/common/incoming_hooks/get", "get_incoming_hook", "incoming_hook_id"),
+    route("/mcp/common/incoming_hooks/delete", "delete_incoming_hook", "incoming_hook_id", idempotent=True),
+
+    # --- Admin API ---
+    route("/mcp/admin/members/create", "create_admin_member", Field("member_data", kind=dict)),
+    _read("/mcp/admin/members", "get_admin_members", method="GET"),
+    route("/mcp/admin/members/update", "update_admin_member", "member_id", Field("member_data", kind=dict), idempotent=True),
+    route("/mcp/admin/members/leave", "leave_admin_member", "member_id", idempotent=True),
+
+    # --- Drive API ---
+    _read("/mcp/drive/list", "get_drive_list", opt("type", "private")),
+    _read("/mcp/drive/get", "get_drive", "drive_id"),
+    _read("/mcp/drive/files/list", "get_drive_files", "drive_id", opt("parent_id"), opt("page"), opt("size")),
+    _read("/mcp/drive/files/metadata", "get_drive_file_metadata", "drive_id", "file_id"),
+    _read("/mcp/drive/files/download", "download_drive_file", "drive_id", "file_id", raw=True),
+
+    # --- Messenger API ---
+    route("/mcp/messenger/send", "send_message", "recipient_id", "message"),
+
+    # --- Project API ---
+    _read("/mcp/project/list", "get_projects"),
+    route("/mcp/project/create", "create_project", "name", "code", opt("description")),
+    _read("/mcp/project/get", "get_project", "project_id"),
+    _read("/mcp/project/members/list", "get_project_members", "project_id"),
+    _read("/mcp/project/members/get", "get_project_member", "project_id", "member_id"),
+    route("/mcp/project/is_creatable", "is_project_creatable", idempotent=True),
+    _read("/mcp/project/workflows/list", "get_project_workflows", "project_id"),
+    route("/mcp/project/workflows/create", "create_project_workflow", "project_id", "name", opt("description")),
+    route("/mcp/project/workflows/update", "update_project_workflow", "project_id", "workflow_id", opt("name"), opt("description"),
+          any_of=("name", "description"), detail="project_id, workflow_id and either name or description are required", idempotent=True),
+    route("/mcp/project/workflows/delete", "delete_project_workflow", "project_id", "workflow_id", idempotent=True),
+    _read("/mcp/project/posts/list", "get_project_posts", "project_id", opt("page"), opt("size")),
+    _read("/mcp/project/posts/get", "get_project_post", "project_id", "post_id"),
+    route("/mcp/project/posts/create", "create_project_post", "project_id", "subject", opt("body", ""), opt("post_type", "task"),
+          opt("users"), opt("tag_ids"), opt("due_date")),
+    route("/mcp/project/posts/update", "update_project_post", "project_id", "post_id", opt("subject"), opt("body"),
+          any_of=("subject", "body"), detail="project_id, post_id and either subject or body are required", idempotent=True),
+    route("/mcp/project/posts/update_workflow", "update_project_post_workflow", "project_id", "post_id", "workflow_id", idempotent=True),
+    route("/mcp/project/posts/set_done", "set_project_post_done", "project_id", "post_id", idempotent=True),
+    route("/mcp/project/comments/create", "create_project_post_comment", "project_id", "post_id", "content"),
+    _read("/mcp/project/comments/list", "get_project_post_comments", "project_id", "post_id"),
+    route("/mcp/project/comments/update", "update_project_post_comment", "project_id", "post_id", "comment_id", "content", idempotent=True),
+    route("/mcp/project/comments/delete", "delete_project_post_comment", "project_id", "post_id", "comment_id", idempotent=True),
+
+    # --- Wiki API ---
+    _read("/mcp/wiki/list", "get_wikis"),
+    _read("/mcp/wiki/pages/list", "get_wiki_pages", "wiki_id", opt("parent_page_id")),
+    _read("/mcp/wiki/pages/get", "get_wiki_page", "wiki_id", "page_id"),
+    route("/mcp/wiki/pages/create", "create_wiki_page", "wiki_id", "title", "content", opt("parent_page_id")),
+    route("/mcp/wiki/pages/update", "update_wiki_page", "wiki_id", "page_id", opt("title"), opt("content"),
+          any_of=("title", "content"), detail="wiki_id, page_id and either title or content are required", idempotent=True),
+    route("/mcp/wiki/pages/update_title", "update_wiki_page_title", "wiki_id", "page_id", "title", idempotent=True),
+    route("/mcp/wiki/pages/update_content", "update_wiki_page_content", "wiki_id", "page_id", "content", idempotent=True),
+    route("/mcp/wiki/pages/update_referrers", "update_wiki_page_referrers", "wiki_id", "page_id", "referrers", idempotent=True),
+    route("/mcp/wiki/pages/comments/create", "create_wiki_page_comment", "wiki_id", "page_id", "content"),
+    _read("/mcp/wiki/pages/comments/list", "get_wiki_page_comments", "wiki_id", "page_id"),
+    _read("/mcp/wiki/pages/comments/get", "get_wiki_page_comment", "wiki_id", "page_id", "comment_id"),
+    route("/mcp/wiki/pages/comments/update", "update_wiki_page_comment", "wiki_id", "page_id", "comment_id", "content", idempotent=True),
+    route("/mcp/wiki/pages/comments/delete", "delete_wiki_page_comment", "wiki_id", "page_id", "comment_id", idempotent=True),
+    route("/mcp/wiki/pages/files/upload", "upload_wiki_page_file", "wiki_id", "page_id", "file_name",
+          Field("file_content_base64", arg="file_content", decode=_b64decode)),
+    _read("/mcp/wiki/pages/files/get", "get_wiki_page_file", "wiki_id", "page_id", "file_id"),
+    _read("/mcp/wiki/pages/files/download", "download_wiki_page_file", "wiki_id", "page_id", "file_id", raw=True),
+    route("/mcp/wiki/pages/files/delete", "delete_wiki_page_file", "wiki_id", "page_id", "file_id", idempotent=True),
+    route("/mcp/wiki/files/upload", "upload_wiki_file", "wiki_id", "file_name",
+          Field("file_content_base64", arg="file_content", decode=_b64decode)),
+
+    # --- Calendar API ---
+    _read("/mcp/calendar/list", "get_calendars"),
+    _read("/mcp/calendar/get", "get_calendar", "calendar_id"),
+    route("/mcp/calendar/events/create", "create_calendar_event", "calendar_id", "subject", "started_at", "ended_at",
+          opt("body"), opt("location"), opt("users")),
+    _read("/mcp/calendar/events/list", "get_calendar_events", opt("calendar_id", "*"), opt("time_min"), opt("time_max")),
+    _read("/mcp/calendar/events/get", "get_calendar_event", "calendar_id", "event_id"),
+    route("/mcp/calendar/events/update", "update_calendar_event", "calendar_id", "event_id",
+          opt("subject"), opt("started_at"), opt("ended_at"), opt("body"), opt("location"), opt("users"),
+          any_of=("subject", "started_at", "ended_at", "body", "location", "users"),
+          detail="calendar_id, event_id and at least one field to update are required", idempotent=True),
+    route("/mcp/calendar/events/delete", "delete_calendar_event", "calendar_id", "event_id", idempotent=True),
+
+    # --- Reservation API ---
+    _read("/mcp/reservation/categories/list", "get_resource_categories"),
+    _read("/mcp/reservation/resources/list", "get_resources"),
+    _read("/mcp/reservation/resources/get", "get_resource", "resource_id"),
+    _read("/mcp/reservation/list", "get_resource_reservations"),
+    route("/mcp/reservation/create", "create_resource_reservation", "resource_id", "subject", "started_at", "ended_at", opt("users")),
+    _read("/mcp/reservation/get", "get_resource_reservation", "resource_reservation_id"),
+    route("/mcp/reservation/update", "update_resource_reservation", "resource_reservation_id",
+          opt("resource_id"), opt("subject"), opt("started_at"), opt("ended_at"), opt("users"),
+          any_of=("resource_id", "subject", "started_at", "ended_at", "users"),
+          detail="resource_reservation_id and at least one field to update are required", idempotent=True),
+    route("/mcp/reservation/delete", "delete_resource_reservation", "resource_reservation_id", idempotent=True),
+
+    # --- Organization Chart API ---
+    _read("/mcp/organization_chart/list", "get_organization_chart", opt("include_inactive", False)),
+    _read("/mcp/organization_chart/departments/get", "get_department_details", "department_id"),
+    _read("/mcp/organization_chart/users/get", "get_user_details", "user_id"),
+
+    # --- Account Synchronization API ---
+    route("/mcp/account_sync/users/sync", "sync_users", Field("users", kind=list)),
+    route("/mcp/account_sync/departments/sync", "sync_departments", Field("departments", kind=list)),
+    route("/mcp/account_sync/users/delete", "delete_sync_user", "user_id", idempotent=True),
+    route("/mcp/account_sync/departments/delete", "delete_sync_department", "department_id", idempotent=True),
+)
+
+
+# dooray_client function name -> callbacks run after a successful call
+_SUCCESS_LISTENERS = defaultdict(list)
+
+
+def on_success(*client_names):
+    """
+    Registers `listener(api_key, kwargs, result)` to run after a successful call of
+    any of the named dooray_client functions, through a generated route or the MCP
+    tools. Listeners run on the event loop and must not block; hand slow work off.
+    """
+    def decorator(listener):
+        for name in client_names:
+            _SUCCESS_LISTENERS[name].append(listener)
+        return listener
+    return decorator
+
+
+# dooray_client function name -> async reader(api_key, kwargs) answering from a local copy
+_CACHED_READERS = {}
+CONSISTENCY = ("fresh", "cached")
+
+
+def cached_reader(*client_names):
+    """
+    Registers `reader(api_key, kwargs)` for requests with consistency=cached to the
+    named dooray_client functions. The reader returns the stored response, or None
+    to fall through to the upstream call.
+    """
+    def decorator(reader):
+        for name in client_names:
+            _CACHED_READERS[name] = reader
+        return reader
+    return decorator
+
+
+# dooray_client function name -> async server(api_key, kwargs) returning the HTTP response itself
+_FILE_SERVERS = {}
+
+
+def file_server(*client_names):
+    """
+    Registers `server(api_key, kwargs)` to answer requests to the named raw
+    download functions, e.g. from a local file cache. It returns a Response;
+    failures are raised as HTTPException.
+    """
+    def decorator(server):
+        for name in client_names:
+            _FILE_SERVERS[name] = server
+        return server
+    return decorator
+
+
+# dooray_client function name -> filter(result, options) rewriting a response on request
+_RESULT_FILTERS = {}
+# dooray_client function name -> parse(options) checking a filter's options before the upstream call
+_FILTER_OPTION_PARSERS = {}
+
+
+def result_filter(*client_names, parse_options=None):
+    """
+    Registers `filter(result, options)` for requests to the named dooray_client
+    functions that carry a "condense" option (body or query). It returns the
+    response to send and raises ValueError when it cannot apply the options.
+    `parse_options(options)`, when given, is called before the upstream call:
+    it raises ValueError for invalid options (a 400 without any upstream
+    request) and returns the options handed to the filter.
+    """
+    def decorator(result_filter):
+        for name in client_names:
+            _RESULT_FILTERS[name] = result_filter
+            if parse_options is not None:
+                _FILTER_OPTION_PARSERS[name] = parse_options
+        return result_filter
+    return decorator
+
+
+# async resolver(api_key, spec, kwargs) -> kwargs, e.g. names given for IDs
+_ARGUMENT_RESOLVERS = []
+
+
+def argument_resolver(resolver):
+    """
+    Registers `resolver(api_key, spec, kwargs)` to rewrite validated route
+    arguments before the call (`spec.cacheable` is False for writes). It returns the new kwargs and raises LookupError
+    (404), ValueError (400) or RuntimeError (502).
+    """
+    _ARGUMENT_RESOLVERS.append(resolver)
+    return resolver
+
+
+async def resolve_arguments(spec: RouteSpec, api_key, kwargs):
+    try:
+        for resolver in _ARGUMENT_RESOLVERS:
+            kwargs = await resolver(api_key, spec, kwargs)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return kwargs
+
+
+def notify_success(client_name, api_key, kwargs, result):
+    if isinstance(result, dict) and "error" in result:
+        return
+    for listener in _SUCCESS_LISTENERS.get(client_name, ()):
+        try:
+            listener(api_key, kwargs, result)
+        except Exception as e:
+            print(f"Error in {client_name} listener: {e}")
+
+
+def _handle_api_call(result):
+    if "error" in result:
+        raise HTTPException(status_code=result.get("status_code", 500), detail=result["error"])
+    return {"dooray_response": result}
+
+
+def _handle_raw_call(result):
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=result.get("status_code", 500), detail=result["error"])
+    return Response(content=result, media_type="application/octet-stream")
+
+
+def parse_arguments(spec: RouteSpec, body: dict):
+    """Validates a request body against `spec` and returns dooray_client kwargs."""
+    kwargs = {}
+    for field in spec.fields:
+        value = body.get(field.name)
+        if field.required and (not value or (field.kind and not isinstance(value, field.kind))):
+            raise HTTPException(status_code=400, detail=spec.missing_detail)
+        if value is None:
+            if field.default is not _MISSING:
+                kwargs[field.arg or field.name] = field.default
+            continue
+        if field.decode:
+            try:
+                value = field.decode(value)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        kwargs[field.arg or field.name] = value
+
+    if spec.any_of and not any(body.get(name) for name in spec.any_of):
+        raise HTTPException(status_code=400, detail=spec.missing_detail)
+    return kwargs
+
+
+async def _optional_body(request: Request):
+    """Routes without fields accept an empty body, or one carrying only options such as consistency."""
+    if request.method == "GET" or not await request.body():
+        return {}
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    return body if isinstance(body, dict) else {}
+
+
+def _wants_async(request: Request, body: dict):
+    value = request.query_params.get("async", body.get("async", False))
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _result_filter(client_name, options):
+    """The function's result filter when the request asked for it, else None."""
+    if options in (None, False, "", "false", "0"):
+        return None
+    return _RESULT_FILTERS.get(client_name)
+
+
+def _filter_options(client_name, options):
+    """The request's result filter options, checked before the upstream call; HTTPException 400 when invalid."""
+    parse = _FILTER_OPTION_PARSERS.get(client_name)
+    if parse is None or _result_filter(client_name, options) is None:
+        return options
+    try:
+        return parse(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _job_result(client_name, result, options=None):
+    """
+    A job result must be storable as JSON: upstream errors fail the job, raw bytes are base64-encoded.
+    The result filter applies as it does to the synchronous response.
+    """
+    dooray_client.unwrap(result)
+    result_filter = _result_filter(client_name, options)
+    if result_filter is not None:
+        result = result_filter(result, options)
+    if isinstance(result, bytes):
+        return {"content_base64": base64.b64encode(result).decode()}
+    return result
+
+
+@JOBS.resumable
+def _route_job(api_key, call):
+    """The job function of an async route request; `call` is {"client", "kwargs", "options", "idempotent"}."""
+    client_name, kwargs, options = call["client"], call["kwargs"], call.get("options")
+    client_func = getattr(dooray_client, client_name)
+
+    async def run(job):
+        result = await run_in_threadpool(client_func, api_key, **kwargs)
+        notify_success(client_name, api_key, kwargs, result)
+        return _job_result(client_name, result, options)
+    return run
+
+
+def _filtered(spec: RouteSpec, respond, options):
+    """`respond` applying the route's result filter when the request asked for it."""
+    result_filter = _result_filter(spec.client, options)
+    if result_filter is None:
+        return respond
+
+    def filtered(result):
+        if isinstance(result, dict) and "error" in result:
+            return respond(result)
+        try:
+            return respond(result_filter(result, options))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return filtered
+
+
+def make_handler(spec: RouteSpec):
+    async def handler(request: Request):
+        api_key = _get_api_key(request)
+        body = await request.json() if spec.fields else await _optional_body(request)
+        options = _filter_options(spec.client, body.get("condense", request.query_params.get("condense")))
+        kwargs = await resolve_arguments(spec, api_key, parse_arguments(spec, body))
+        respond = _filtered(spec, _handle_raw_call if spec.raw else _handle_api_call, options)
+        consistency = request.query_params.get("consistency") or body.get("consistency") or "fresh"
+        if consistency not in CONSISTENCY:
+            raise HTTPException(status_code=400, detail="consistency must be cached or fresh")
+        reader = _CACHED_READERS.get(spec.client) if spec.cacheable else None
+        if consistency == "cached" and reader is not None:
+            result = await reader(api_key, kwargs)
+            if result is not None:
+                return respond(result)
+        client_func = getattr(dooray_client, spec.client)
+        if spec.client in _FILE_SERVERS and not _wants_async(request, body):
+            return await _FILE_SERVERS[spec.client](api_key, kwargs)
+        if _wants_async(request, body):
+            call = {"client": spec.client, "kwargs": kwargs, "options": options, "idempotent": spec.idempotent}
+            job = await JOBS.submit(api_key, spec.client, _route_job(api_key, call), call)
+            return JSONResponse(status_code=202, content={"dooray_response": job.status()})
+        # dooray_client is blocking (requests), keep it off the event loop
+        result = await run_in_threadpool(client_func, api_key, **kwargs)
+        notify_success(spec.client, api_key, kwargs, result)
+        return respond(result)
+
+    handler.__name__ = spec.name
+    return handler
+
+
+def register_routes(app: FastAPI, routes=ROUTES):
+    for spec in routes:
+        app.add_api_route(spec.path, make_handler(spec), methods=[spec.method], name=spec.name)
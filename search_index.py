@@ -0,0 +1,465 @@
+"""
+Local full-text search over project posts and wiki pages.
+
+Documents are kept in an SQLite FTS5 index (SEARCH_DB_PATH), separated per
+token so one user's search never returns another token's documents. Korean
+has no word boundaries the unicode61 tokenizer understands ("서버가" vs
+"서버"), so text is pre-tokenized here: Hangul runs become overlapping
+character bigrams and a query becomes the phrase of its bigrams, which
+matches inside words and across particles. Other scripts keep whole words.
+
+The index is filled by a background crawler (projects -> posts -> post and
+wikis -> pages -> page) started on the first search for a token and again
+when the last crawl is older than SEARCH_CRAWL_INTERVAL. Projects and posts
+are read page by page and wiki pages level by level, all containers at once
+(SEARCH_CRAWL_CONCURRENCY upstream calls at a time). Items whose updatedAt is
+unchanged are not fetched again; documents no longer listed are dropped only
+when their container's listing was read completely. Posts and pages created or
+updated through this server are re-indexed right away (write-through via
+routes.on_success).
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from config import SEARCH_DB_PATH, SEARCH_CRAWL_INTERVAL, SEARCH_CRAWL_CONCURRENCY
+from resolver import resolve_request
+from routes import on_success
+from store import open_store
+
+router = APIRouter()
+
+KINDS = ("post", "wiki")
+SNIPPET_CHARS = 160
+PAGE_SIZE = 100  # posts per listing page while crawling
+WORD = re.compile(r"[가-힣]+|[^\W_가-힣]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    container_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    title TEXT,
+    body TEXT,
+    updated_at TEXT,
+    content_hash TEXT,
+    indexed_at REAL,
+    UNIQUE (scope, kind, container_id, item_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(title, body, tokenize='unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS crawl_state (
+    scope TEXT PRIMARY KEY,
+    crawled_at REAL,
+    stats TEXT
+);
+"""
+
+
+def _is_hangul(ch):
+    return "가" <= ch <= "힣"
+
+
+def _words(text):
+    return WORD.findall(unicodedata.normalize("NFC", str(text or "")).casefold())
+
+
+def _bigrams(word):
+    if len(word) < 2 or not _is_hangul(word[0]):
+        return [word]
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def tokenize(text):
+    """Text as indexed: Hangul runs as bigrams, other words unchanged."""
+    return " ".join(token for word in _words(text) for token in _bigrams(word))
+
+
+def build_query(query):
+    """
+    FTS5 MATCH expression for a user query: every word must match, a Hangul word
+    as the phrase of its bigrams. Single Hangul characters and the last word are
+    matched as prefixes so partially typed queries still find something.
+    """
+    words = _words(query)
+    terms = []
+    for position, word in enumerate(words):
+        grams = _bigrams(word)
+        if len(grams) > 1:
+            terms.append('"' + " ".join(grams) + '"')
+        elif len(word) == 1 and _is_hangul(word) or position == len(words) - 1:
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'"{word}"')
+    return " AND ".join(terms)
+
+
+def snippet(text, query, size=SNIPPET_CHARS):
+    """A window of the original text around the first query word, or its start."""
+    text = " ".join(str(text or "").split())
+    lowered = text.casefold()
+    positions = [lowered.find(word) for word in _words(query)]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - size // 4) if positions else 0
+    window = text[start:start + size]
+    return ("…" if start else "") + window + ("…" if start + size < len(text) else "")
+
+
+def _payload_list(response):
+    result = dooray_client.payload(response)
+    if isinstance(result, dict):
+        return [result]
+    return result if isinstance(result, list) else []
+
+
+def _content(value):
+    """Dooray bodies are either plain strings or {"mimeType", "content"}."""
+    if isinstance(value, dict):
+        return value.get("content") or ""
+    return value or ""
+
+
+def extract_document(kind, item):
+    """(title, body, updated_at) of a post or wiki page payload."""
+    title = item.get("subject") or item.get("title") or ""
+    body = _content(item.get("body") if "body" in item else item.get("content"))
+    return title, body, item.get("updatedAt") or item.get("lastUpdatedAt")
+
+
+class SearchIndex:
+    """SQLite FTS5 storage."""
+
+    def __init__(self, path=SEARCH_DB_PATH):
+        self.conn, self.lock = open_store(path, SCHEMA)
+
+    def versions(self, scope, kind, container_id):
+        """item_id -> updated_at of the documents indexed for one project or wiki."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id, updated_at FROM documents WHERE scope = ? AND kind = ? AND container_id = ?",
+                (scope, kind, container_id),
+            ).fetchall()
+        return dict(rows)
+
+    def upsert(self, scope, kind, container_id, item_id, title, body, updated_at):
+        """Indexes one document; returns False when its content is unchanged."""
+        digest = hashlib.sha1(f"{title}\0{body}".encode()).hexdigest()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT rowid, content_hash FROM documents WHERE scope = ? AND kind = ? AND container_id = ? AND item_id = ?",
+                (scope, kind, container_id, item_id),
+            ).fetchone()
+            if row and row[1] == digest:
+                self.conn.execute("UPDATE documents SET updated_at = ?, indexed_at = ? WHERE rowid = ?", (updated_at, time.time(), row[0]))
+                return False
+            if row:
+                rowid = row[0]
+                self.conn.execute(
+                    "UPDATE documents SET title = ?, body = ?, updated_at = ?, content_hash = ?, indexed_at = ? WHERE rowid = ?",
+                    (title, body, updated_at, digest, time.time(), rowid),
+                )
+                self.conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (rowid,))
+            else:
+                rowid = self.conn.execute(
+                    "INSERT INTO documents (scope, kind, container_id, item_id, title, body, updated_at, content_hash, indexed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (scope, kind, container_id, item_id, title, body, updated_at, digest, time.time()),
+                ).lastrowid
+            self.conn.execute(
+                "INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)", (rowid, tokenize(title), tokenize(body)),
+            )
+        return True
+
+    def remove(self, scope, kind, container_id, item_ids=None, keep=None, indexed_before=None):
+        """
+        Removes the given items, or every item of the container not in `keep`
+        (only those indexed before `indexed_before`, so a crawl keeps what write-through added meanwhile).
+        """
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT rowid, item_id, indexed_at FROM documents WHERE scope = ? AND kind = ? AND container_id = ?",
+                (scope, kind, container_id),
+            ).fetchall()
+            doomed = [rowid for rowid, item_id, indexed_at in rows
+                      if (item_ids is not None and item_id in item_ids)
+                      or (keep is not None and item_id not in keep and (indexed_before is None or (indexed_at or 0) < indexed_before))]
+            for rowid in doomed:
+                self.conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (rowid,))
+                self.conn.execute("DELETE FROM documents WHERE rowid = ?", (rowid,))
+        return len(doomed)
+
+    def search(self, scope, query, kind=None, container_id=None, page=1, size=20):
+        expression = build_query(query)
+        if not expression:
+            return [], 0
+        where = "documents_fts MATCH ? AND d.scope = ?"
+        params = [expression, scope]
+        if kind:
+            where += " AND d.kind = ?"
+            params.append(kind)
+        if container_id:
+            where += " AND d.container_id = ?"
+            params.append(str(container_id))
+        with self.lock:
+            total = self.conn.execute(
+                f"SELECT count(*) FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid WHERE {where}", params,
+            ).fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT d.kind, d.container_id, d.item_id, d.title, d.body, d.updated_at, bm25(documents_fts, 3.0, 1.0) AS score "
+                f"FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid WHERE {where} "
+                "ORDER BY score LIMIT ? OFFSET ?",
+                params + [size, (page - 1) * size],
+            ).fetchall()
+        results = [{
+            "kind": kind, "id": item_id, "title": title, "snippet": snippet(body, query), "updatedAt": updated_at,
+            "score": round(-score, 4),
+            "projectId" if kind == "post" else "wikiId": container_id,
+        } for kind, container_id, item_id, title, body, updated_at, score in rows]
+        return results, total
+
+    def crawl_state(self, scope):
+        with self.lock:
+            row = self.conn.execute("SELECT crawled_at, stats FROM crawl_state WHERE scope = ?", (scope,)).fetchone()
+            count = self.conn.execute("SELECT count(*) FROM documents WHERE scope = ?", (scope,)).fetchone()[0]
+        return {"documents": count, "crawled_at": row[0] if row else None, "last_crawl": json.loads(row[1]) if row else None}
+
+    def mark_crawled(self, scope, stats):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO crawl_state (scope, crawled_at, stats) VALUES (?, ?, ?)",
+                (scope, time.time(), json.dumps(stats)),
+            )
+
+
+class SearchService:
+    """Per-token crawling on top of a SearchIndex, with at most one crawl per token at a time."""
+
+    def __init__(self, crawl_interval=SEARCH_CRAWL_INTERVAL, concurrency=SEARCH_CRAWL_CONCURRENCY):
+        self.crawl_interval = crawl_interval
+        self.concurrency = concurrency
+        self.index = None
+        self.crawls = {}   # scope -> running crawl task; the token is only held by the task
+        self.tasks = set()  # write-through refreshes, referenced until done
+
+    def _index(self):
+        if self.index is None:
+            self.index = SearchIndex()
+        return self.index
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _list_posts(self, token, project_id, semaphore):
+        """(posts, complete): every page of the project's posts; complete is False when a page failed."""
+        items, page = [], 0
+        while True:
+            async with semaphore:
+                response = await run_in_threadpool(dooray_client.get_project_posts, token, project_id, page, PAGE_SIZE)
+            try:
+                batch = _payload_list(response)
+            except RuntimeError as e:
+                print(f"Error listing posts of project {project_id} (page {page}): {e}")
+                return items, False
+            items.extend(item for item in batch if isinstance(item, dict) and item.get("id"))
+            total = response.get("totalCount") if isinstance(response, dict) else None
+            if len(batch) < PAGE_SIZE or (total is not None and len(items) >= total):
+                return items, True
+            page += 1
+
+    async def _wiki_children(self, token, wiki_id, page_id, semaphore):
+        async with semaphore:
+            response = await run_in_threadpool(dooray_client.get_wiki_pages, token, wiki_id, page_id)
+        items = [item for item in _payload_list(response) if isinstance(item, dict) and item.get("id")]
+        if any("parentPageId" in item for item in items):  # keep only this level if more came back
+            items = [item for item in items if str(item.get("parentPageId") or "") == str(page_id or "")]
+        return items
+
+    async def _list_wiki_pages(self, token, wiki_id, semaphore):
+        """(pages, complete): the whole page tree, listed level by level through parentPageId."""
+        items, seen, level, complete = [], set(), [None], True
+        while level:
+            listings = await asyncio.gather(
+                *(self._wiki_children(token, wiki_id, page_id, semaphore) for page_id in level), return_exceptions=True,
+            )
+            parents, level = level, []
+            for page_id, children in zip(parents, listings):
+                if isinstance(children, Exception):
+                    print(f"Error listing pages of wiki {wiki_id} under {page_id or 'the root'}: {children}")
+                    complete = False
+                    continue
+                for item in children:
+                    item_id = str(item["id"])
+                    if item_id not in seen:
+                        seen.add(item_id)
+                        items.append(item)
+                        level.append(item_id)
+        return items, complete
+
+    async def _crawl_container(self, scope, token, kind, container_id, semaphore, stats, started_at):
+        lister = self._list_posts if kind == "post" else self._list_wiki_pages
+        items, complete = await lister(token, container_id, semaphore)
+        if not complete:
+            stats["errors"] += 1
+        known = await run_in_threadpool(self._index().versions, scope, kind, container_id)
+
+        async def fetch(item_id):
+            async with semaphore:
+                await self._refresh_item(scope, token, kind, container_id, item_id, stats)
+
+        pending = []
+        for item in items:
+            item_id = str(item["id"])
+            updated_at = item.get("updatedAt") or item.get("lastUpdatedAt")
+            if item_id in known and updated_at and known[item_id] == updated_at:
+                stats["unchanged"] += 1
+            else:
+                pending.append(fetch(item_id))
+        await asyncio.gather(*pending)
+        if complete:  # a partial listing says nothing about the items it did not reach
+            stats["removed"] += await run_in_threadpool(
+                self._index().remove, scope, kind, container_id, None, {str(item["id"]) for item in items}, started_at,
+            )
+
+    async def _refresh_item(self, scope, token, kind, container_id, item_id, stats=None):
+        if kind == "post":
+            response = await run_in_threadpool(dooray_client.get_project_post, token, container_id, item_id)
+        else:
+            response = await run_in_threadpool(dooray_client.get_wiki_page, token, container_id, item_id)
+        try:
+            item = dooray_client.payload(response)
+        except RuntimeError as e:
+            if stats is not None:
+                stats["errors"] += 1
+            print(f"Error fetching {kind} {item_id} for the search index: {e}")
+            return
+        title, body, updated_at = extract_document(kind, item if isinstance(item, dict) else {})
+        changed = await run_in_threadpool(self._index().upsert, scope, kind, container_id, item_id, title, body, updated_at)
+        if stats is not None:
+            stats["indexed" if changed else "unchanged"] += 1
+
+    async def _crawl(self, scope, token):
+        started, started_at = time.perf_counter(), time.time()
+        stats = {"containers": 0, "indexed": 0, "unchanged": 0, "removed": 0, "errors": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        projects, wikis = await asyncio.gather(
+            run_in_threadpool(dooray_client.get_all_projects, token),
+            run_in_threadpool(dooray_client.get_wikis, token),
+        )
+        containers = [("post", str(p["id"])) for p in _payload_list(projects) if isinstance(p, dict) and p.get("id")]
+        containers += [("wiki", str(w["id"])) for w in _payload_list(wikis) if isinstance(w, dict) and w.get("id")]
+        stats["containers"] = len(containers)
+
+        async def crawl_container(kind, container_id):
+            try:
+                await self._crawl_container(scope, token, kind, container_id, semaphore, stats, started_at)
+            except RuntimeError as e:
+                stats["errors"] += 1
+                print(f"Error crawling {kind} container {container_id}: {e}")
+
+        await asyncio.gather(*(crawl_container(kind, container_id) for kind, container_id in containers))
+        stats["crawl_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        await run_in_threadpool(self._index().mark_crawled, scope, stats)
+        return stats
+
+    async def _run_crawl(self, scope, token):
+        try:
+            return await self._crawl(scope, token)
+        except Exception as e:
+            print(f"Error crawling search index: {e}")
+            return {"error": str(e)}
+        finally:
+            self.crawls.pop(scope, None)
+
+    def crawl(self, token):
+        """Starts a crawl for `token` unless one is already running; returns its task."""
+        scope = token_scope(token)
+        if scope not in self.crawls:
+            self.crawls[scope] = self._spawn(self._run_crawl(scope, token))
+        return self.crawls[scope]
+
+    async def search(self, token, query, kind=None, container_id=None, page=1, size=20):
+        scope = token_scope(token)
+        state = await run_in_threadpool(self._index().crawl_state, scope)
+        if state["crawled_at"] is None or time.time() - state["crawled_at"] > self.crawl_interval:
+            self.crawl(token)
+        results, total = await run_in_threadpool(self._index().search, scope, query, kind, container_id, page, size)
+        return {
+            "results": results, "total": total, "page": page, "size": size,
+            "index": dict(state, crawling=scope in self.crawls),
+        }
+
+    def refresh_later(self, token, kind, container_id, item_id):
+        """Write-through: re-fetches and re-indexes one item in the background."""
+        if container_id and item_id:
+            self._spawn(self._refresh_item(token_scope(token), token, kind, str(container_id), str(item_id)))
+
+
+SEARCH = SearchService()
+
+
+def _created_id(result):
+    result = result.get("result", result) if isinstance(result, dict) else None
+    return result.get("id") if isinstance(result, dict) else None
+
+
+@on_success("create_project_post", "update_project_post")
+def _on_post_written(api_key, kwargs, result):
+    SEARCH.refresh_later(api_key, "post", kwargs.get("project_id"), kwargs.get("post_id") or _created_id(result))
+
+
+@on_success("create_wiki_page", "update_wiki_page", "update_wiki_page_title", "update_wiki_page_content")
+def _on_wiki_page_written(api_key, kwargs, result):
+    SEARCH.refresh_later(api_key, "wiki", kwargs.get("wiki_id"), kwargs.get("page_id") or _created_id(result))
+
+
+def _search_arguments(body):
+    query = body.get("query")
+    kind = body.get("kind")
+    if not query or not str(query).strip():
+        raise HTTPException(status_code=400, detail="query is required")
+    if kind and kind not in KINDS:
+        raise HTTPException(status_code=400, detail="kind must be post or wiki")
+    try:
+        page = max(1, int(body.get("page", 1)))
+        size = min(100, max(1, int(body.get("size", 20))))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="page and size must be integers")
+    return str(query), kind, body.get("project_id") or body.get("wiki_id"), page, size
+
+
+# --- Search API ---
+@router.post("/mcp/search")
+async def api_search(request: Request):
+    api_key = _get_api_key(request)
+    body = await resolve_request(api_key, await request.json())
+    query, kind, container_id, page, size = _search_arguments(body)
+    result = await SEARCH.search(api_key, query, kind, container_id, page, size)
+    return {"dooray_response": result}
+
+
+@router.post("/mcp/search/crawl")
+async def api_search_crawl(request: Request):
+    api_key = _get_api_key(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    task = SEARCH.crawl(api_key)
+    if not body.get("wait"):
+        return {"dooray_response": {"crawling": True}}
+    stats = await asyncio.shield(task)
+    if "error" in stats:
+        raise HTTPException(status_code=502, detail=stats["error"])
+    return {"dooray_response": stats}
@@ -0,0 +1,54 @@
+"""
+Cold-start profiler for `python main.py --profile-startup`.
+
+Imports the app in a fresh interpreter with `-X importtime` and reports where
+the import time goes, so the cold-start budget on scale-to-zero hosting can be
+checked before a deploy.
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr: str):
+    """Returns (module, self_us, cumulative_us) rows from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def profile_startup(module: str = "main", top: int = 20, budget_ms: float = None, out=sys.stdout):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=ROOT_DIR,
+    )
+    if proc.returncode != 0:
+        out.write(proc.stderr)
+        return proc.returncode
+
+    rows = parse_importtime(proc.stderr)
+    total_us = next((cumulative for name, _, cumulative in rows if name == module), sum(r[1] for r in rows))
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    out.write(f"import {module}: {total_us / 1000:.1f} ms ({len(rows)} modules)\n\n")
+    out.write(f"{'package':<32}{'self ms':>10}{'share':>8}\n")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        out.write(f"{package:<32}{self_us / 1000:>10.1f}{self_us / total_us:>8.1%}\n")
+
+    if budget_ms is not None and total_us / 1000 > budget_ms:
+        out.write(f"\nstartup budget exceeded: {total_us / 1000:.1f} ms > {budget_ms:.1f} ms\n")
+        return 1
+    return 0
@@ -0,0 +1,26 @@
+"""
+SQLite scaffolding shared by the local stores (search index, sync snapshots,
+jobs, idempotency keys, drive trees, file cache, wiki export checkpoints, ...).
+
+A store keeps one connection opened with check_same_thread=False and
+serializes its use with a lock, so every store method is blocking and safe to
+call from the threadpool. Files are opened in WAL mode so readers do not wait
+for a writer.
+"""
+import os
+import sqlite3
+import threading
+
+
+def open_store(path, schema):
+    """(connection, lock) for the SQLite file at `path` (or ":memory:") with `schema` applied."""
+    if path != ":memory:" and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    lock = threading.Lock()
+    with lock:
+        if path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+        conn.commit()
+    return conn, lock
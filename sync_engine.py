@@ -0,0 +1,370 @@
+"""
+Background sync of slow-changing Dooray reads into a local store.
+
+For every token that asked for cached data, a scheduler re-reads projects,
+members, calendars, resources and resource categories every SYNC_INTERVAL
+seconds, plus the workflows and tags of each project. Responses are stored
+as snapshots keyed by (token, dooray_client function, arguments) in SQLite
+(SYNC_DB_PATH) and only written when their content hash changed (fresh reads
+whose hash matches the last one stored do not touch the file). Per-project
+children are re-fetched only when the project entry changed, or when their
+snapshot is older than SYNC_FULL_INTERVAL (tag/workflow edits made elsewhere
+do not always touch the project).
+
+Read routes accept `consistency=cached` (body field or query parameter) to
+be answered from a snapshot; `fresh` (the default) always calls Dooray and
+refreshes the snapshot. Writes made through this server drop the affected
+snapshot so the next cached read goes upstream.
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key, token_scope
+from config import SYNC_DB_PATH, SYNC_INTERVAL, SYNC_FULL_INTERVAL, SYNC_CONCURRENCY, SYNC_TOKEN_TTL
+from routes import on_success, cached_reader
+from store import open_store
+
+router = APIRouter()
+
+# family -> (dooray_client function, per-project argument or None)
+FAMILIES = {
+    "projects": ("get_projects", None),
+    "members": ("get_members", None),
+    "calendars": ("get_calendars", None),
+    "resources": ("get_resources", None),
+    "resource_categories": ("get_resource_categories", None),
+    "workflows": ("get_project_workflows", "project_id"),
+    "tags": ("get_project_tags", "project_id"),
+}
+CLIENT_FAMILIES = {client: family for family, (client, _) in FAMILIES.items()}
+
+# writes -> snapshots they make stale (client, argument copied from the write)
+INVALIDATES = {
+    "create_project": [("get_projects", None)],
+    "create_project_workflow": [("get_project_workflows", "project_id")],
+    "update_project_workflow": [("get_project_workflows", "project_id")],
+    "delete_project_workflow": [("get_project_workflows", "project_id")],
+    "create_admin_member": [("get_members", None)],
+    "update_admin_member": [("get_members", None)],
+    "leave_admin_member": [("get_members", None)],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    scope TEXT NOT NULL,
+    client TEXT NOT NULL,
+    args TEXT NOT NULL,
+    response TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    PRIMARY KEY (scope, client, args)
+);
+"""
+
+
+def args_key(kwargs):
+    return json.dumps(kwargs or {}, sort_keys=True, default=str)
+
+
+def content_hash(response):
+    """Hash of the payload without the envelope header, so an unchanged result hashes the same."""
+    payload = response.get("result", response) if isinstance(response, dict) else response
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _items(response):
+    result = response.get("result") if isinstance(response, dict) else response
+    return [item for item in result if isinstance(item, dict)] if isinstance(result, list) else []
+
+
+class SnapshotStore:
+    """SQLite storage of upstream responses."""
+
+    def __init__(self, path=SYNC_DB_PATH):
+        self.conn, self.lock = open_store(path, SCHEMA)
+        self.hashes = {}  # scope -> {(client, args): content hash last read or written}
+
+    def get(self, scope, client, args):
+        """(response, content_hash, synced_at) or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, content_hash, synced_at FROM snapshots WHERE scope = ? AND client = ? AND args = ?",
+                (scope, client, args),
+            ).fetchone()
+            if row:
+                self.hashes.setdefault(scope, {})[client, args] = row[1]
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def put(self, scope, client, args, response):
+        """Stores `response`; returns True when its content changed."""
+        digest = content_hash(response)
+        now = time.time()
+        with self.lock, self.conn:
+            self.hashes.setdefault(scope, {})[client, args] = digest
+            row = self.conn.execute(
+                "SELECT content_hash FROM snapshots WHERE scope = ? AND client = ? AND args = ?", (scope, client, args),
+            ).fetchone()
+            if row and row[0] == digest:
+                self.conn.execute(
+                    "UPDATE snapshots SET synced_at = ? WHERE scope = ? AND client = ? AND args = ?", (now, scope, client, args),
+                )
+                return False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots (scope, client, args, response, content_hash, synced_at, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, client, args, json.dumps(response, ensure_ascii=False), digest, now, now),
+            )
+        return True
+
+    def put_if_changed(self, scope, client, args, response):
+        """Like put, but without any write when the content hash matches the last one stored."""
+        digest = content_hash(response)
+        with self.lock:
+            unchanged = self.hashes.get(scope, {}).get((client, args)) == digest
+        return False if unchanged else self.put(scope, client, args, response)
+
+    def forget(self, scope):
+        """Drops the in-memory hashes of an expired scope (its snapshots stay on disk)."""
+        with self.lock:
+            self.hashes.pop(scope, None)
+
+    def delete(self, scope, client, args):
+        with self.lock, self.conn:
+            self.hashes.get(scope, {}).pop((client, args), None)
+            self.conn.execute("DELETE FROM snapshots WHERE scope = ? AND client = ? AND args = ?", (scope, client, args))
+
+    def ages(self, scope):
+        """client -> (snapshots, oldest synced_at, newest changed_at)."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT client, count(*), min(synced_at), max(changed_at) FROM snapshots WHERE scope = ? GROUP BY client", (scope,),
+            ).fetchall()
+        return {client: (count, oldest, changed) for client, count, oldest, changed in rows}
+
+
+class SyncEngine:
+    """Per-token sync runs (at most one at a time per token) and the periodic scheduler."""
+
+    def __init__(self, interval=SYNC_INTERVAL, full_interval=SYNC_FULL_INTERVAL,
+                 concurrency=SYNC_CONCURRENCY, token_ttl=SYNC_TOKEN_TTL):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.concurrency = concurrency
+        self.token_ttl = token_ttl
+        self.store = None
+        self.tokens = {}    # scope -> token
+        self.last_used = {}  # scope -> time of the last cached read or explicit sync
+        self.runs = {}      # scope -> running sync task
+        self.metrics = {}   # scope -> cumulative cost and the last run's per-family stats
+        self.tasks = set()
+        self._scheduler = None
+
+    def _store(self):
+        if self.store is None:
+            self.store = SnapshotStore()
+        return self.store
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def track(self, token):
+        scope = token_scope(token)
+        self.tokens[scope] = token
+        self.last_used[scope] = time.time()
+        return scope
+
+    @staticmethod
+    def _family_stats(run, client):
+        return run["families"].setdefault(
+            CLIENT_FAMILIES[client], {"calls": 0, "upstream_ms": 0.0, "changed": 0, "unchanged": 0, "skipped": 0, "errors": 0},
+        )
+
+    async def _fetch(self, scope, client, kwargs, run):
+        """Fetches one snapshot from Dooray and stores it; returns the response or None on error."""
+        stats = self._family_stats(run, client)
+        started = time.perf_counter()
+        response = await run_in_threadpool(getattr(dooray_client, client), self.tokens[scope], **kwargs)
+        stats["calls"] += 1
+        stats["upstream_ms"] = round(stats["upstream_ms"] + (time.perf_counter() - started) * 1000, 2)
+        if not isinstance(response, dict) or "error" in response:
+            stats["errors"] += 1
+            return None
+        changed = await run_in_threadpool(self._store().put, scope, client, args_key(kwargs), response)
+        stats["changed" if changed else "unchanged"] += 1
+        return response
+
+    async def _sync(self, scope):
+        started = time.perf_counter()
+        run = {"started_at": time.time(), "families": {}}
+        store = self._store()
+        previous_projects = await run_in_threadpool(store.get, scope, "get_projects", args_key({}))
+        previous_hashes = {str(p.get("id")): content_hash(p) for p in _items(previous_projects[0])} if previous_projects else {}
+
+        top_level = [client for client, parent in FAMILIES.values() if parent is None]
+        responses = await asyncio.gather(*(self._fetch(scope, client, {}, run) for client in top_level))
+        projects = _items(dict(zip(top_level, responses)).get("get_projects"))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def sync_child(client, project):
+            kwargs = {"project_id": str(project["id"])}
+            unchanged = previous_hashes.get(kwargs["project_id"]) == content_hash(project)
+            snapshot = await run_in_threadpool(store.get, scope, client, args_key(kwargs))
+            if unchanged and snapshot and time.time() - snapshot[2] < self.full_interval:
+                self._family_stats(run, client)["skipped"] += 1
+                return
+            async with semaphore:
+                await self._fetch(scope, client, kwargs, run)
+
+        children = [client for client, parent in FAMILIES.values() if parent == "project_id"]
+        await asyncio.gather(*(sync_child(client, p) for p in projects if p.get("id") for client in children))
+
+        run["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        metrics = self.metrics.setdefault(scope, {"runs": 0, "calls": 0, "upstream_ms": 0.0, "errors": 0})
+        metrics["runs"] += 1
+        for stats in run["families"].values():
+            metrics["calls"] += stats["calls"]
+            metrics["upstream_ms"] = round(metrics["upstream_ms"] + stats["upstream_ms"], 2)
+            metrics["errors"] += stats["errors"]
+        metrics["last_run"] = run
+        return run
+
+    async def _run(self, scope):
+        try:
+            return await self._sync(scope)
+        except Exception as e:
+            print(f"Error syncing Dooray data: {e}")
+            return {"error": str(e)}
+        finally:
+            self.runs.pop(scope, None)
+
+    def sync(self, token):
+        """Starts a sync run for `token` unless one is already running; returns its task."""
+        scope = self.track(token)
+        if scope not in self.runs:
+            self.runs[scope] = self._spawn(self._run(scope))
+        return self.runs[scope]
+
+    async def _schedule(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.time()
+            for scope in list(self.tokens):
+                if now - self.last_used.get(scope, 0) > self.token_ttl:
+                    self.tokens.pop(scope, None)
+                    self.last_used.pop(scope, None)
+                    self.metrics.pop(scope, None)
+                    if self.store is not None:
+                        self.store.forget(scope)
+                elif scope not in self.runs:
+                    self.runs[scope] = self._spawn(self._run(scope))
+
+    def start(self):
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            self._scheduler = None
+
+    async def read(self, token, client, kwargs):
+        """Cached read: the stored response, or None when there is no snapshot yet."""
+        scope = self.track(token)
+        snapshot = await run_in_threadpool(self._store().get, scope, client, args_key(kwargs))
+        if snapshot is None and scope not in self.runs and scope not in self.metrics:
+            self.sync(token)  # first cached read for this token: fill the store in the background
+        return snapshot[0] if snapshot else None
+
+    def store_later(self, token, client, kwargs, response):
+        self._spawn(run_in_threadpool(self._store().put_if_changed, token_scope(token), client, args_key(kwargs), response))
+
+    def invalidate_later(self, token, client, kwargs):
+        self._spawn(run_in_threadpool(self._store().delete, token_scope(token), client, args_key(kwargs)))
+
+    async def status(self, token):
+        scope = token_scope(token)
+        ages = await run_in_threadpool(self._store().ages, scope)
+        now = time.time()
+        families = {}
+        for family, (client, _) in FAMILIES.items():
+            count, oldest, changed = ages.get(client, (0, None, None))
+            families[family] = {
+                "snapshots": count,
+                "lag_seconds": round(now - oldest, 1) if oldest else None,
+                "last_changed_at": changed,
+            }
+        return {
+            "scheduled": scope in self.tokens, "syncing": scope in self.runs, "interval": self.interval,
+            "families": families, "metrics": self.metrics.get(scope),
+        }
+
+
+SYNC = SyncEngine()
+
+
+def _make_reader(client):
+    async def reader(api_key, kwargs):
+        return await SYNC.read(api_key, client, kwargs)
+    return reader
+
+
+def _make_storer(client):
+    def store(api_key, kwargs, result):
+        SYNC.store_later(api_key, client, kwargs, result)
+    return store
+
+
+for _client in CLIENT_FAMILIES:
+    cached_reader(_client)(_make_reader(_client))
+    on_success(_client)(_make_storer(_client))  # fresh reads refresh the snapshot too
+
+
+def _make_invalidator(targets):
+    def invalidate(api_key, kwargs, result):
+        for client, argument in targets:
+            SYNC.invalidate_later(api_key, client, {argument: kwargs.get(argument)} if argument else {})
+    return invalidate
+
+
+for _write, _targets in INVALIDATES.items():
+    on_success(_write)(_make_invalidator(_targets))
+
+
+def install(app):
+    """Runs the sync scheduler for the lifetime of `app`."""
+    app.router.add_event_handler("startup", SYNC.start)
+    app.router.add_event_handler("shutdown", SYNC.stop)
+
+
+# --- Sync API ---
+@router.post("/mcp/sync/run")
+async def api_sync_run(request: Request):
+    api_key = _get_api_key(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    task = SYNC.sync(api_key)
+    if not body.get("wait"):
+        return {"dooray_response": {"syncing": True}}
+    run = await asyncio.shield(task)
+    if "error" in run:
+        raise HTTPException(status_code=502, detail=run["error"])
+    return {"dooray_response": run}
+
+
+@router.post("/mcp/sync/status")
+async def api_sync_status(request: Request):
+    api_key = _get_api_key(request)
+    return {"dooray_response": await SYNC.status(api_key)}
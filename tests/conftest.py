@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules live at the repository root; keep every local store out of data/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ("SEARCH_DB_PATH", "SYNC_DB_PATH", "DRIVE_TREE_DB_PATH", "FILE_CACHE_DB_PATH", "WIKI_EXPORT_DB_PATH",
+             "BULK_DB_PATH", "JOBS_DB_PATH", "ACCOUNT_SYNC_DB_PATH", "BROADCAST_DB_PATH"):
+    os.environ.setdefault(name, ":memory:")
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import account_sync
+import bulk
+import dooray_client
+
+OK = {"header": {"isSuccessful": True}, "result": None}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    made = []
+    monkeypatch.setattr(dooray_client, "sync_users", lambda token, users: made.append(("sync", [u.get("id") or u.get("email") for u in users])) or OK)
+    monkeypatch.setattr(dooray_client, "sync_departments", lambda token, departments: made.append(("sync_dept", len(departments))) or OK)
+    monkeypatch.setattr(dooray_client, "delete_sync_user", lambda token, user_id: made.append(("delete", user_id)) or OK)
+    monkeypatch.setattr(dooray_client, "delete_sync_department", lambda token, dept_id: made.append(("delete_dept", dept_id)) or OK)
+    monkeypatch.setattr(bulk, "_LIMITERS", {})
+    pipeline = account_sync.AccountSyncPipeline()
+    pipeline.store = account_sync.AccountSyncStore(":memory:")
+    monkeypatch.setattr(account_sync, "PIPELINE", pipeline)
+    return made
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(account_sync.router)
+    return TestClient(app, headers={"Authorization": "Bearer token"})
+
+
+def sync(client, **body):
+    response = client.post("/mcp/account_sync/bulk", json={"wait": True, **body})
+    assert response.status_code == 200, response.text
+    return response.json()["dooray_response"]
+
+
+def test_delete_missing_false_string_keeps_records(calls, client):
+    sync(client, users=[{"id": "u1"}, {"id": "u2"}])
+    run = sync(client, users=[{"id": "u1"}], delete_missing="false")
+    assert run["run_id"] is None and run["summary"]["user"]["removed"] == 0
+    assert ("delete", "u2") not in calls
+
+
+def test_records_keyed_by_email_are_never_deleted(calls, client):
+    sync(client, users=[{"id": "u1"}, {"id": "u2"}, {"email": "kim@example.com"}])
+    run = sync(client, users=[{"id": "u1"}])
+    assert run["summary"]["user"]["removed"] == 1
+    assert run["summary"]["user"]["not_removable"] == 1
+    assert [call for call in calls if call[0] == "delete"] == [("delete", "u2")]
+
+
+def test_runs_of_one_scope_do_not_overlap(calls, monkeypatch):
+    active, overlaps = [0], []
+
+    async def execute(token, step):
+        active[0] += 1
+        overlaps.append(active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return OK
+
+    async def scenario():
+        pipeline = account_sync.PIPELINE
+        monkeypatch.setattr(pipeline, "_execute_step", execute)
+        first, _ = pipeline.plan("token", users=[{"id": "u1"}])
+        second, _ = pipeline.plan("token", users=[{"id": "u1"}, {"id": "u2"}])
+        await asyncio.gather(pipeline.start("token", first), pipeline.start("token", second))
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert max(overlaps) == 1
+    assert pipeline.scope_locks == {}
@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import archive
+import bulk
+import file_cache
+from file_cache import BlobIndex, FileCache
+
+FILES = {"1": b"a" * 3000, "2": b"b" * 5000, "3": b"c" * 100}
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    def metadata(token, drive_id, file_id):
+        if file_id not in FILES:
+            return {"error": "API request failed", "status_code": 404}
+        return {"result": {"id": file_id, "name": f"{file_id}.bin", "updatedAt": "2026-06-01T00:00:00+09:00"}}
+
+    def download(token, drive_id, file_id, write):
+        write(FILES[file_id])
+        return {"ok": True}
+
+    monkeypatch.setitem(file_cache.SOURCES, "drive", (metadata, download, ("drive_id", "file_id")))
+    monkeypatch.setattr(bulk, "_LIMITERS", {})
+    cache = FileCache()
+    cache.index = BlobIndex(":memory:", str(tmp_path), max_bytes=1000)  # smaller than every file but one
+    monkeypatch.setattr(archive, "FILE_CACHE", cache)
+    return cache
+
+
+def build(file_ids, archive_format="zip", checksums=False):
+    async def collect():
+        files = [{"file_id": file_id, "name": None} for file_id in file_ids]
+        return b"".join([chunk async for chunk in archive.archive_stream(
+            "token", "9", files, archive_format, checksums, concurrency=2,
+        )])
+    return asyncio.run(collect())
+
+
+def test_zip_of_files_larger_than_the_cache_is_complete():
+    with zipfile.ZipFile(io.BytesIO(build(["1", "2", "3"], checksums=True))) as zipped:
+        contents = {name: zipped.read(name) for name in zipped.namelist()}
+    assert {name: contents[name] for name in ("1.bin", "2.bin", "3.bin")} == {
+        "1.bin": FILES["1"], "2.bin": FILES["2"], "3.bin": FILES["3"],
+    }
+    assert "ERRORS.txt" not in contents
+    assert f"{hashlib.sha256(FILES['2']).hexdigest()}  2.bin\n" in contents["SHA256SUMS"].decode()
+
+
+def test_tar_lists_files_that_could_not_be_fetched():
+    with tarfile.open(fileobj=io.BytesIO(build(["3", "404"], "tar"))) as tarred:
+        names = tarred.getnames()
+        errors = tarred.extractfile("ERRORS.txt").read().decode()
+        content = tarred.extractfile("3.bin").read()
+    assert names == ["3.bin", "ERRORS.txt"]
+    assert errors.startswith("404: ") and content == FILES["3"]
@@ -0,0 +1,38 @@
+import asyncio
+
+import availability
+import dooray_client
+
+RESOURCES = {"result": [{"id": "r1", "name": "Room 1"}, {"id": "r2", "name": "Room 2"}]}
+START, END = "2024-06-03T10:00:00+09:00", "2024-06-03T11:00:00+09:00"
+
+
+def test_booking_rechecks_the_index_rebuilt_while_it_waited(monkeypatch):
+    booked = []
+
+    def create_resource_reservation(token, **kwargs):
+        booked.append(kwargs["resource_id"])
+        return {"header": {"isSuccessful": True}, "result": {"id": "new"}}
+
+    monkeypatch.setattr(dooray_client, "get_resources", lambda token: RESOURCES)
+    monkeypatch.setattr(dooray_client, "get_resource_categories", lambda token: {"result": []})
+    monkeypatch.setattr(dooray_client, "get_resource_reservations", lambda token: {"result": []})
+    monkeypatch.setattr(dooray_client, "create_resource_reservation", create_resource_reservation)
+
+    async def scenario():
+        service = availability.AvailabilityService()
+        monkeypatch.setattr(availability, "AVAILABILITY", service)
+        index = await service.get("token")
+        async with service.booking_lock("token", "r1"):
+            booking = asyncio.create_task(availability.book_first_available("token", START, END, "sync"))
+            await asyncio.sleep(0.05)
+            rebuilt = availability.AvailabilityIndex()
+            taken = {"id": "other", "resourceId": "r1", "startedAt": START, "endedAt": END}
+            rebuilt.rebuild(RESOURCES, {"result": []}, {"result": [taken]}, index)
+            service.cache.put("token", value=rebuilt)
+        return await booking, service.booking_locks
+
+    outcome, locks = asyncio.run(scenario())
+    assert [a["outcome"] for a in outcome["attempts"]] == ["taken", "reserved"]
+    assert booked == ["r2"]
+    assert locks == {}
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import broadcast
+import bulk
+import dooray_client
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    deliveries = []
+
+    def send_message(token, recipient, message):
+        deliveries.append((token, recipient))
+        return {"header": {"isSuccessful": True}, "result": None}
+
+    monkeypatch.setattr(dooray_client, "send_message", send_message)
+    monkeypatch.setattr(bulk, "_LIMITERS", {})
+    return deliveries
+
+
+async def wait_done(service, token, job_id):
+    for _ in range(200):
+        job = await service.get(token, job_id)
+        if job.finished_at:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("broadcast did not finish")
+
+
+def test_throttled_token_does_not_hold_up_other_tokens(sent):
+    async def scenario():
+        service = broadcast.BroadcastService(workers=1)
+        bulk.limiter_for("slow").rate = 1
+        bulk.limiter_for("slow").tokens = bulk.limiter_for("slow").burst = 1
+        await service.submit("slow", "hi", ["s1", "s2", "s3"])
+        fast = await service.submit("fast", "hi", ["f1", "f2"])
+        await wait_done(service, "fast", fast.id)
+        service.stop()
+
+    run(scenario())
+    assert [r for t, r in sent if t == "fast"] == ["f1", "f2"]
+    assert [r for t, r in sent if t == "slow"] == ["s1"]
+
+
+def test_unfinished_job_resumes_after_restart(sent):
+    async def scenario():
+        store = broadcast.BroadcastStore(":memory:")
+        job = broadcast.BroadcastJob("token", "hi", ["m1", "m2"])
+        store.create(job)
+        job.sent = 1
+        store.record(job, "m1", "sent", 1)
+
+        service = broadcast.BroadcastService()
+        service.store = store
+        job = await wait_done(service, "token", job.id)
+        service.stop()
+        return job.status(), await service.get("other", job.id)
+
+    status, foreign = run(scenario())
+    assert sent == [("token", "m2")]
+    assert (status["state"], status["sent"], status["pending"]) == ("done", 2, 0)
+    assert foreign is None
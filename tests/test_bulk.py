@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+import bulk
+from bulk import IdempotencyStore, limiter_for, read_rows, run_rows
+
+
+class Upload:
+    def __init__(self, content_type, *chunks):
+        self.headers = {"content-type": content_type}
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def rows(content_type, *chunks):
+    return asyncio.run(read_rows(Upload(content_type, *chunks), "items"))
+
+
+def test_csv_quoted_cells_may_span_lines_and_chunks():
+    body = 'subject,body,tags\r\nFirst,"line one\r\n\r\nline ""two""",["a"]\nSecond,plain,\n'.encode()
+    assert rows("text/csv", body[:30], body[30:]) == [
+        {"subject": "First", "body": "line one\n\nline \"two\"", "tags": ["a"]},
+        {"subject": "Second", "body": "plain"},
+    ]
+
+
+def test_csv_unterminated_quote_is_reported():
+    assert rows("text/csv", b'subject,body\nFirst,"open\n') == [{"_error": "unterminated quoted CSV cell"}]
+
+
+def test_ndjson_bad_lines_are_reported():
+    assert rows("application/x-ndjson", b'{"a": 1}\n\nnope\n[1]\n') == [
+        {"a": 1}, {"_error": "invalid JSON line: Expecting value: line 1 column 1 (char 0)"},
+        {"_error": "each line must be a JSON object"},
+    ]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = IdempotencyStore(":memory:")
+    monkeypatch.setattr(bulk, "_idempotency", store)
+    monkeypatch.setattr(bulk, "_LIMITERS", {})
+    return store
+
+
+async def collect(rows, execute):
+    return sorted([outcome async for outcome in run_rows("token", rows, execute, "test")], key=lambda o: o["index"])
+
+
+def test_replayed_and_invalid_rows_take_no_rate_limit_token(store):
+    executed = []
+
+    async def execute(row):
+        executed.append(row["key"])
+        return {"id": row["key"]}
+
+    async def scenario():
+        limiter = limiter_for("token")
+        limiter.rate, limiter.burst, limiter.tokens = 0.001, 1, 1.0
+        first = await collect([{"key": "k1"}], execute)
+        # no token left: only rows that do not execute can finish
+        second = await asyncio.wait_for(collect([{"key": "k1"}, {"_error": "bad"}], execute), 1)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [o["status"] for o in first] == ["ok"]
+    assert [o["status"] for o in second] == ["replayed", "invalid"]
+    assert executed == ["k1"]
+
+
+def test_retry_while_the_result_is_stored_is_not_executed_again(store, monkeypatch):
+    storing, release = threading.Event(), threading.Event()
+    put = store.put
+
+    def slow_put(*args):
+        storing.set()
+        release.wait(5)
+        put(*args)
+
+    monkeypatch.setattr(store, "put", slow_put)
+    executed = []
+
+    async def execute(row):
+        executed.append(row["key"])
+        return {"id": "1"}
+
+    async def scenario():
+        first = asyncio.ensure_future(collect([{"key": "k1"}], execute))
+        while not storing.is_set():
+            await asyncio.sleep(0.01)
+        retry = await collect([{"key": "k1"}], execute)
+        release.set()
+        return await first, retry
+
+    first, retry = asyncio.run(scenario())
+    assert [o["status"] for o in first] == ["ok"]
+    assert [o["status"] for o in retry] == ["duplicate"]
+    assert executed == ["k1"]
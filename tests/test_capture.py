@@ -0,0 +1,20 @@
+from urllib.parse import parse_qs
+
+from capture import REDACTED, redact_headers, redact_query
+
+
+def test_session_id_header_is_redacted():
+    headers = redact_headers({"Mcp-Session-Id": "abc", "Accept": "application/json"})
+    assert headers == {"Mcp-Session-Id": REDACTED, "Accept": "application/json"}
+
+
+def test_inbound_query_is_redacted_by_key():
+    query = parse_qs(redact_query("api_key=k1&token=t&session_id=s&async=true&q=kim@example.com"))
+    assert query["api_key"] == query["token"] == query["session_id"] == [REDACTED]
+    assert query["async"] == ["true"]
+    assert query["q"] == [REDACTED]
+    assert redact_query("condense=") == "condense="
+
+
+def test_upstream_params_are_redacted_as_a_dict():
+    assert redact_query({"password": "p", "page": 1}) == {"password": REDACTED, "page": 1}
@@ -0,0 +1,55 @@
+import pytest
+
+from condense import condense_options, condense_text
+
+
+def test_condense_text_replaces_images_and_collapses_blank_lines():
+    body = "intro\n\n\n\n![diagram](https://x/y.png) and ![](data:image/png;base64,AAAA)\n"
+    text, facts = condense_text(body)
+    assert text == "intro\n\n[image: diagram] and [image]"
+    assert facts == {"original_chars": len(body), "chars": len(text), "truncated": False}
+
+
+def test_condense_text_keeps_images_when_asked():
+    text, _ = condense_text("![a](b.png)", options=condense_options({"strip_images": False}))
+    assert text == "![a](b.png)"
+
+
+def test_condense_text_turns_html_into_text():
+    body = "<p>Hello&nbsp;<b>world</b></p><!-- hidden --><ul><li>one</li><li>two</li></ul><img alt='logo' src='l.png'>"
+    text, _ = condense_text(body, "text/html")
+    assert text == "Hello\xa0world\n\n- one\n- two[image: logo]"
+
+
+def test_condense_text_shortens_tables():
+    table = "| h |\n|---|\n" + "".join(f"| {n} |\n" for n in range(10))
+    text, _ = condense_text(table, options=condense_options({"table_rows": 2}))
+    assert text == "| h |\n|---|\n| 0 |\n| 1 |\n| … 8 more rows |"
+
+
+def test_condense_text_keeps_one_section_and_lists_the_headings():
+    text, facts = condense_text("# A\n\na\n\n## B\n\nb\n\n# C\n\nc", options=condense_options({"section": "B"}))
+    assert text == "## B\n\nb"
+    assert facts["sections"] == ["# A", "## B", "# C"]
+
+
+def test_condense_text_truncates_at_a_line_boundary():
+    text, facts = condense_text("\n".join(["line"] * 20), options=condense_options({"max_chars": 30}))
+    assert text.startswith("line\nline\nline\nline\nline\nline\n\n… [truncated: 29 of 99 characters]")
+    assert facts["truncated"] and facts["sections"] == []
+
+
+@pytest.mark.parametrize("value", [{"max_chars": "many"}, {"colour": True}, "maybe-json{", 3])
+def test_condense_options_rejects(value):
+    with pytest.raises(ValueError):
+        condense_options(value)
+
+
+@pytest.mark.parametrize("value, key, expected", [
+    ("true", "max_chars", condense_options(True)["max_chars"]),
+    ('{"max_chars": 10}', "max_chars", 10),
+    ({"section": "A"}, "section", "A"),
+    ({"strip_images": 0}, "strip_images", False),
+])
+def test_condense_options_accepts_query_and_body_values(value, key, expected):
+    assert condense_options(value)[key] == expected
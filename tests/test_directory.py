@@ -0,0 +1,21 @@
+from directory import DirectoryIndex
+
+ORG_CHART = {"result": [{
+    "id": "d1", "name": "Engineering",
+    "departments": [
+        {"id": "d2", "name": "Infra"},  # leaf department: no child or member lists
+        {"id": "d3", "name": "Platform", "type": "department"},
+        {"id": "m1", "name": "김민수", "emailAddress": "minsu@example.com"},
+        {"id": "m2", "name": "Lee", "type": "member"},
+        {"type": "member", "member": {"organizationMemberId": "m3", "name": "Park"}},
+    ],
+}]}
+
+
+def test_leaf_departments_and_members_are_told_apart_by_shape():
+    index = DirectoryIndex()
+    index.rebuild(ORG_CHART, {"result": []})
+    assert set(index.departments) == {"d1", "d2", "d3"}
+    assert index.departments["d2"]["parentId"] == "d1"
+    assert set(index.members) == {"m1", "m2", "m3"}
+    assert index.members["m1"]["departmentIds"] == ["d1"]
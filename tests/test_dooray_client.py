@@ -0,0 +1,14 @@
+import pytest
+
+import dooray_client
+
+ERROR = {"error": "API request failed", "status_code": 404, "response": "not found"}
+
+
+def test_payload_unwraps_the_result_and_raises_error_dicts():
+    assert dooray_client.payload({"header": {}, "result": [1]}) == [1]
+    assert dooray_client.payload([1]) == [1]
+    with pytest.raises(dooray_client.DoorayError) as raised:
+        dooray_client.payload(ERROR)
+    assert (str(raised.value), raised.value.status_code, raised.value.error) == ("not found", 404, "API request failed")
+    assert isinstance(raised.value, RuntimeError)
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import os
+import threading
+
+import pytest
+
+import file_cache
+from file_cache import BlobIndex, FileCache
+
+FILES = {"1": b"a" * 300, "2": b"b" * 500, "3": b"c" * 2000}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    downloads = []
+    gate = threading.Event()
+    gate.set()
+
+    def metadata(token, drive_id, file_id):
+        return {"result": {"id": file_id, "name": f"{file_id}.bin", "updatedAt": "2026-06-01T00:00:00+09:00"}}
+
+    def download(token, drive_id, file_id, write):
+        downloads.append(file_id)
+        content = FILES[file_id]
+        write(content[:100])
+        gate.wait(5)
+        write(content[100:])
+        return {"ok": True}
+
+    monkeypatch.setitem(file_cache.SOURCES, "drive", (metadata, download, ("drive_id", "file_id")))
+    cache = FileCache()
+    cache.index = BlobIndex(":memory:", str(tmp_path), max_bytes=1000)
+    cache.downloads_made, cache.gate = downloads, gate
+    return cache
+
+
+def ids(file_id):
+    return {"drive_id": "9", "file_id": file_id}
+
+
+async def body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_miss_then_hit(cache):
+    async def scenario():
+        miss = await cache.serve("token", "drive", ids("1"))
+        content = await body(miss)
+        hit = await cache.serve("token", "drive", ids("1"))
+        await hit.background()
+        return miss.headers["X-Cache"], content, hit.headers["X-Cache"], open(hit.path, "rb").read()
+
+    assert asyncio.run(scenario()) == ("miss", FILES["1"], "hit", FILES["1"])
+    assert cache.downloads_made == ["1"]
+    assert cache.index.pins == {}
+
+
+def test_concurrent_misses_share_one_download(cache):
+    async def scenario():
+        cache.gate.clear()
+        first = await cache.serve("token", "drive", ids("2"))
+        second = await cache.serve("token", "drive", ids("2"))
+        asyncio.get_running_loop().call_later(0.05, cache.gate.set)
+        return first.headers["X-Cache"], second.headers["X-Cache"], await asyncio.gather(body(first), body(second))
+
+    assert asyncio.run(scenario()) == ("miss", "shared", [FILES["2"], FILES["2"]])
+    assert cache.downloads_made == ["2"]
+    assert cache.index.pins == {}
+
+
+def test_blob_larger_than_the_cache_is_still_served_whole(cache):
+    async def scenario():
+        await cache.fetch("token", "drive", ids("1"))
+        _, handle = await cache.fetch("token", "drive", ids("3"))
+        with handle:
+            return handle.read(), os.path.basename(handle.name)
+
+    content, name = asyncio.run(scenario())
+    assert content == FILES["3"] and name == hashlib.sha256(FILES["3"]).hexdigest()
+    assert not os.path.exists(cache.index.blob_path(hashlib.sha256(FILES["1"]).hexdigest()))
+
+
+def test_open_handle_survives_eviction(cache):
+    async def scenario():
+        _, handle = await cache.fetch("token", "drive", ids("2"))
+        await cache.fetch("token", "drive", ids("3"))  # evicts the first blob
+        with handle:
+            return os.path.exists(handle.name), handle.read()
+
+    assert asyncio.run(scenario()) == (False, FILES["2"])
+
+
+def test_pinned_blobs_are_not_evicted(tmp_path):
+    index = BlobIndex(":memory:", str(tmp_path), max_bytes=100)
+
+    def add(file_id):
+        temp = tmp_path / f"{file_id}.part"
+        temp.write_bytes(b"x" * 79 + file_id.encode())
+        return index.add("drive", file_id, "v", str(temp), hashlib.sha256(temp.read_bytes()).hexdigest(), 80)
+
+    index.release(add("1"))
+    second = add("2")  # evicts the first one, not itself
+    assert index.lookup("drive", "1", "v") is None and os.path.exists(second)
+    index.release(second)
+    assert index.lookup("drive", "2", "v", pin=True) == second  # e.g. a hit being sent
+    third = add("3")
+    assert os.path.exists(second) and os.path.exists(third)
+    index.release(second)
+    index.release(third)
+    assert index.evict() == 1 and not os.path.exists(second) and index.pins == {}
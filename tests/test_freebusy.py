@@ -0,0 +1,54 @@
+from datetime import datetime, time, timedelta, timezone
+
+from freebusy import DEFAULT_TZ, free_slots, merge_intervals, parse_zone
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2026, 6, day, hour, minute, tzinfo=DEFAULT_TZ)
+
+
+def test_merge_intervals_joins_overlapping_and_touching():
+    assert merge_intervals([(at(10), at(11)), (at(9), at(10)), (at(13), at(14)), (at(10, 30), at(12))]) == [
+        (at(9), at(12)), (at(13), at(14)),
+    ]
+
+
+def test_free_slots_between_busy_intervals():
+    busy = [(at(10), at(11)), (at(12), at(13))]
+    assert free_slots(busy, at(9), at(18)) == [(at(9), at(10)), (at(11), at(12)), (at(13), at(18))]
+
+
+def test_free_slots_busy_outside_the_window():
+    busy = [(at(7), at(9, 30)), (at(17), at(20))]
+    assert free_slots(busy, at(9), at(18)) == [(at(9, 30), at(17))]
+
+
+def test_free_slots_minimum_duration():
+    busy = [(at(10), at(11)), (at(11, 15), at(12))]
+    assert free_slots(busy, at(10), at(13), min_duration=timedelta(minutes=30)) == [(at(12), at(13))]
+
+
+def test_free_slots_clipped_to_working_hours_across_days():
+    slots = free_slots([], at(17), at(10, day=2), working_hours=(time(9), time(18)))
+    assert slots == [(at(17), at(18)), (at(9, day=2), at(10, day=2))]
+
+
+def test_free_slots_whole_window_busy():
+    assert free_slots([(at(8), at(19))], at(9), at(18)) == []
+
+
+def test_free_slots_working_hours_in_kst_for_a_utc_window():
+    utc = timezone.utc
+    slots = free_slots([], datetime(2026, 6, 1, 0, tzinfo=utc), datetime(2026, 6, 2, 0, tzinfo=utc),
+                       working_hours=(time(9), time(18)))
+    assert slots == [(at(9), at(18))]
+
+
+def test_free_slots_working_hours_in_requested_timezone():
+    utc = timezone.utc
+    slots = free_slots([], at(0), at(23, 59), working_hours=(time(9), time(18)), tz=parse_zone("UTC"))
+    assert slots == [
+        (datetime(2026, 5, 31, 15, tzinfo=utc), datetime(2026, 5, 31, 18, tzinfo=utc)),
+        (datetime(2026, 6, 1, 9, tzinfo=utc), datetime(2026, 6, 1, 14, 59, tzinfo=utc)),
+    ]
+    assert parse_zone("+09:00").utcoffset(None) == timedelta(hours=9)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+import pytest
+
+from auth import token_scope
+from jobs import Job, JobManager, JobStore
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def store():
+    return JobStore(":memory:")
+
+
+def manager(store, factory=None):
+    jobs = JobManager(per_token=1)
+    jobs.store = store
+    if factory is not None:
+        jobs.resumable(factory)
+    return jobs
+
+
+async def finished(jobs, token, job_id):
+    for _ in range(200):
+        status = await jobs.status(token, job_id)
+        if status["finished_at"]:
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_result_is_stored_and_read_after_restart(store):
+    async def work(job):
+        job.progress(1, 2)
+        return {"ok": True}
+
+    async def scenario():
+        job = await manager(store).submit("token", "kind", work)
+        status = await finished(manager(store), "token", job.id)
+        return status, await manager(store).status("other", job.id)
+
+    status, foreign = run(scenario())
+    assert (status["state"], status["result"], status["progress"]["done"]) == ("completed", {"ok": True}, 1)
+    assert foreign is None
+
+
+def test_late_queued_write_does_not_undo_the_start(store):
+    job = Job(None, "scope", "kind")
+    queued = job.snapshot()
+    job.state, job.started_at = "running", 10.0
+    store.save(job.snapshot())
+    store.save(queued)
+    status = store.get(job.id, "scope")
+    assert (status["state"], status["started_at"]) == ("running", 10.0)
+
+
+def test_restart_requeues_never_started_and_idempotent_jobs(store):
+    calls = []
+
+    def factory(token, call):
+        async def work(job):
+            calls.append(call["name"])
+            return call["name"]
+        return work
+
+    rows = {}
+    for name, state, started_at, idempotent in [
+        ("queued", "queued", None, False), ("repeatable", "running", 1.0, True), ("write", "running", 1.0, False),
+    ]:
+        job = Job(None, token_scope("token"), name, json.dumps({"name": name, "idempotent": idempotent}))
+        job.state, job.started_at = state, started_at
+        store.save(job.snapshot())
+        rows[name] = job.id
+
+    async def scenario():
+        jobs = manager(store, factory)
+        return {name: (await finished(jobs, "token", job_id) if name != "write" else await jobs.status("token", job_id))
+                for name, job_id in rows.items()}
+
+    statuses = run(scenario())
+    assert sorted(calls) == ["queued", "repeatable"]
+    assert statuses["queued"]["state"] == statuses["repeatable"]["state"] == "completed"
+    assert statuses["write"]["state"] == "interrupted"
+
+
+def test_cancel_stops_the_job_and_stores_it(store):
+    async def work(job):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        jobs = manager(store)
+        job = await jobs.submit("token", "kind", work)
+        await asyncio.sleep(0.01)
+        cancelled = await jobs.cancel("token", job.id)
+        return cancelled, store.get(job.id, job.scope)
+
+    cancelled, stored = run(scenario())
+    assert cancelled["state"] == stored["state"] == "cancelled"
+    assert stored["finished_at"] is not None
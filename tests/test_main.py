@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+import main
+from startup_profile import ROOT_DIR
+
+
+def test_rarely_used_routers_are_not_imported_at_startup():
+    check = f"import sys, main; print(sorted({set(main.LAZY_ROUTERS.values())!r} & set(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, cwd=ROOT_DIR, check=True)
+    assert proc.stdout.strip() == "[]"
+
+
+def test_lazy_router_is_mounted_on_first_request():
+    client = TestClient(main.app)
+    response = client.post("/mcp/account_sync/bulk/status", json={"run_id": "missing"}, headers={"X-API-Key": "token"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "run not found"
+    assert "/mcp/wiki/export" in client.get("/openapi.json").json()["paths"]
@@ -0,0 +1,73 @@
+import ast
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import mcp_http
+
+ACCEPT = {"Accept": "application/json, text/event-stream"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(mcp_http, "DOORAY_API_TOKEN", "token")
+    app = FastAPI()
+    app.include_router(mcp_http.router)
+    return TestClient(app)
+
+
+def call_tool(client, name, arguments, headers=ACCEPT):
+    body = {"jsonrpc": "2.0", "id": 1, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments, "_meta": {"progressToken": "p"}}}
+    response = client.post("/mcp", json=body, headers=headers)
+    if response.headers["content-type"].startswith("application/json"):
+        return [response.json()]
+    return [json.loads(line[5:]) for line in response.text.splitlines() if line.startswith("data:")]
+
+
+def listing(messages):
+    final = [m for m in messages if m.get("id") == 1]
+    assert len(final) == 1
+    return ast.literal_eval(final[0]["result"]["content"][0]["text"])
+
+
+def test_streamed_project_pages_still_end_with_every_item(client, monkeypatch):
+    pages = {None: {"header": {"nextCursor": "b"}, "result": [{"id": "1"}]}, "b": {"header": {}, "result": [{"id": "2"}]}}
+    monkeypatch.setattr(mcp_http, "dooray_get_projects", lambda access_token, limit=50, cursor=None: pages[cursor])
+    messages = call_tool(client, "dooray_getProjects", {})
+    partials = [m for m in messages if m.get("method") == "notifications/dooray/partialResult"]
+    assert len(partials) == 2
+    assert listing(messages)["result"] == [{"id": "1"}, {"id": "2"}]
+
+
+def test_streamed_drive_files_end_with_every_item(client, monkeypatch):
+    files = [{"id": str(i)} for i in range(150)]
+
+    def get_drive_files(access_token, drive_id, parent_id=None, page=None, size=None):
+        return {"result": files[page * size:(page + 1) * size], "totalCount": len(files)}
+
+    monkeypatch.setattr(mcp_http, "dooray_get_drive_files", get_drive_files)
+    result = listing(call_tool(client, "dooray_getDriveFiles", {"driveId": "5"}))
+    assert (result["result"], result["totalCount"], result["pages"]) == (files, 150, 2)
+
+
+def test_plain_json_call_reads_one_page(client, monkeypatch):
+    monkeypatch.setattr(mcp_http, "dooray_get_projects",
+                        lambda access_token, limit=50, cursor=None: {"header": {"nextCursor": "b"}, "result": [{"id": "1"}]})
+    result = listing(call_tool(client, "dooray_getProjects", {}, headers={"Accept": "application/json"}))
+    assert result["result"] == [{"id": "1"}]
+
+
+@pytest.mark.parametrize("arguments, exact", [({"book": True, "subject": "s"}, True), ({}, False)])
+def test_booking_resolves_names_exactly(client, monkeypatch, arguments, exact):
+    seen = []
+
+    async def resolve_arguments(token, arguments, exact=False):
+        seen.append(exact)
+        raise ValueError("stop")
+
+    monkeypatch.setattr(mcp_http, "resolve_arguments", resolve_arguments)
+    call_tool(client, "dooray_findAvailableResources", dict(arguments, resourceIds=["Room"]), headers={})
+    assert seen == [exact]
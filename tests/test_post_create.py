@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import dooray_client
+import post_create
+from directory import DirectoryIndex
+from post_create import _assignee, create_task, due_date_value
+from resolver import AmbiguousName, UnknownName
+
+MEMBERS = {"result": [
+    {"id": "1", "name": "Kim Minsu", "emailAddress": "minsu@example.com"},
+    {"id": "2", "name": "Lee Younghee", "emailAddress": "younghee@example.com"},
+    {"id": "3", "name": "Park Jisoo", "emailAddress": "jisoo@example.com"},
+    {"id": "4", "name": "Park Jisoo", "emailAddress": "jisoo2@example.com"},
+]}
+
+
+@pytest.fixture
+def index():
+    index = DirectoryIndex()
+    index.rebuild({"result": []}, MEMBERS)
+    return index
+
+
+def _id(entry):
+    return entry["member"]["organizationMemberId"]
+
+
+@pytest.mark.parametrize("value, member_id", [("123", "123"), ("minsu@example.com", "1"), ("kim  minsu", "1")])
+def test_assignee(index, value, member_id):
+    assert _id(_assignee(index, value)) == member_id
+
+
+def test_assignee_outside_the_organization_is_an_email_user(index):
+    assert _assignee(index, "guest@other.com") == {"type": "emailUser", "emailUser": {"emailAddress": "guest@other.com"}}
+
+
+def test_assignee_prefix_is_not_enough_for_a_write(index):
+    with pytest.raises(AmbiguousName, match="only matches by prefix.*Kim Minsu <minsu@example.com>"):
+        _assignee(index, "Kim")
+
+
+def test_assignee_shared_name_is_ambiguous(index):
+    with pytest.raises(AmbiguousName, match="is ambiguous"):
+        _assignee(index, "Park Jisoo")
+
+
+def test_assignee_unknown(index):
+    with pytest.raises(UnknownName):
+        _assignee(index, "Choi")
+
+
+def test_assignee_exact_name_found_among_many_prefix_matches():
+    index = DirectoryIndex()
+    index.rebuild({"result": []}, {"result": [{"id": str(i), "name": f"Kim {i:02d}"} for i in range(20)] + [{"id": "99", "name": "Kim"}]})
+    assert _id(_assignee(index, "Kim")) == "99"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-06-01", "2026-06-01T23:59:59+09:00"),
+    ("2026-06-01T10:00:00Z", "2026-06-01T10:00:00+00:00"),
+    ("2026-06-01 10:00", "2026-06-01T10:00:00+09:00"),
+])
+def test_due_date_value(value, expected):
+    assert due_date_value(value) == expected
+
+
+def test_due_date_value_rejects_other_text():
+    with pytest.raises(ValueError, match="dueDate 'tomorrow'"):
+        due_date_value("tomorrow")
+
+
+def test_create_task_writes_once_with_everything_resolved(monkeypatch, index):
+    writes = []
+
+    async def directory(token):
+        return index
+
+    def create_project_post(access_token, **kwargs):
+        writes.append(kwargs)
+        return {"result": {"id": "900"}}
+
+    monkeypatch.setattr(post_create.DIRECTORY, "get", directory)
+    monkeypatch.setattr(dooray_client, "create_project_post", create_project_post)
+    result = asyncio.run(create_task("token", "10", "Title", assignees=["Lee Younghee", "7"], due_date="2026-06-01"))
+    assert result == {"result": {"id": "900"}}
+    assert writes == [{
+        "project_id": "10", "subject": "Title", "body": "",
+        "users": {"to": [post_create._member("2"), post_create._member("7")], "cc": []},
+        "due_date": "2026-06-01T23:59:59+09:00",
+    }]
+
+
+@pytest.mark.parametrize("kwargs", [{"subject": ""}, {"assignees": "Kim"}, {"due_date": "soon"}])
+def test_create_task_rejects_invalid_arguments_before_any_read(monkeypatch, kwargs):
+    monkeypatch.setattr(dooray_client, "create_project_post", lambda *a, **k: pytest.fail("no write expected"))
+    arguments = dict({"subject": "Title"}, **kwargs)
+    with pytest.raises(ValueError):
+        asyncio.run(create_task("token", "10", arguments.pop("subject"), **arguments))
@@ -0,0 +1,62 @@
+import pytest
+
+from resolver import AmbiguousName, NameMap, UnknownName, is_id
+
+PROJECTS = {"result": [
+    {"id": "101", "code": "KIC", "name": "KIC main"},
+    {"id": "102", "code": "KIC-OPS", "name": "Operations"},
+    {"id": "103", "code": "WEB", "name": "Website"},
+    {"id": "104", "code": "APP", "name": "Mobile app"},
+]}
+WORKFLOWS = {"result": [{"id": "1", "name": "To do"}, {"id": "2", "name": "Doing"}, {"id": "3", "name": "Done"}]}
+
+
+@pytest.mark.parametrize("kind, response, name, expected_id, matched_by", [
+    ("project", PROJECTS, "103", "103", "id"),
+    ("project", PROJECTS, "KIC", "101", "name"),
+    ("project", PROJECTS, "kic", "101", "name"),
+    ("project", PROJECTS, "  Mobile   APP ", "104", "name"),
+    ("project", PROJECTS, "Operations", "102", "name"),
+    ("project", PROJECTS, "Webs", "103", "prefix"),
+    ("workflow", WORKFLOWS, "Doen", "3", "fuzzy"),
+])
+def test_match(kind, response, name, expected_id, matched_by):
+    match = NameMap(kind, response).match(name)
+    assert (match["id"], match["matched_by"]) == (expected_id, matched_by)
+
+
+def test_match_ambiguous_prefix_lists_the_candidates():
+    with pytest.raises(AmbiguousName, match="'KIC main' \\(101\\), 'Operations' \\(102\\)"):
+        NameMap("project", PROJECTS).match("KI")
+
+
+def test_match_unknown_suggests_close_names():
+    with pytest.raises(UnknownName, match="did you mean 'Doing'"):
+        NameMap("workflow", WORKFLOWS).match("Dxxng")
+
+
+def test_match_unknown_without_suggestions():
+    with pytest.raises(UnknownName, match="^project 'zzz' not found$"):
+        NameMap("project", PROJECTS).match("zzz")
+
+
+@pytest.mark.parametrize("name", ["Webs", "Mob"])
+def test_match_exact_refuses_prefix_matches(name):
+    with pytest.raises(AmbiguousName, match="only matches by prefix"):
+        NameMap("project", PROJECTS).match(name, exact=True)
+
+
+def test_match_exact_accepts_names_and_codes():
+    name_map = NameMap("project", PROJECTS)
+    assert name_map.match("website", exact=True)["id"] == "103"
+    assert name_map.match("KIC-OPS", exact=True)["id"] == "102"
+
+
+def test_name_map_of_an_error_response():
+    with pytest.raises(RuntimeError):
+        NameMap("project", {"error": "API request failed", "response": "forbidden"})
+
+
+@pytest.mark.parametrize("value, expected", [("123", True), ("*", True), (123, True), ("KIC", False), ("12a", False)])
+def test_is_id(value, expected):
+    assert is_id(value) is expected
@@ -0,0 +1,114 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import dooray_client
+from routes import Field, opt, route, parse_arguments, register_routes, _b64decode
+
+HEADERS = {"X-API-Key": "token"}
+
+
+@pytest.mark.parametrize("spec, body, expected", [
+    (route("/p", "f", "project_id"), {"project_id": "1"}, {"project_id": "1"}),
+    (route("/p", "f", "project_id", opt("body", "")), {"project_id": "1"}, {"project_id": "1", "body": ""}),
+    (route("/p", "f", "project_id", opt("parent_id")), {"project_id": "1"}, {"project_id": "1"}),
+    (route("/p", "f", opt("calendar_id", "*")), {}, {"calendar_id": "*"}),
+    (route("/p", "f", Field("users", kind=list)), {"users": [1, 2]}, {"users": [1, 2]}),
+    (route("/p", "f", Field("file_content_base64", arg="file_content", decode=_b64decode)),
+     {"file_content_base64": "aGk="}, {"file_content": b"hi"}),
+    (route("/p", "f", "id", opt("a"), opt("b"), any_of=("a", "b")), {"id": "1", "b": "x"}, {"id": "1", "b": "x"}),
+    (route("/p", "f", "id"), {"id": "1", "ignored": True}, {"id": "1"}),
+])
+def test_parse_arguments(spec, body, expected):
+    assert parse_arguments(spec, body) == expected
+
+
+@pytest.mark.parametrize("spec, body, detail", [
+    (route("/p", "f", "project_id"), {}, "project_id is required"),
+    (route("/p", "f", "project_id", "post_id"), {"project_id": "1"}, "project_id and post_id are required"),
+    (route("/p", "f", "a", "b", "c"), {"a": 1}, "a, b and c are required"),
+    (route("/p", "f", Field("users", kind=list)), {"users": "1"}, "users (list) is required"),
+    (route("/p", "f", "id", opt("a"), any_of=("a",), detail="id and a are required"), {"id": "1"}, "id and a are required"),
+    (route("/p", "f", Field("data", decode=_b64decode)), {"data": "a"}, "Invalid base64 content"),
+])
+def test_parse_arguments_rejects(spec, body, detail):
+    with pytest.raises(HTTPException) as raised:
+        parse_arguments(spec, body)
+    assert raised.value.status_code == 400
+    assert raised.value.detail == detail
+
+
+def _client(monkeypatch, spec, upstream):
+    monkeypatch.setattr(dooray_client, spec.client, upstream, raising=False)
+    app = FastAPI()
+    register_routes(app, [spec])
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("spec, body, upstream_result, status, response", [
+    (route("/t", "fake_read", "item_id"), {"item_id": "7"}, {"result": {"id": "7"}}, 200,
+     {"dooray_response": {"result": {"id": "7"}}}),
+    (route("/t", "fake_read", "item_id"), {}, None, 400, {"detail": "item_id is required"}),
+    (route("/t", "fake_read", "item_id"), {"item_id": "7"}, {"error": "API request failed", "status_code": 404}, 404,
+     {"detail": "API request failed"}),
+    (route("/t", "fake_read", "item_id", raw=True), {"item_id": "7"}, b"\x00bytes", 200, b"\x00bytes"),
+    (route("/t", "fake_read", "item_id"), {"item_id": "7", "consistency": "stale"}, {"result": {}}, 400,
+     {"detail": "consistency must be cached or fresh"}),
+])
+def test_make_handler(monkeypatch, spec, body, upstream_result, status, response):
+    calls = []
+
+    def upstream(access_token, **kwargs):
+        calls.append((access_token, kwargs))
+        return upstream_result
+
+    response_ = _client(monkeypatch, spec, upstream).post("/t", json=body, headers=HEADERS)
+    assert response_.status_code == status
+    assert (response_.content if spec.raw else response_.json()) == response
+    if status == 200:
+        assert calls == [("token", {"item_id": "7"})]
+
+
+def test_make_handler_requires_a_token(monkeypatch):
+    client = _client(monkeypatch, route("/t", "fake_read", "item_id"), lambda access_token, **kwargs: {})
+    assert client.post("/t", json={"item_id": "7"}).status_code == 401
+
+
+def test_make_handler_accepts_an_empty_body_without_fields(monkeypatch):
+    spec = route("/t", "fake_list")
+    client = _client(monkeypatch, spec, lambda access_token: {"result": []})
+    assert client.post("/t", headers=HEADERS).json() == {"dooray_response": {"result": []}}
+
+
+@pytest.mark.parametrize("cacheable, served_from", [(True, "cache"), (False, "upstream")])
+def test_cached_reads_only_for_cacheable_routes(monkeypatch, cacheable, served_from):
+    from routes import cached_reader
+
+    @cached_reader("fake_cached")
+    async def reader(api_key, kwargs):
+        return {"from": "cache"}
+
+    spec = route("/t", "fake_cached", "item_id", cacheable=cacheable)
+    client = _client(monkeypatch, spec, lambda access_token, item_id: {"from": "upstream"})
+    body = {"item_id": "7", "consistency": "cached"}
+    assert client.post("/t", json=body, headers=HEADERS).json() == {"dooray_response": {"from": served_from}}
+
+
+def test_invalid_filter_options_are_rejected_before_the_upstream_call(monkeypatch):
+    from routes import result_filter
+
+    def parse(options):
+        if options != "ok":
+            raise ValueError("bad options")
+        return {"parsed": True}
+
+    @result_filter("fake_filtered", parse_options=parse)
+    def filter_(result, options):
+        return dict(result, options=options)
+
+    calls = []
+    client = _client(monkeypatch, route("/t", "fake_filtered"), lambda access_token: calls.append(1) or {"result": 1})
+    rejected = client.post("/t", json={"condense": "nope"}, headers=HEADERS)
+    assert (rejected.status_code, rejected.json(), calls) == (400, {"detail": "bad options"}, [])
+    accepted = client.post("/t", json={"condense": "ok"}, headers=HEADERS)
+    assert accepted.json() == {"dooray_response": {"result": 1, "options": {"parsed": True}}}
@@ -0,0 +1,20 @@
+import asyncio
+
+import dooray_client
+import search_index
+
+
+def test_finished_crawl_keeps_no_raw_token(monkeypatch):
+    monkeypatch.setattr(dooray_client, "get_all_projects", lambda token: {"result": []})
+    monkeypatch.setattr(dooray_client, "get_wikis", lambda token: {"result": []})
+
+    async def scenario():
+        service = search_index.SearchService()
+        service.index = search_index.SearchIndex(":memory:")
+        stats = await service.crawl("secret-token")
+        return service, stats
+
+    service, stats = asyncio.run(scenario())
+    assert stats["containers"] == 0
+    assert service.crawls == {}
+    assert "secret-token" not in repr(vars(service))
@@ -0,0 +1,31 @@
+import asyncio
+
+import sync_engine
+
+RESPONSE = {"header": {"isSuccessful": True}, "result": [{"id": "p1"}]}
+
+
+def test_fresh_read_with_unchanged_content_does_not_write():
+    store = sync_engine.SnapshotStore(":memory:")
+    assert store.put_if_changed("scope", "get_projects", "{}", RESPONSE)
+    writes = store.conn.total_changes
+    assert not store.put_if_changed("scope", "get_projects", "{}", dict(RESPONSE, header={"isSuccessful": True, "x": 1}))
+    assert store.conn.total_changes == writes
+    assert store.put_if_changed("scope", "get_projects", "{}", {"result": [{"id": "p2"}]})
+    store.delete("scope", "get_projects", "{}")
+    assert store.put_if_changed("scope", "get_projects", "{}", {"result": [{"id": "p2"}]})
+
+
+def test_idle_scope_is_forgotten():
+    async def scenario():
+        engine = sync_engine.SyncEngine(interval=0.01, token_ttl=60)
+        engine.store = sync_engine.SnapshotStore(":memory:")
+        engine.store.put("scope", "get_projects", "{}", RESPONSE)
+        engine.tokens["scope"], engine.last_used["scope"], engine.metrics["scope"] = "token", 0, {}
+        engine.start()
+        await asyncio.sleep(0.05)
+        engine.stop()
+        return engine
+
+    engine = asyncio.run(scenario())
+    assert engine.tokens == engine.last_used == engine.metrics == engine.store.hashes == {}
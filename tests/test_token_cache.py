@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from token_cache import TokenCache
+
+
+class Builder:
+    def __init__(self, delay=0.01, fail=False):
+        self.delay, self.fail = delay, fail
+        self.calls = []
+
+    async def __call__(self, token, *args, previous=None):
+        self.calls.append((token, args, previous))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream failed")
+        return f"{token}:{len(self.calls)}"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_misses_share_one_build():
+    async def scenario():
+        build = Builder()
+        cache = TokenCache(build, max_age=60)
+        values = await asyncio.gather(*(cache.get("token", "kind") for _ in range(5)))
+        return build.calls, values
+
+    calls, values = run(scenario())
+    assert calls == [("token", ("kind",), None)]
+    assert values == ["token:1"] * 5
+
+
+def test_stale_value_answers_while_refreshing_in_background():
+    async def scenario():
+        build = Builder()
+        cache = TokenCache(build, max_age=0)
+        first = await cache.get("token")
+        stale = await cache.get("token")
+        await asyncio.gather(*cache.tasks)
+        return first, stale, await cache.get("token"), build.calls[1][2]
+
+    assert run(scenario()) == ("token:1", "token:1", "token:2", "token:1")
+
+
+def test_stale_value_rebuilt_before_answering_without_background_refresh():
+    async def scenario():
+        cache = TokenCache(Builder(), max_age=0, refresh_in_background=False)
+        return await cache.get("token"), await cache.get("token")
+
+    assert run(scenario()) == ("token:1", "token:2")
+
+
+def test_failed_build_is_raised_and_not_cached():
+    async def scenario():
+        build = Builder(fail=True)
+        cache = TokenCache(build, max_age=60)
+        with pytest.raises(RuntimeError):
+            await cache.get("token")
+        build.fail = False
+        return await cache.get("token")
+
+    assert run(scenario()) == "token:2"
+
+
+def test_keys_hold_the_token_scope_not_the_token():
+    async def scenario():
+        cache = TokenCache(Builder(), max_age=60)
+        await cache.get("secret-token", "a")
+        return cache
+
+    cache = run(scenario())
+    assert all("secret-token" not in key for key in cache.values)
+
+
+def test_idle_keys_are_dropped():
+    async def scenario():
+        cache = TokenCache(Builder(), max_age=60, idle_ttl=0)
+        await cache.get("idle")
+        await asyncio.sleep(0.01)
+        await cache.get("active")
+        return cache
+
+    cache = run(scenario())
+    assert cache.peek("idle") is None and cache.peek("active") == "active:2"
+
+
+def test_put_invalidate_and_discard():
+    async def scenario():
+        cache = TokenCache(Builder(), max_age=60)
+        cache.put("token", "k", value="stored")
+        stored = await cache.get("token", "k")
+        cache.discard("token", "k", value="other")
+        kept = cache.peek("token", "k")
+        cache.invalidate("token", "k")
+        return stored, kept, await cache.get("token", "k")
+
+    assert run(scenario()) == ("stored", "stored", "token:1")
@@ -0,0 +1,78 @@
+import pytest
+
+from wiki_patch import PatchConflict, apply_section_edits, apply_unified_diff
+
+PAGE = "# Title\n\nintro\n\n## Setup\n\ninstall\nrun\n\n## Usage\n\ncall it\n"
+
+
+def test_apply_unified_diff():
+    diff = "--- a\n+++ b\n@@ -7,2 +7,2 @@\n install\n-run\n+run it\n"
+    assert apply_unified_diff(PAGE, diff) == PAGE.replace("run\n", "run it\n")
+
+
+def test_apply_unified_diff_finds_a_moved_hunk():
+    diff = "@@ -1,1 +1,2 @@\n install\n+configure\n"
+    assert apply_unified_diff(PAGE, diff) == PAGE.replace("install\n", "install\nconfigure\n")
+
+
+def test_apply_unified_diff_inserts_after_line():
+    diff = "@@ -1,0 +2,1 @@\n+subtitle\n"
+    assert apply_unified_diff("a\nb", diff) == "a\nsubtitle\nb"
+
+
+def test_apply_unified_diff_applies_several_hunks_in_order():
+    diff = "@@ -1,1 +1,1 @@\n-a\n+A\n@@ -3,1 +3,1 @@\n-c\n+C\n"
+    assert apply_unified_diff("a\nb\nc", diff) == "A\nb\nC"
+
+
+def test_apply_unified_diff_only_looks_near_the_header_line():
+    text = "\n".join(["target"] + ["x"] * 200)
+    with pytest.raises(PatchConflict):
+        apply_unified_diff(text, "@@ -150,1 +150,1 @@\n-target\n+done\n")
+    assert apply_unified_diff(text, "@@ -60,1 +60,1 @@\n-target\n+done\n").startswith("done\n")
+
+
+def test_apply_unified_diff_refuses_a_stale_context():
+    with pytest.raises(PatchConflict):
+        apply_unified_diff(PAGE, "@@ -7,1 +7,1 @@\n-uninstall\n+remove\n")
+
+
+@pytest.mark.parametrize("diff", ["no hunks here", "@@ -1,3 +1,3 @@\n a\n", "@@ -1,1 +1,1 @@\n?a\n"])
+def test_apply_unified_diff_rejects_malformed_patches(diff):
+    with pytest.raises(ValueError):
+        apply_unified_diff("a\nb", diff)
+
+
+@pytest.mark.parametrize("edit, expected", [
+    ({"section": "Setup", "content": "pip install"},
+     "# Title\n\nintro\n\n## Setup\n\npip install\n\n## Usage\n\ncall it\n"),
+    ({"section": "Setup", "op": "append", "content": "test"},
+     "# Title\n\nintro\n\n## Setup\n\ninstall\nrun\ntest\n\n## Usage\n\ncall it\n"),
+    ({"section": "## Usage", "op": "prepend", "content": "import it"},
+     "# Title\n\nintro\n\n## Setup\n\ninstall\nrun\n\n## Usage\n\nimport it\ncall it\n"),
+    ({"section": "setup", "op": "delete"}, "# Title\n\nintro\n\n## Usage\n\ncall it\n"),
+])
+def test_apply_section_edits(edit, expected):
+    assert apply_section_edits(PAGE, [edit]) == expected
+
+
+def test_apply_section_edits_ignores_headings_in_code_fences():
+    text = "## A\n\n```\n## B\n```\n\n## B\n\nold\n"
+    assert apply_section_edits(text, [{"section": "B", "content": "new"}]) == "## A\n\n```\n## B\n```\n\n## B\n\nnew\n"
+
+
+def test_apply_section_edits_replaces_subsections_with_their_section():
+    assert apply_section_edits(PAGE, [{"section": "# Title", "content": "all"}]) == "# Title\n\nall\n"
+
+
+@pytest.mark.parametrize("edits, message", [
+    ([{"section": "Missing", "content": "x"}], "not found"),
+    ([{"section": "Setup", "op": "rename"}], "op must be"),
+    ([{"section": "Setup"}], "content is required"),
+    ([{"op": "delete"}], "section is required"),
+    ([{"section": "A", "op": "delete"}], "ambiguous"),
+])
+def test_apply_section_edits_rejects(edits, message):
+    text = PAGE + "\n## A\n\n# A\n"
+    with pytest.raises(ValueError, match=message):
+        apply_section_edits(text, edits)
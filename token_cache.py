@@ -0,0 +1,104 @@
+"""
+Per-token single-flight cache for values built from upstream reads.
+
+The directory and availability indexes, the resolver's name maps and the
+context reads all need the same thing: one build per key at a time (callers
+missing the same key wait for the build in flight instead of starting their
+own) and a value older than `max_age` rebuilt, either in the background while
+the old value keeps answering or before answering.
+
+Keys are the token's scope (auth.token_scope) plus the caller's arguments. The
+raw token is only handed to `build`, never stored, and keys not read for
+`idle_ttl` seconds are dropped with their value.
+"""
+import asyncio
+import time
+
+from auth import token_scope
+
+
+class TokenCache:
+    def __init__(self, build, max_age, refresh_in_background=True, idle_ttl=None, name="cache"):
+        """
+        `await build(token, *args, previous=<current value or None>)` returns the new
+        value for (token, *args); exceptions reach the callers waiting for it.
+        """
+        self.build = build
+        self.max_age = max_age
+        self.refresh_in_background = refresh_in_background
+        self.idle_ttl = idle_ttl
+        self.name = name
+        self.values = {}    # (scope, *args) -> (built_at, value)
+        self.builds = {}    # (scope, *args) -> future of the value being built
+        self.read_at = {}   # (scope, *args) -> last read or write
+        self.tasks = set()  # background refreshes, referenced until done
+        self.swept_at = time.monotonic()
+
+    @staticmethod
+    def key(token, *args):
+        return (token_scope(token),) + args
+
+    async def _store(self, key, token, args):
+        current = self.values.get(key)
+        value = await self.build(token, *args, previous=current[1] if current else None)
+        self.values[key] = (time.monotonic(), value)
+        return value
+
+    def _build(self, key, token, args):
+        if key not in self.builds:
+            future = asyncio.ensure_future(self._store(key, token, args))
+            future.add_done_callback(lambda _: self.builds.pop(key, None))
+            self.builds[key] = future
+        return self.builds[key]
+
+    async def _refresh_in_background(self, key, token, args):
+        try:
+            await self._build(key, token, args)
+        except Exception as e:
+            print(f"Error refreshing {self.name}: {e}")
+
+    def _sweep(self, now):
+        if self.idle_ttl is None or now - self.swept_at < min(self.idle_ttl, 60):
+            return
+        self.swept_at = now
+        for key in [key for key, read_at in self.read_at.items() if now - read_at > self.idle_ttl]:
+            if key not in self.builds:
+                del self.read_at[key]
+                self.values.pop(key, None)
+
+    async def get(self, token, *args, force_refresh=False):
+        key = self.key(token, *args)
+        now = time.monotonic()
+        self._sweep(now)
+        self.read_at[key] = now
+        entry = self.values.get(key)
+        stale = entry is not None and now - entry[0] > self.max_age
+        if entry is None or force_refresh or (stale and not self.refresh_in_background):
+            # shielded: a cancelled caller does not cancel the build others wait for
+            return await asyncio.shield(self._build(key, token, args))
+        if stale and key not in self.builds:
+            task = asyncio.create_task(self._refresh_in_background(key, token, args))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return entry[1]
+
+    def peek(self, token, *args):
+        """The current value, or None; never builds."""
+        entry = self.values.get(self.key(token, *args))
+        return entry[1] if entry else None
+
+    def put(self, token, *args, value):
+        key = self.key(token, *args)
+        now = time.monotonic()
+        self.values[key] = (now, value)
+        self.read_at[key] = now
+
+    def invalidate(self, token, *args):
+        self.values.pop(self.key(token, *args), None)
+
+    def discard(self, token, *args, value):
+        """Drops the entry only while it still holds `value`, e.g. an error response not worth keeping."""
+        key = self.key(token, *args)
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is value:
+            del self.values[key]
@@ -0,0 +1,467 @@
+"""
+Wiki export and import.
+
+get_wiki_pages lists one level of the page tree (children of parentPageId)
+and every page body is another get_wiki_page call, so the exporter walks the
+tree with WIKI_EXPORT_CONCURRENCY workers sharing a frontier of pages whose
+children are still to be listed, fetching each page with its comments under
+the token's rate limit (bulk.py). Pages are exported as NDJSON records
+(content, comments and file references) in completion order, or as a tar of
+markdown files laid out like the page tree.
+
+Every exported page is checkpointed in SQLite (WIKI_EXPORT_DB_PATH) under the
+export's ID. Running the export again with that ID reuses checkpointed pages
+whose version is unchanged instead of fetching them again; an NDJSON export
+also skips the pages it already delivered, so an interrupted download is
+resumed by appending the rest.
+
+The import takes such records and creates the pages level by level: the pages
+of one level are created concurrently once their parents exist. Rows are keyed
+(bulk.py idempotency), so an import that stopped half-way can be sent again.
+"""
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from archive import TarWriter, _Sink, _mtime
+from auth import _get_api_key, token_scope
+from bulk import NDJSON, limiter_for, read_rows, run_rows, respond_rows
+from config import WIKI_EXPORT_DB_PATH, WIKI_EXPORT_CONCURRENCY, WIKI_EXPORT_TTL, BULK_CONCURRENCY
+from routes import notify_success
+from store import open_store
+
+router = APIRouter()
+
+FORMATS = ("ndjson", "markdown")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    scope TEXT NOT NULL,
+    export_id TEXT NOT NULL,
+    wiki_id TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, export_id)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    scope TEXT NOT NULL,
+    export_id TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    record TEXT NOT NULL,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, export_id, page_id)
+);
+"""
+
+
+def _version(item):
+    for field in ("version", "updatedAt", "lastUpdatedAt", "modifiedAt"):
+        if item.get(field) is not None:
+            return str(item[field])
+    return ""
+
+
+def _segment(title):
+    """A page title usable as one path segment of the markdown tree."""
+    name = " ".join(str(title or "").replace("/", "∕").split()).strip(".")
+    return name[:120] or "untitled"
+
+
+class CheckpointStore:
+    """Exported pages by export ID."""
+
+    def __init__(self, path=WIKI_EXPORT_DB_PATH, ttl=WIKI_EXPORT_TTL):
+        self.conn, self.lock = open_store(path, SCHEMA)
+        cutoff = time.time() - ttl
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM pages WHERE (scope, export_id) IN (SELECT scope, export_id FROM exports WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            self.conn.execute("DELETE FROM exports WHERE updated_at < ?", (cutoff,))
+
+    def open(self, scope, export_id, wiki_id):
+        """{page_id: (version, record, delivered)} checkpointed for the export; ValueError when it belongs to another wiki."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT wiki_id FROM exports WHERE scope = ? AND export_id = ?", (scope, export_id),
+            ).fetchone()
+            if row is not None and row[0] != wiki_id:
+                raise ValueError(f"export {export_id} is an export of wiki {row[0]}")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO exports (scope, export_id, wiki_id, updated_at) VALUES (?, ?, ?, ?)",
+                (scope, export_id, wiki_id, time.time()),
+            )
+            rows = self.conn.execute(
+                "SELECT page_id, version, record, delivered FROM pages WHERE scope = ? AND export_id = ?", (scope, export_id),
+            ).fetchall()
+        return {page_id: (version, json.loads(record), bool(delivered)) for page_id, version, record, delivered in rows}
+
+    def save(self, scope, export_id, record):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (scope, export_id, page_id, version, record, delivered) VALUES (?, ?, ?, ?, ?, 0)",
+                (scope, export_id, record["id"], record["version"], json.dumps(record, ensure_ascii=False, default=str)),
+            )
+
+    def delivered(self, scope, export_id, page_ids):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE pages SET delivered = 1 WHERE scope = ? AND export_id = ? AND page_id = ?",
+                [(scope, export_id, page_id) for page_id in page_ids],
+            )
+            self.conn.execute(
+                "UPDATE exports SET updated_at = ? WHERE scope = ? AND export_id = ?", (time.time(), scope, export_id),
+            )
+
+
+_checkpoints = None
+
+
+def _store():
+    global _checkpoints
+    if _checkpoints is None:
+        _checkpoints = CheckpointStore()
+    return _checkpoints
+
+
+def _comment(item):
+    content = item.get("content") or item.get("body") or {}
+    return {
+        "id": str(item.get("id", "")),
+        "creator": item.get("creator"),
+        "created_at": item.get("createdAt"),
+        "content": content.get("content", "") if isinstance(content, dict) else str(content),
+    }
+
+
+def _record(item, page, comments, parent_id, path):
+    body = page.get("body") or page.get("content") or {}
+    return {
+        "type": "page",
+        "id": str(item["id"]),
+        "parent_id": parent_id,
+        "path": path,
+        "title": page.get("subject") or page.get("title") or item.get("subject") or item.get("title") or "",
+        "version": _version(item) or _version(page),
+        "updated_at": page.get("updatedAt") or page.get("modifiedAt") or page.get("createdAt"),
+        "mime_type": body.get("mimeType", "text/x-markdown") if isinstance(body, dict) else "text/x-markdown",
+        "content": body.get("content", "") if isinstance(body, dict) else str(body),
+        "files": [
+            {"id": str(f.get("id", "")), "name": f.get("name"), "size": f.get("size")}
+            for f in page.get("files") or () if isinstance(f, dict)
+        ],
+        "comments": comments,
+    }
+
+
+class WikiExport:
+    """One run of an export: the tree walk feeding page records (and error records) to `records()`."""
+
+    def __init__(self, token, wiki_id, export_id, comments=True, concurrency=WIKI_EXPORT_CONCURRENCY):
+        self.token = token
+        self.scope = token_scope(token)
+        self.wiki_id = str(wiki_id)
+        self.export_id = export_id
+        self.comments = comments
+        self.concurrency = concurrency
+        self.limiter = limiter_for(token)
+        self.checkpoint = {}
+        self.roots = None
+        self.stats = {"pages": 0, "fetched": 0, "reused": 0, "skipped": 0, "errors": 0}
+
+    async def _call(self, func, *args):
+        await self.limiter.acquire()
+        return dooray_client.payload(await run_in_threadpool(func, self.token, self.wiki_id, *args))
+
+    async def _children(self, page_id):
+        items = await self._call(dooray_client.get_wiki_pages, page_id)
+        items = [item for item in items if isinstance(item, dict) and item.get("id")] if isinstance(items, list) else []
+        if any("parentPageId" in item for item in items):  # keep only this level if more came back
+            items = [item for item in items if str(item.get("parentPageId") or "") == str(page_id or "")]
+        return items
+
+    async def start(self):
+        """Opens the checkpoint and lists the top level, so a bad wiki ID fails before anything is streamed."""
+        self.checkpoint = await run_in_threadpool(_store().open, self.scope, self.export_id, self.wiki_id)
+        self.roots = await self._children(None)
+
+    async def _page(self, item, parent_id, path):
+        page_id = str(item["id"])
+        stored = self.checkpoint.get(page_id)
+        if stored is not None and stored[0] == _version(item) and _version(item) and stored[1]["path"] == path:
+            self.stats["reused"] += 1
+            return stored[1], stored[2]
+        if self.comments:
+            page, comments = await asyncio.gather(
+                self._call(dooray_client.get_wiki_page, page_id), self._call(dooray_client.get_wiki_page_comments, page_id),
+            )
+        else:
+            page, comments = await self._call(dooray_client.get_wiki_page, page_id), []
+        page = page if isinstance(page, dict) else {}
+        comments = [_comment(c) for c in comments if isinstance(c, dict)] if isinstance(comments, list) else []
+        record = _record(item, page, comments, parent_id, path)
+        await run_in_threadpool(_store().save, self.scope, self.export_id, record)
+        self.stats["fetched"] += 1
+        return record, False
+
+    async def records(self, skip_delivered=False):
+        """Page records (and {"type": "error"} records) in completion order; call start() first."""
+        frontier = asyncio.Queue()
+        output = asyncio.Queue()
+
+        def enqueue(items, parent_id, parent_path):
+            used = set()
+            for item in items:
+                name = base = _segment(item.get("subject") or item.get("title"))
+                number = 1
+                while name.casefold() in used:
+                    number += 1
+                    name = f"{base} ({number})"
+                used.add(name.casefold())
+                frontier.put_nowait((item, parent_id, f"{parent_path}/{name}" if parent_path else name))
+
+        async def visit(item, parent_id, path):
+            page_id = str(item["id"])
+            try:
+                record, delivered = await self._page(item, parent_id, path)
+                if skip_delivered and delivered:
+                    self.stats["skipped"] += 1
+                else:
+                    output.put_nowait(record)
+                self.stats["pages"] += 1
+            except RuntimeError as e:
+                self.stats["errors"] += 1
+                output.put_nowait({"type": "error", "id": page_id, "path": path, "error": str(e)})
+            try:
+                enqueue(await self._children(page_id), page_id, path)
+            except RuntimeError as e:
+                self.stats["errors"] += 1
+                output.put_nowait({"type": "error", "id": page_id, "path": path, "error": f"listing child pages: {e}"})
+
+        async def worker():
+            while True:
+                task = await frontier.get()
+                try:
+                    await visit(*task)
+                except Exception as e:
+                    print(f"Error exporting wiki page {task[0].get('id')}: {e}")
+                finally:
+                    frontier.task_done()
+
+        enqueue(self.roots or (), None, "")
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, self.concurrency))]
+        done = asyncio.create_task(frontier.join())
+        try:
+            while True:
+                getter = asyncio.ensure_future(output.get())
+                await asyncio.wait((getter, done), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                yield getter.result()
+            while not output.empty():
+                yield output.get_nowait()
+        finally:
+            done.cancel()
+            for task in workers:
+                task.cancel()
+
+    def summary(self):
+        return dict(self.stats, type="summary", export_id=self.export_id, wiki_id=self.wiki_id)
+
+    async def ndjson(self, resume=False):
+        """NDJSON lines; each page is marked delivered once its line has been handed to the server."""
+        async for record in self.records(skip_delivered=resume):
+            yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            if record["type"] == "page":
+                await run_in_threadpool(_store().delivered, self.scope, self.export_id, [record["id"]])
+        yield json.dumps(self.summary(), ensure_ascii=False) + "\n"
+
+    async def markdown_tar(self):
+        """A tar of <page path>.md files (front matter, body, comments) and ERRORS.txt for pages that failed."""
+        sink = _Sink()
+        writer = TarWriter(sink)
+        errors = []
+
+        def add(name, text, mtime):
+            data = text.encode()
+            entry = writer.open(name, len(data), mtime)
+            entry.write(data)
+            entry.close()
+
+        async for record in self.records():
+            if record["type"] == "error":
+                errors.append(f"{record['path']} ({record['id']}): {record['error']}")
+                continue
+            add(f"{record['path']}.md", markdown_page(record), _mtime(record.get("updated_at")))
+            yield sink.drain()
+        if errors:
+            add("ERRORS.txt", "\n".join(errors) + "\n", datetime.now(timezone.utc))
+        add(".export.json", json.dumps(self.summary(), ensure_ascii=False, indent=2) + "\n", datetime.now(timezone.utc))
+        writer.close()
+        yield sink.drain()
+
+
+def markdown_page(record):
+    """Markdown for one exported page; the front matter values are JSON (so also valid YAML)."""
+    front = {key: record.get(key) for key in ("id", "parent_id", "title", "version", "updated_at", "files")}
+    lines = ["---"] + [f"{key}: {json.dumps(value, ensure_ascii=False)}" for key, value in front.items()] + ["---", ""]
+    lines += [f"# {record['title']}", "", record["content"].rstrip(), ""]
+    if record["comments"]:
+        lines += ["## Comments", ""]
+        for comment in record["comments"]:
+            creator = comment.get("creator")
+            if isinstance(creator, dict):
+                creator = (creator.get("member") or {}).get("organizationMemberId") or creator.get("name")
+            lines += [f"### {creator or 'unknown'} ({comment.get('created_at') or ''})", "", comment["content"].rstrip(), ""]
+    return "\n".join(lines)
+
+
+def _level_order(rows):
+    """Row indexes in waves: pages whose parent is not among the rows first, then their children, and so on."""
+    ids = {str(row["id"]): index for index, row in enumerate(rows) if row.get("id")}
+    children = {}
+    roots = []
+    for index, row in enumerate(rows):
+        parent = str(row.get("parent_id") or "")
+        if parent and parent in ids and ids[parent] != index:
+            children.setdefault(parent, []).append(index)
+        else:
+            roots.append(index)
+    return roots, children
+
+
+async def import_pages(token, wiki_id, rows, parent_page_id=None, comments=False, concurrency=BULK_CONCURRENCY):
+    """
+    Creates the pages of exported records in `wiki_id` (under `parent_page_id`), one level
+    at a time, and yields bulk row results whose "index" is the row's position in `rows`.
+    """
+    rows = [row for row in rows if row.get("type", "page") == "page" or "_error" in row]
+    roots, children = _level_order(rows)
+    created = {}  # exported page ID -> new page ID
+
+    async def execute(row):
+        if not row.get("title"):
+            raise ValueError("title is required")
+        parent = created.get(str(row.get("parent_id") or ""), parent_page_id)
+        kwargs = {
+            "wiki_id": wiki_id, "title": str(row["title"]), "content": str(row.get("content") or ""),
+            "parent_page_id": parent,
+        }
+        result = await run_in_threadpool(dooray_client.create_wiki_page, token, **kwargs)
+        dooray_client.payload(result)
+        notify_success("create_wiki_page", token, kwargs, result)
+        page_id = str(((result or {}).get("result") or {}).get("id", ""))
+        failed = 0
+        for comment in (row.get("comments") or ()) if comments else ():
+            response = await run_in_threadpool(
+                dooray_client.create_wiki_page_comment, token, wiki_id, page_id, str(comment.get("content") or ""),
+            )
+            failed += isinstance(response, dict) and "error" in response
+        outcome = {"source_id": row.get("id"), "page_id": page_id, "parent_page_id": parent}
+        return dict(outcome, comments_failed=failed) if failed else outcome
+
+    wave = roots
+    while wave:
+        batch = []
+        for index in wave:
+            row = dict(rows[index])
+            if row.get("key") in (None, "") and row.get("id"):
+                # re-sending the same export to the same place does not duplicate pages
+                row["key"] = f"{wiki_id}/{parent_page_id or ''}/{row['id']}"
+            batch.append(row)
+        next_wave = []
+        async for outcome in run_rows(token, batch, execute, "wiki_import", concurrency):
+            if outcome["index"] is None:
+                yield outcome
+                continue
+            index = wave[outcome["index"]]
+            source_id = str(rows[index].get("id") or "")
+            outcome["index"] = index
+            yield outcome
+            if outcome["status"] in ("ok", "replayed") and source_id:
+                created[source_id] = outcome["result"]["page_id"]
+                next_wave.extend(children.get(source_id, ()))
+            else:
+                for orphan in _descendants(rows, children, source_id):
+                    yield {
+                        "index": orphan, "key": rows[orphan].get("key"), "status": "error",
+                        "error": f"parent page {rows[orphan].get('parent_id')} was not imported",
+                    }
+        wave = next_wave
+
+
+def _descendants(rows, children, page_id):
+    """Indexes of the rows below an exported page ID."""
+    pending = list(children.get(page_id, ())) if page_id else []
+    while pending:
+        index = pending.pop()
+        yield index
+        pending.extend(children.get(str(rows[index].get("id") or ""), ()))
+
+
+# --- Wiki Export / Import API ---
+@router.post("/mcp/wiki/export")
+async def api_wiki_export(request: Request):
+    """
+    Body: {"wiki_id": "...", "format": "ndjson" | "markdown", "comments": true, "export_id": "<to resume>"}.
+    The export ID is returned in the X-Export-Id header and the NDJSON summary line.
+    """
+    api_key = _get_api_key(request)
+    body = await request.json()
+    wiki_id = body.get("wiki_id")
+    export_format = body.get("format", "ndjson")
+    if not wiki_id:
+        raise HTTPException(status_code=400, detail="wiki_id is required")
+    if export_format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or markdown")
+    resume = bool(body.get("export_id"))
+    export = WikiExport(api_key, wiki_id, str(body.get("export_id") or uuid.uuid4().hex), bool(body.get("comments", True)))
+    try:
+        await export.start()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    headers = {"X-Export-Id": export.export_id}
+    if export_format == "markdown":
+        headers["Content-Disposition"] = f'attachment; filename="wiki-{export.wiki_id}.tar"'
+        return StreamingResponse(export.markdown_tar(), media_type="application/x-tar", headers=headers)
+    return StreamingResponse(export.ndjson(resume), media_type=NDJSON, headers=headers)
+
+
+@router.post("/mcp/wiki/import")
+async def api_wiki_import(request: Request):
+    """
+    Body: {"wiki_id": "...", "parent_page_id": "...", "pages": [<exported page records>]}, or the
+    records as NDJSON with ?wiki_id= (and ?parent_page_id=, ?comments=true).
+    """
+    api_key = _get_api_key(request)
+    params = dict(request.query_params)
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if isinstance(body, dict):
+            params = dict({k: body[k] for k in ("wiki_id", "parent_page_id", "comments", "concurrency") if k in body}, **params)
+    if not params.get("wiki_id"):
+        raise HTTPException(status_code=400, detail="wiki_id is required")
+    try:
+        concurrency = min(BULK_CONCURRENCY, max(1, int(params.get("concurrency", BULK_CONCURRENCY))))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="concurrency must be an integer")
+    comments = str(params.get("comments", "")).lower() in ("1", "true", "yes")
+    rows = await read_rows(request, "pages")
+    results = import_pages(
+        api_key, str(params["wiki_id"]), rows, params.get("parent_page_id") or None, comments, concurrency,
+    )
+    return await respond_rows(request, results)
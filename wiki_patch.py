@@ -0,0 +1,239 @@
+"""
+Patch-style wiki page edits.
+
+Instead of sending a whole page body, a caller sends a unified diff or a list
+of section edits (by markdown heading). The current content is fetched, the
+change is applied here and update_wiki_page_content is only called when the
+content actually changed.
+
+Edits are optimistic: with `base_version` the patch is refused (409) when the
+page has changed since that version was read, and diff hunks whose context
+no longer matches the page are refused the same way instead of being applied
+at a guessed position. A hunk that moved is looked for at most HUNK_WINDOW
+lines away from the line its header names.
+"""
+import hashlib
+import re
+
+from fastapi import APIRouter, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import dooray_client
+from auth import _get_api_key
+from routes import notify_success
+
+router = APIRouter()
+
+SECTION_OPS = ("replace", "append", "prepend", "delete")
+HUNK_WINDOW = 100  # lines a hunk may have moved from its header position
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+class PatchConflict(Exception):
+    """The patch was made against other content than the page has now."""
+
+
+def page_version(page, content):
+    """The page's version field, or a hash of its content when the API gives none."""
+    if page.get("version") is not None:
+        return str(page["version"])
+    return "sha256:" + hashlib.sha256(content.encode()).hexdigest()
+
+
+def _parse_hunks(diff):
+    """[(old_start, old_lines, new_lines)] of a unified diff; ValueError when it is malformed."""
+    hunks = []
+    lines = diff.replace("\r\n", "\n").split("\n")
+    position = 0
+    while position < len(lines):
+        match = _HUNK.match(lines[position])
+        position += 1
+        if not match:
+            continue  # file headers (---, +++, diff, index) and trailing text
+        old_start, old_count = int(match.group(1)), int(match.group(2) or 1)
+        new_count = int(match.group(4) or 1)
+        old, new = [], []
+        while len(old) < old_count or len(new) < new_count:
+            if position >= len(lines):
+                raise ValueError(f"hunk {len(hunks) + 1} is truncated")
+            line = lines[position]
+            position += 1
+            if line.startswith("\\"):  # "\ No newline at end of file"
+                continue
+            tag, text = (line[:1], line[1:]) if line else (" ", "")
+            if tag == " ":
+                old.append(text)
+                new.append(text)
+            elif tag == "-":
+                old.append(text)
+            elif tag == "+":
+                new.append(text)
+            else:
+                raise ValueError(f"hunk {len(hunks) + 1}: unexpected line {line!r}")
+        if len(old) != old_count or len(new) != new_count:
+            raise ValueError(f"hunk {len(hunks) + 1}: line counts do not match its header")
+        # "-n,0" inserts after line n; otherwise the hunk starts at line n
+        hunks.append((old_start if old_count == 0 else old_start - 1, old, new))
+    if not hunks:
+        raise ValueError("patch contains no hunks")
+    return hunks
+
+
+def _find_hunk(lines, old, expected, floor, window=HUNK_WINDOW):
+    """The position nearest to `expected` (within `window`, not before `floor`) where `old` matches, or None."""
+    last = len(lines) - len(old)
+    for distance in range(window + 1):
+        for at in (expected - distance, expected + distance) if distance else (expected,):
+            if floor <= at <= last and (not old or lines[at] == old[0]) and lines[at:at + len(old)] == old:
+                return at
+    return None
+
+
+def apply_unified_diff(text, diff):
+    """`text` with every hunk of `diff` applied; a hunk may have moved but its context must match exactly."""
+    lines = text.split("\n")
+    offset = 0
+    floor = 0  # hunks apply in order and must not overlap
+    for number, (start, old, new) in enumerate(_parse_hunks(diff), 1):
+        expected = start + offset
+        at = _find_hunk(lines, old, expected, floor)
+        if at is None:
+            raise PatchConflict(f"hunk {number} (line {start + 1}) does not match the current page content")
+        lines[at:at + len(old)] = new
+        offset = at + len(new) - start - len(old)
+        floor = at + len(new)
+    return "\n".join(lines)
+
+
+def sections(lines):
+    """[(line index, level, title)] of the headings outside fenced code blocks."""
+    headings, fenced = [], False
+    for index, line in enumerate(lines):
+        if _FENCE.match(line):
+            fenced = not fenced
+            continue
+        match = None if fenced else _HEADING.match(line)
+        if match:
+            headings.append((index, len(match.group(1)), match.group(2).strip()))
+    return headings
+
+
+def _normalize(title):
+    return " ".join(title.lstrip("#").split()).casefold()
+
+
+def find_section(lines, section):
+    """(heading index, end index) of the section named by its title (or full heading line)."""
+    headings = sections(lines)
+    section = section.strip()
+    wanted = _normalize(section)
+    level = len(section) - len(section.lstrip("#")) or None
+    matches = [h for h in headings if _normalize(h[2]) == wanted and (level is None or h[1] == level)]
+    if not matches:
+        known = ", ".join(repr(h[2]) for h in headings) or "none"
+        raise ValueError(f"section {section!r} not found (headings: {known})")
+    if len(matches) > 1:
+        raise ValueError(f"section {section!r} is ambiguous ({len(matches)} headings); give it with its # level")
+    index, level, _ = matches[0]
+    end = next((h[0] for h in headings if h[0] > index and h[1] <= level), len(lines))
+    return index, end
+
+
+def apply_section_edits(text, edits):
+    """`text` with each {"section", "op", "content"} edit applied in order."""
+    for number, edit in enumerate(edits, 1):
+        if not isinstance(edit, dict) or not edit.get("section"):
+            raise ValueError(f"edit {number}: section is required")
+        op = edit.get("op", "replace")
+        if op not in SECTION_OPS:
+            raise ValueError(f"edit {number}: op must be replace, append, prepend or delete")
+        if op != "delete" and edit.get("content") is None:
+            raise ValueError(f"edit {number}: content is required for {op}")
+        lines = text.split("\n")
+        heading, end = find_section(lines, str(edit["section"]))
+        if op == "delete":
+            del lines[heading:end]
+            text = "\n".join(lines)
+            continue
+        content = str(edit["content"]).rstrip("\n").split("\n")
+        body = lines[heading + 1:end]
+        first = next((i for i, line in enumerate(body) if line.strip()), len(body))
+        last = next((i for i in range(len(body) - 1, -1, -1) if body[i].strip()), first - 1) + 1
+        lead, core, trail = body[:first], body[first:last], body[last:]
+        if op == "replace":
+            core = content
+        elif op == "append":
+            core = core + content
+        else:
+            core = content + core
+        if not lead and core:
+            lead = [""]
+        if not trail and end < len(lines):
+            trail = [""]  # keep the next heading a separate block
+        lines[heading + 1:end] = lead + core + trail
+        text = "\n".join(lines)
+    return text
+
+
+async def patch_wiki_page(token, wiki_id, page_id, patch=None, edits=None, base_version=None):
+    """
+    Applies a unified diff (`patch`) or section `edits` to the page's current content and
+    writes it back only when it changed. ValueError for a malformed patch, PatchConflict
+    when the page changed underneath, RuntimeError for upstream failures.
+    """
+    if (patch is None) == (edits is None):
+        raise ValueError("either patch or edits is required")
+    response = dooray_client.unwrap(await run_in_threadpool(dooray_client.get_wiki_page, token, wiki_id, page_id))
+    page = (response.get("result") or {}) if isinstance(response, dict) else {}
+    body = page.get("body") or {}
+    current = body.get("content", "") if isinstance(body, dict) else str(body)
+    version = page_version(page, current)
+    if base_version is not None and str(base_version) != version:
+        raise PatchConflict(f"page is at version {version}, not {base_version}")
+
+    if patch is not None:
+        updated = apply_unified_diff(current, str(patch))
+    else:
+        if not isinstance(edits, list) or not edits:
+            raise ValueError("edits must be a non-empty list")
+        updated = apply_section_edits(current, edits)
+    outcome = {"page_id": str(page_id), "base_version": version, "changed": updated != current}
+    if updated == current:
+        return outcome
+
+    kwargs = {"wiki_id": wiki_id, "page_id": page_id, "content": updated}
+    result = dooray_client.unwrap(await run_in_threadpool(dooray_client.update_wiki_page_content, token, **kwargs))
+    notify_success("update_wiki_page_content", token, kwargs, result)
+    outcome.update(
+        bytes_before=len(current.encode()), bytes_after=len(updated.encode()),
+        content_sha256=hashlib.sha256(updated.encode()).hexdigest(), dooray_response=result,
+    )
+    return outcome
+
+
+# --- Wiki Page Patch API ---
+@router.post("/mcp/wiki/pages/patch")
+async def api_wiki_pages_patch(request: Request):
+    """
+    Body: {"wiki_id": "...", "page_id": "...", "patch": "<unified diff>"} or
+    {..., "edits": [{"section": "<heading>", "op": "replace|append|prepend|delete", "content": "..."}]},
+    optionally "base_version" (the version the change was made against).
+    """
+    api_key = _get_api_key(request)
+    body = await request.json()
+    if not body.get("wiki_id") or not body.get("page_id"):
+        raise HTTPException(status_code=400, detail="wiki_id and page_id are required")
+    try:
+        outcome = await patch_wiki_page(
+            api_key, body["wiki_id"], body["page_id"], body.get("patch"), body.get("edits"), body.get("base_version"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PatchConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"dooray_response": outcome}